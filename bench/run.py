@@ -0,0 +1,330 @@
+﻿# bench/run.py — end-to-end benchmark of the catalog + PDP phases against bench/server.py
+#
+#   python bench/run.py --tiles 2000 --pdps 300 --latency-ms 80 --jitter-ms 30
+#   python bench/run.py --phases pdp --pdp-mode http --error-rate 0.02
+#   python bench/run.py --compare bench/results/20251020_101500_ab12cd3.json
+#
+# Starts the stand-in in its own process, points the scraper at it (ADI_BASE_URL)
+# from a scratch working directory, runs the same calls main.py makes and writes
+# catalog seconds, PDP items/sec, p50/p95 page latency and peak RSS to
+# bench/results/<ts>_<commit>.json.
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+SRC = ROOT / "src"
+RESULTS_DIR = ROOT / "bench" / "results"
+
+def _log(msg: str):
+    print("[BENCH]", msg, flush=True)
+
+def _pct(vals: List[float], q: float) -> Optional[float]:
+    if not vals:
+        return None
+    vals = sorted(vals)
+    return round(vals[min(len(vals) - 1, int(q * len(vals)))], 1)
+
+def _git() -> Dict:
+    def run(*a):
+        try:
+            return subprocess.run(["git", *a], cwd=ROOT, capture_output=True, text=True, timeout=10).stdout.strip()
+        except Exception:
+            return ""
+    return {"commit": run("rev-parse", "--short", "HEAD") or "unknown",
+            "dirty": bool(run("status", "--porcelain", "--", "src"))}
+
+# ---------- Peak RSS ----------
+class _RssSampler:
+    """Peak resident memory of this process and of it plus its descendants (browser, node driver).
+    Linux reads /proc; elsewhere only this process's own peak (ru_maxrss) is reported."""
+
+    def __init__(self, exclude: int, every_s: float = 0.25):
+        self.exclude = exclude  # the stand-in server is not part of the scraper
+        self.every_s = every_s
+        self.peak_tree = 0
+        self._stop = threading.Event()
+        self._t = threading.Thread(target=self._run, name="rss", daemon=True)
+
+    @staticmethod
+    def _tree_kb(root: int, exclude: int) -> int:
+        parent, rss = {}, {}
+        for d in os.listdir("/proc"):
+            if not d.isdigit():
+                continue
+            try:
+                with open(f"/proc/{d}/status", encoding="utf-8") as f:
+                    for line in f:
+                        if line.startswith("PPid:"):
+                            parent[int(d)] = int(line.split()[1])
+                        elif line.startswith("VmRSS:"):
+                            rss[int(d)] = int(line.split()[1])
+            except OSError:
+                continue
+        total = 0
+        for pid, kb in rss.items():
+            p = pid
+            while p and p != root and p != exclude:
+                p = parent.get(p, 0)
+            if p == root:
+                total += kb
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.peak_tree = max(self.peak_tree, self._tree_kb(os.getpid(), self.exclude))
+            except OSError:
+                return
+            self._stop.wait(self.every_s)
+
+    def start(self):
+        if os.path.isdir("/proc"):
+            self._t.start()
+
+    def stop(self) -> Dict:
+        self._stop.set()
+        if self._t.is_alive():
+            self._t.join()
+        out = {"self_mb": None, "tree_mb": round(self.peak_tree / 1024, 1) if self.peak_tree else None}
+        try:
+            import resource
+            kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            out["self_mb"] = round((kb / 1024 if sys.platform == "darwin" else kb) / 1024, 1)
+        except ImportError:
+            pass
+        return out
+
+# ---------- Stand-in ----------
+def _start_server(args) -> Tuple[subprocess.Popen, str]:
+    cmd = [sys.executable, str(ROOT / "bench" / "server.py"), "--port", "0",
+           "--tiles", str(args.tiles), "--latency-ms", str(args.latency_ms),
+           "--jitter-ms", str(args.jitter_ms), "--error-rate", str(args.error_rate), "--seed", str(args.seed)]
+    if args.archive:
+        cmd += ["--archive", str(Path(args.archive).resolve())]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True, encoding="utf-8")
+    end = time.time() + 60
+    while time.time() < end:
+        line = proc.stdout.readline()
+        if not line:
+            break
+        if line.startswith("READY "):
+            # keep draining so the server never blocks on a full pipe
+            threading.Thread(target=lambda: [print(l, end="") for l in proc.stdout], daemon=True).start()
+            return proc, line.split()[1]
+    proc.kill()
+    raise RuntimeError("bench server did not start")
+
+def _state_file(base: str) -> None:
+    """storage_state.json with the stand-in's auth cookie (the scraper's saved-login path)."""
+    from urllib.parse import urlparse
+    host = urlparse(base).hostname
+    state = {"cookies": [{"name": ".AspNet.ApplicationCookie", "value": "bench", "domain": host, "path": "/",
+                          "expires": -1, "httpOnly": True, "secure": False, "sameSite": "Lax"}],
+             "origins": []}
+    Path("storage_state.json").write_text(json.dumps(state), encoding="utf-8")
+
+def _catalog_from_api(base: str, brand: str) -> List[Dict]:
+    """Catalog rows without a browser (--phases pdp): the stand-in's product-search API."""
+    import httpx
+    from urllib.parse import urlparse
+    from catalog import _rows_from_api
+    from config import BRANDS
+
+    slug = urlparse(BRANDS[brand]["list_url"]).path.rstrip("/").rsplit("/", 1)[-1]
+    rows, page, pages, misses = [], 1, 1, 0
+    with httpx.Client(base_url=base, timeout=30) as client:
+        while page <= pages:
+            resp = client.get("/api/v1/products", params={"brand": slug, "page": page, "pageSize": 500})
+            if resp.status_code == 503 and misses < 20:
+                misses += 1
+                continue  # injected error; ask again
+            resp.raise_for_status()
+            data = resp.json()
+            pages = data["pagination"]["numberOfPages"]
+            rows += _rows_from_api(data, base, BRANDS[brand].get("label", brand))
+            page += 1
+    return rows
+
+# ---------- Phases ----------
+async def _bench(args, base: str) -> Dict:
+    import httpx
+    import detail
+    import metrics
+    import netpolicy
+    import ready
+    from auth import LazySession
+    from catalog import fetch_product_list
+    from pacing import outcome
+
+    lat_ms: List[float] = []
+
+    # per-visit latency: browser visits through _scrape_pdp, HTTP fetches through the client's get
+    scrape = detail._scrape_pdp
+    async def timed_scrape(page, prod, archive=None):
+        t0 = time.perf_counter()
+        try:
+            return await scrape(page, prod, archive)
+        finally:
+            lat_ms.append((time.perf_counter() - t0) * 1000)
+    detail._scrape_pdp = timed_scrape
+    get = httpx.AsyncClient.get
+    async def timed_get(self, *a, **kw):
+        t0 = time.perf_counter()
+        try:
+            return await get(self, *a, **kw)
+        finally:
+            lat_ms.append((time.perf_counter() - t0) * 1000)
+    httpx.AsyncClient.get = timed_get
+
+    res: Dict = {}
+    session = LazySession(headless=not args.headed, net_policy=not args.no_net_policy, warm=False)
+    try:
+        if "catalog" in args.phases:
+            t0 = time.perf_counter()
+            products = await fetch_product_list(await session.context(), brand=args.brand,
+                                                mode=args.catalog_mode, concurrency=args.catalog_concurrency)
+            secs = time.perf_counter() - t0
+            res["catalog"] = {"seconds": round(secs, 2), "tiles": len(products), "expected": args.tiles,
+                              "complete": len(products) == args.tiles, "mode": args.catalog_mode}
+            _log(f"Catalog: {len(products)}/{args.tiles} tiles in {secs:.1f}s ({args.catalog_mode})")
+        else:
+            products = _catalog_from_api(base, args.brand)
+
+        if "pdp" in args.phases:
+            todo = products[: args.pdps] if args.pdps else products
+            lat_ms.clear()
+            t0 = time.perf_counter()
+            rows = await detail.fetch_mspp_for_products(
+                session, todo, concurrency=args.concurrency, mode=args.pdp_mode,
+                http_concurrency=args.http_concurrency, max_concurrency=args.max_concurrency,
+                retries=args.retries, http_max_concurrency=args.http_max_concurrency,
+            )
+            secs = time.perf_counter() - t0
+            ok = sum(1 for r in rows if r and outcome(r) == "ok")
+            priced = sum(1 for r in rows if r and str(r.get("msrp") or "").strip())
+            res["pdp"] = {
+                "items": len(todo), "seconds": round(secs, 2),
+                "items_per_s": round(len(todo) / secs, 2) if secs else None,
+                "ok": ok, "priced": priced, "failed": len(todo) - ok, "mode": args.pdp_mode,
+                "visits": len(lat_ms),
+                "latency_ms": {"p50": _pct(lat_ms, .5), "p95": _pct(lat_ms, .95),
+                               "max": round(max(lat_ms), 1) if lat_ms else None,
+                               "mean": round(sum(lat_ms) / len(lat_ms), 1) if lat_ms else None},
+            }
+            # navigation / ready / extract / parse split, from the scraper's own metrics
+            res["pdp"]["steps_ms"] = {
+                f"{h['mode']}:{h['step']}": {"p50": round(h["p50"] * 1000, 1), "p95": round(h["p95"] * 1000, 1)}
+                for h in metrics.summary()["histograms"] if h["name"] == "pdp_step_seconds"
+            }
+            _log(f"PDP: {len(todo)} items in {secs:.1f}s = {res['pdp']['items_per_s']}/s, "
+                 f"p50 {res['pdp']['latency_ms']['p50']} ms, p95 {res['pdp']['latency_ms']['p95']} ms, "
+                 f"{priced} priced, {len(todo) - ok} failed")
+        try:
+            res["server"] = httpx.get(f"{base}/bench/stats", timeout=5).json()
+        except Exception:
+            pass
+    finally:
+        ready.report()
+        netpolicy.report(write_json=False)
+        await session.close()
+        detail._scrape_pdp = scrape
+        httpx.AsyncClient.get = get
+    return res
+
+# ---------- Compare ----------
+_KEYS = [
+    ("catalog.seconds", "lower"), ("pdp.items_per_s", "higher"), ("pdp.latency_ms.p50", "lower"),
+    ("pdp.latency_ms.p95", "lower"), ("peak_rss.tree_mb", "lower"), ("peak_rss.self_mb", "lower"),
+]
+
+def _get(d: Dict, path: str):
+    for k in path.split("."):
+        d = d.get(k) if isinstance(d, dict) else None
+    return d
+
+def compare(old: Dict, new: Dict) -> None:
+    _log(f"vs {old['meta']['commit']} ({old['meta']['ts']}):")
+    for key, better in _KEYS:
+        a, b = _get(old, key), _get(new, key)
+        if a is None or b is None:
+            continue
+        delta = (b - a) / a * 100 if a else 0.0
+        good = (delta < 0) == (better == "lower") if delta else True
+        print(f"  {key:<22} {a:>10} → {b:<10} {delta:+6.1f}% {'' if good else '(worse)'}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the scraper against a local ADI stand-in")
+    ap.add_argument("--tiles", type=int, default=1500, help="Catalog size per brand")
+    ap.add_argument("--pdps", type=int, default=200, help="PDPs to visit (0 = the whole catalog)")
+    ap.add_argument("--brand", default="Hanwha")
+    ap.add_argument("--phases", type=lambda s: [x.strip() for x in s.split(",") if x.strip()],
+                    default=["catalog", "pdp"], help="catalog,pdp (pdp alone reads the catalog from the stand-in API)")
+    ap.add_argument("--latency-ms", type=float, default=50.0)
+    ap.add_argument("--jitter-ms", type=float, default=20.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--archive", help="Serve recorded PDPs from this HtmlArchive dir where present")
+    ap.add_argument("--catalog-mode", choices=["click", "pages", "api"], default="pages")
+    ap.add_argument("--catalog-concurrency", type=int, default=3)
+    ap.add_argument("--pdp-mode", choices=["browser", "http"], default="browser")
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--max-concurrency", type=int, default=0)
+    ap.add_argument("--http-concurrency", type=int, default=16)
+    ap.add_argument("--http-max-concurrency", type=int, default=0)
+    ap.add_argument("--retries", type=int, default=2)
+    ap.add_argument("--no-net-policy", action="store_true")
+    ap.add_argument("--headed", action="store_true")
+    ap.add_argument("--label", default="", help="Free-form tag stored with the results")
+    ap.add_argument("--out", help="Results file (default bench/results/<ts>_<commit>.json)")
+    ap.add_argument("--compare", help="Earlier results file to print deltas against")
+    args = ap.parse_args()
+
+    meta = {"ts": datetime.now().isoformat(timespec="seconds"), **_git(), "label": args.label,
+            "python": platform.python_version(), "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "compare")}}
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{datetime.now():%Y%m%d_%H%M%S}_{meta['commit']}.json"
+    out = out.resolve()
+
+    server, base = _start_server(args)
+    _log(f"Stand-in at {base}: {args.tiles} tiles, {args.latency_ms:.0f}±{args.jitter_ms:.0f} ms, "
+         f"{args.error_rate:.1%} errors")
+    os.environ["ADI_BASE_URL"] = base
+    work = Path(tempfile.mkdtemp(prefix="adi_bench_"))
+    os.chdir(work)  # storage_state.json, data/ caches and logs stay out of the repo
+    sys.path.insert(0, str(SRC))
+    _state_file(base)
+
+    rss = _RssSampler(exclude=server.pid)
+    rss.start()
+    t0 = time.perf_counter()
+    try:
+        res = asyncio.run(_bench(args, base))
+    finally:
+        peak = rss.stop()
+        server.terminate()
+        server.wait(timeout=10)
+    results = {"meta": meta, **res, "total_seconds": round(time.perf_counter() - t0, 2), "peak_rss": peak}
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    _log(f"Peak RSS: {peak['tree_mb']} MB with browser, {peak['self_mb']} MB Python")
+    _log(f"Wrote: {out}")
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text(encoding="utf-8")), results)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
+# ---------- EOF ----------
@@ -0,0 +1,256 @@
+﻿# bench/server.py — local ADI stand-in: listing pages, product-search API and PDPs with the
+# data-test-selector structure the scrapers read; latency, jitter and errors are configurable
+#
+#   python bench/server.py --port 8765 --tiles 2000 --latency-ms 80 --jitter-ms 40 --error-rate 0.02
+#   python bench/server.py --archive data/archive      # serve recorded PDPs where the archive has them
+
+import argparse
+import gzip
+import html
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+# slug in the list URL (config.BRANDS list_url) → label printed on tiles, model prefixes
+# (axis/avigilon match the commented-out examples in config.py, for multi-brand benches)
+BRANDS = {
+    "hanwha-vision": ("Hanwha Vision", ["XNO", "XND", "QNV", "PNM", "ANV"]),
+    "axis-communications": ("Axis Communications", ["AXP", "AXQ", "AXM"]),
+    "avigilon": ("Avigilon", ["AVH", "AVD", "AVB"]),
+}
+FORMS = ["Bullet", "Dome", "Turret", "PTZ", "Box Camera"]
+AUTH_COOKIE = ".AspNet.ApplicationCookie"
+
+def _log(msg: str):
+    print("[BENCH]", msg, flush=True)
+
+def _catalog(slug: str, n: int, seed: int) -> List[Dict]:
+    """n deterministic products for a brand slug."""
+    label, prefixes = BRANDS[slug]
+    rnd = random.Random(f"{seed}:{slug}")
+    out = []
+    for i in range(n):
+        pre = prefixes[i % len(prefixes)]
+        model = f"{pre}-{rnd.choice('6789')}{i:04d}R"
+        mp = rnd.choice([2, 4, 5, 6, 8, 12])
+        form = rnd.choice(FORMS)
+        title = f"{mp}MP {'IR ' if rnd.random() < .7 else ''}{form} Camera, {pre[0]}-Series, Vandal"
+        out.append({
+            "brand": label, "model": model, "sku": "SQ-" + model.replace("-", ""),
+            "title": title, "url": f"/Product/{slug}/{model.lower()}",
+            "msrp": f"{rnd.randint(150, 4200):,}.{rnd.choice(['00', '50', '99'])}",
+            "lens": rnd.choice(["2.8mm Fixed", "2.8-12mm Motorized Varifocal", "4mm Fixed"]),
+            "ik": rnd.choice(["IK10", "IK08", ""]),
+        })
+    return out
+
+# ---------- Markup ----------
+def _tile(p: Dict) -> str:
+    e = html.escape
+    return (
+        '<div class="sc-bczRLJ">'
+        f'<a data-test-selector="productImage" href="{e(p["url"])}"><img data-test-selector="productListProductImage" alt=""></a>'
+        f'<div data-test-selector="brandLink"><span>{e(p["brand"])}</span></div>'
+        f'<a data-test-selector="productDescriptionLink" href="{e(p["url"])}">{e(p["title"])}</a>'
+        f'<div data-test-selector="plpPartNumberGrid"><span>{e(p["model"])}</span><span>|</span><span>{e(p["sku"])}</span></div>'
+        '</div>'
+    )
+
+_PAGE = """<!doctype html><html><head><title>{title}</title></head><body>
+<header>{user}</header><main>{body}</main></body></html>"""
+
+def _user(authed: bool) -> str:
+    return ('<div data-test-selector="userMenu">Hi, Bench <a href="/MyAccount/signout">Sign Out</a></div>'
+            if authed else '<a href="/MyAccount/signin">Sign In</a>')
+
+def _listing(slug: str, items: List[Dict], page: int, per_page: int, authed: bool) -> str:
+    total = len(items)
+    start = (page - 1) * per_page
+    chunk = items[start:start + per_page]
+    more = start + per_page < total
+    script = f"""
+<script>
+  // the grid's product-search call (--catalog-mode api captures it)
+  fetch("/api/v1/products?brand={slug}&page={page}&pageSize={per_page}", {{headers: {{Accept: "application/json"}}}});
+  let next = {start + per_page};
+  const btn = document.getElementById("more");
+  if (btn) btn.addEventListener("click", async () => {{
+    btn.disabled = true;
+    const r = await fetch("/bench/tiles?brand={slug}&offset=" + next + "&count={per_page}");
+    document.getElementById("grid").insertAdjacentHTML("beforeend", await r.text());
+    next += {per_page};
+    if (next >= {total}) btn.remove(); else btn.disabled = false;
+  }});
+</script>"""
+    body = (f'<div class="results-count">Showing {start + 1 if chunk else 0}-{start + len(chunk)} of {total}</div>'
+            f'<div id="grid">{"".join(_tile(p) for p in chunk)}</div>'
+            + ('<button id="more">Show More Products</button>' if more else "") + script)
+    return _PAGE.format(title=f"{BRANDS[slug][0]} | IP Cameras", user=_user(authed), body=body)
+
+def _pdp(p: Dict, authed: bool) -> str:
+    e = html.escape
+    feats = [f"{p['lens']} lens", "H.265 / WiseStream", "120dB WDR"] + ([f"{p['ik']} vandal resistant"] if p["ik"] else [])
+    price = f"<span>MSRP</span> <span>${p['msrp']}</span>" if authed else '<a href="/MyAccount/signin">Sign in for pricing</a>'
+    body = (
+        '<div data-test-selector="productDetails_leftColumn">'
+        f'<h1>{e(p["title"])}</h1><div><span>{e(p["model"])}</span> | <span>{e(p["sku"])}</span></div>'
+        '<h3>Key Features</h3><ul class="mainfeatureslist">' + "".join(f"<li>{e(f)}</li>" for f in feats) + "</ul>"
+        '</div>'
+        f'<div data-test-selector="productDetails_rightColumn"><div class="price">{price}</div></div>'
+    )
+    return _PAGE.format(title=e(p["title"]), user=_user(authed), body=body)
+
+def _api(items: List[Dict], page: int, size: int) -> Dict:
+    chunk = items[(page - 1) * size:page * size]
+    return {
+        "products": [{
+            "shortDescription": p["title"], "manufacturerItem": p["model"], "erpNumber": p["sku"],
+            "productDetailUrl": p["url"], "brand": {"name": p["brand"]},
+            "attributeTypes": [{"label": "IK Rating", "attributeValues": [{"valueDisplay": p["ik"]}]}] if p["ik"] else [],
+        } for p in chunk],
+        "pagination": {"numberOfPages": max(1, -(-len(items) // size)), "totalItemCount": len(items)},
+    }
+
+def _recorded(root: Path) -> Dict[str, Path]:
+    """URL path → archived PDP blob (newest capture wins) from an HtmlArchive directory."""
+    out: Dict[str, Path] = {}
+    with open(root / "index.jsonl", "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                e = json.loads(line)
+            except ValueError:
+                continue
+            out[urlparse(e["url"]).path.lower()] = root / "blobs" / e["sha"][:2] / f"{e['sha']}.html.gz"
+    return out
+
+# ---------- Server ----------
+class StandIn(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, addr, tiles: int, latency_ms: float, jitter_ms: float, error_rate: float,
+                 seed: int = 7, archive: Optional[Path] = None):
+        super().__init__(addr, _Handler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rnd = random.Random(seed)
+        self.catalogs = {slug: _catalog(slug, tiles, seed) for slug in BRANDS}
+        self.by_path = {p["url"].lower(): p for items in self.catalogs.values() for p in items}
+        self.recorded = _recorded(Path(archive)) if archive else {}
+        self.stats = {"requests": 0, "errors": 0, "pdp": 0, "listing": 0, "api": 0, "recorded": 0}
+        self._lock = threading.Lock()
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def delay(self) -> bool:
+        """Sleep the configured latency ± jitter; True when this request should fail with a 503."""
+        with self._lock:
+            d = max(0.0, self.latency_ms + self.rnd.uniform(-self.jitter_ms, self.jitter_ms))
+            fail = self.rnd.random() < self.error_rate
+        time.sleep(d / 1000)
+        return fail
+
+class _Handler(BaseHTTPRequestHandler):
+    server: StandIn
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, status: int, body, ctype: str = "text/html; charset=utf-8"):
+        data = body if isinstance(body, bytes) else body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        srv = self.server
+        srv.count("requests")
+        u = urlparse(self.path)
+        q = {k: v[0] for k, v in parse_qs(u.query).items()}
+        path = u.path.rstrip("/") or "/"
+        authed = AUTH_COOKIE in (self.headers.get("Cookie") or "")
+
+        if path == "/":
+            return self._send(200, _PAGE.format(title="ADI Global", user=_user(authed), body="<h2>Home</h2>"))
+        if path == "/api/v1/sessions/current":
+            return self._send(200, json.dumps({"isAuthenticated": authed}), "application/json")
+        if path == "/bench/stats":
+            return self._send(200, json.dumps(srv.stats), "application/json")
+        if path == "/favicon.ico":
+            return self._send(404, "")
+
+        # everything below is "the site under load"
+        if srv.delay():
+            srv.count("errors")
+            return self._send(503, "<h1>Service Unavailable</h1>")
+
+        if path.startswith("/Catalog/shop-brands/"):
+            slug = path.rsplit("/", 1)[-1]
+            if slug not in srv.catalogs:
+                return self._send(404, "<h1>Not Found</h1>")
+            srv.count("listing")
+            return self._send(200, _listing(slug, srv.catalogs[slug], int(q.get("page", 1)),
+                                            int(q.get("perPage", 140)), authed))
+        if path == "/bench/tiles":
+            items = srv.catalogs.get(q.get("brand", ""), [])
+            off, n = int(q.get("offset", 0)), int(q.get("count", 140))
+            srv.count("listing")
+            return self._send(200, "".join(_tile(p) for p in items[off:off + n]))
+        if path == "/api/v1/products":
+            items = srv.catalogs.get(q.get("brand", ""), [])
+            srv.count("api")
+            return self._send(200, json.dumps(_api(items, int(q.get("page", 1)), int(q.get("pageSize", 100)))), "application/json")
+        if path.startswith("/Product/"):
+            srv.count("pdp")
+            blob = srv.recorded.get(path.lower())
+            if blob is not None and blob.exists():
+                srv.count("recorded")
+                return self._send(200, gzip.decompress(blob.read_bytes()))
+            p = srv.by_path.get(path.lower())
+            if p is None:
+                return self._send(404, "<h1>Not Found</h1>")
+            return self._send(200, _pdp(p, authed))
+        return self._send(404, "<h1>Not Found</h1>")
+
+def main():
+    ap = argparse.ArgumentParser(description="Local ADI stand-in for benchmarks")
+    ap.add_argument("--port", type=int, default=8765, help="0 picks a free port")
+    ap.add_argument("--tiles", type=int, default=1500, help="Products per brand")
+    ap.add_argument("--latency-ms", type=float, default=50.0)
+    ap.add_argument("--jitter-ms", type=float, default=20.0)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="Fraction of site requests answered 503")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--archive", help="HtmlArchive dir; recorded PDPs are served where present")
+    args = ap.parse_args()
+
+    srv = StandIn(("127.0.0.1", args.port), tiles=args.tiles, latency_ms=args.latency_ms,
+                  jitter_ms=args.jitter_ms, error_rate=args.error_rate, seed=args.seed,
+                  archive=args.archive)
+    # the runner reads this line to learn the port
+    print(f"READY http://127.0.0.1:{srv.server_address[1]}", flush=True)
+    _log(f"{args.tiles} products per brand, {args.latency_ms:.0f}±{args.jitter_ms:.0f} ms, "
+         f"{args.error_rate:.1%} errors" + (f", {len(srv.recorded)} recorded PDPs" if srv.recorded else ""))
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
+# ---------- EOF ----------
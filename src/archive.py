@@ -0,0 +1,123 @@
+﻿# src/archive.py — content-addressed, gzip'd PDP HTML archive + offline re-parse
+
+import gzip
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ARCHIVE_DIR = Path("data/archive")
+
+# Left + right product columns, plus short body windows around the MSRP labels
+# (what _msrp_text_from_page falls back to), wrapped so parse_pdp_html reads it.
+JS_SNAPSHOT = r"""
+(labels) => {
+  const pick = (s) => { const el = document.querySelector(s); return el ? el.outerHTML : ""; };
+  const left = pick("div[data-test-selector='productDetails_leftColumn']");
+  const right = pick("div[data-test-selector='productDetails_rightColumn']");
+  const body = document.body ? document.body.innerText : "";
+  const lo = body.toLowerCase();
+  const hits = [];
+  for (const l of labels) {
+    for (let k = lo.indexOf(l.toLowerCase()); k >= 0 && hits.length < 40;
+         k = lo.indexOf(l.toLowerCase(), k + 1)) {
+      hits.push(body.slice(k, k + l.length + 60));
+    }
+  }
+  const esc = (t) => t.replace(/&/g, "&amp;").replace(/</g, "&lt;").replace(/>/g, "&gt;");
+  const tail = hits.map(h => "<p>" + esc(h) + "</p>").join("");
+  return "<html><body><main>" + left + right + "</main><div data-archive='body'>" + tail + "</div></body></html>";
+}
+"""
+
+def _log(msg: str):
+    print("[ARCHIVE]", msg)
+
+class HtmlArchive:
+    """
+    <root>/blobs/<sha[:2]>/<sha>.html.gz – page HTML, stored once per distinct content
+    <root>/index.jsonl                  – {"url", "sha", "brand", "ts", "row"} per capture
+
+    `row` is the catalog row the PDP was visited for, so a re-parse rebuilds
+    exactly the record the live run would have produced.
+    """
+
+    def __init__(self, root: Path = ARCHIVE_DIR):
+        self.root = Path(root)
+        (self.root / "blobs").mkdir(parents=True, exist_ok=True)
+        self._index = open(self.root / "index.jsonl", "a", encoding="utf-8")
+        self.count = 0
+
+    def _blob(self, sha: str) -> Path:
+        return self.root / "blobs" / sha[:2] / f"{sha}.html.gz"
+
+    def put_blob(self, html: str) -> str:
+        """Compress + store html under its sha256; safe to call from a worker thread."""
+        data = html.encode("utf-8")
+        sha = hashlib.sha256(data).hexdigest()
+        path = self._blob(sha)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+            with open(tmp, "wb") as f:
+                f.write(gzip.compress(data, compresslevel=6))
+            os.replace(tmp, path)
+        return sha
+
+    def index(self, url: str, sha: str, row: Dict) -> None:
+        entry = {"url": url, "sha": sha, "brand": row.get("brand"), "ts": time.time(), "row": row}
+        self._index.write(json.dumps(entry, default=str) + "\n")
+        self._index.flush()
+        self.count += 1
+
+    def close(self) -> None:
+        self._index.close()
+        if self.count:
+            _log(f"Archived {self.count} page(s) under {self.root}")
+
+def _latest_entries(root: Path) -> List[Dict]:
+    """Newest capture per URL, in first-seen order."""
+    latest: Dict[str, Dict] = {}
+    with open(root / "index.jsonl", "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                e = json.loads(line)
+            except ValueError:
+                continue
+            if e["url"] in latest and latest[e["url"]]["ts"] > e["ts"]:
+                continue
+            latest[e["url"]] = e
+    return list(latest.values())
+
+def _reparse_one(args) -> Dict:
+    root, entry = args
+    from http_pdp import parse_pdp_html
+    from detail import _build_record
+
+    row = entry["row"]
+    blob = Path(root) / "blobs" / entry["sha"][:2] / f"{entry['sha']}.html.gz"
+    try:
+        html = gzip.decompress(blob.read_bytes()).decode("utf-8")
+    except OSError as e:
+        return {**row, "msrp_raw": f"ERROR: {e}", "msrp": None}
+    parsed = parse_pdp_html(html, brand=row.get("brand", "Hanwha"))
+    return _build_record(row, parsed["title"], parsed["features"], parsed["model"],
+                         parsed["alt_model"], parsed["msrp"])
+
+def reparse(root: Path, workers: Optional[int] = None) -> List[Dict]:
+    """Run the PDP parsers over every archived page, in parallel across cores."""
+    root = Path(root)
+    if not (root / "index.jsonl").exists():
+        raise FileNotFoundError(f"--reparse: no archive index at {root / 'index.jsonl'}")
+    entries = _latest_entries(root)
+    _log(f"Re-parsing {len(entries)} page(s) from {root}")
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunk = max(1, len(entries) // ((workers or os.cpu_count() or 1) * 4))
+        rows = list(pool.map(_reparse_one, [(str(root), e) for e in entries], chunksize=chunk))
+    _log(f"Re-parsed {len(rows)} page(s) in {time.perf_counter() - t0:.1f}s")
+    return rows
+# ---------- EOF ----------
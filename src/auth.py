@@ -1,10 +1,24 @@
 ﻿from pathlib import Path
+import asyncio
+import json
+import os
 import time
-from playwright.sync_api import sync_playwright
+import weakref
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+from playwright.async_api import async_playwright
+from config import SESSION, SITE
+import har
+import metrics
+import netpolicy
 
-HOME = "https://www.adiglobaldistribution.us/"
-SIGNIN = "https://www.adiglobaldistribution.us/MyAccount/signin"
+HOME = f"{SITE}/"
+SIGNIN = f"{SITE}/MyAccount/signin"
 STATE_FILE = "storage_state.json"
+CHECK_FILE = Path("data/cache/session_check.json")   # last successful validate_state()
+
+# contexts borrowed from browser_server.py: disconnect from them, never close them
+_WARM = weakref.WeakSet()
 
 COOKIE_KILL = [
     "#onetrust-accept-btn-handler",
@@ -15,85 +29,529 @@ COOKIE_KILL = [
     "[aria-label='Close']",
 ]
 
-def _kill_banners(page):
+async def _kill_banners(page):
     for sel in COOKIE_KILL:
         try:
             btn = page.locator(sel).first
-            if btn.count() and btn.is_visible():
-                btn.click()
-                page.wait_for_timeout(150)
+            if await btn.count() and await btn.is_visible():
+                await btn.click()
+                await page.wait_for_timeout(150)
         except Exception:
             pass
 
-def _is_logged_in(page) -> bool:
+async def _is_logged_in(page) -> bool:
     try:
-        if page.locator("[data-test-selector='userMenu']").count():
+        if await page.locator("[data-test-selector='userMenu']").count():
             return True
-        if page.locator("text=/Sign Out/i").count():
+        if await page.locator("text=/Sign Out/i").count():
             return True
-        if page.locator("text=/Hi,\\s*[A-Za-z]+/i").count():
+        if await page.locator("text=/Hi,\\s*[A-Za-z]+/i").count():
             return True
     except Exception:
         pass
     return False
 
-def _poll_until_logged_in(page, seconds: int) -> bool:
+async def _poll_until_logged_in(page, seconds: int) -> bool:
     end = time.time() + seconds
     while time.time() < end:
-        _kill_banners(page)
-        if _is_logged_in(page):
+        await _kill_banners(page)
+        if await _is_logged_in(page):
             return True
-        page.wait_for_timeout(300)
+        await page.wait_for_timeout(300)
     return False
 
-def ensure_login(headless=False):
+# ---------- storage_state.json ----------
+def _state_stamp() -> float:
+    try:
+        return Path(STATE_FILE).stat().st_mtime
+    except OSError:
+        return 0.0
+
+def _lock_state_file():
+    """Blocking exclusive lock on storage_state.json.lock (shared by --workers processes)."""
+    fh = open(STATE_FILE + ".lock", "a+b")
+    try:
+        if os.name == "nt":
+            import msvcrt
+            fh.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)  # retries ~10s itself, then raises
+                    break
+                except OSError:
+                    continue
+        else:
+            import fcntl
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+    except BaseException:
+        fh.close()
+        raise
+    return fh
+
+def _unlock_state_file(fh) -> None:
+    try:
+        if os.name == "nt":
+            import msvcrt
+            fh.seek(0)
+            msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+    finally:
+        fh.close()
+
+@asynccontextmanager
+async def _state_lock():
+    fh = await asyncio.to_thread(_lock_state_file)  # waiting must not stall this process's loop
+    try:
+        yield
+    finally:
+        _unlock_state_file(fh)
+
+async def _write_state(ctx) -> None:
+    """Save ctx's cookies/storage as storage_state.json: temp file + os.replace, never half-written."""
+    state = await ctx.storage_state()
+    tmp = f"{STATE_FILE}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, STATE_FILE)
+
+# ---------- Cheap validation ----------
+
+def validate_state(cfg: Dict = SESSION) -> bool:
+    """
+    Is storage_state.json still logged in, without a browser? Checks the auth
+    cookies' expiry, then trusts a passing check from the last remember_s
+    seconds (same file), else makes one authenticated GET of probe_url.
+    True only for a remembered check or the probe confirming probe_key. An
+    error, another status, non-JSON or a missing probe_key is "unknown": not
+    verified, so False, like a definite logged-out answer. False sends the run
+    down the browser path, which checks the HOME page header itself (and
+    remembers a pass, see remember_check).
+    """
+    from http_pdp import _load_cookies
+
+    try:
+        cookies = _load_cookies(STATE_FILE)  # unexpired only
+    except (FileNotFoundError, ValueError):
+        return False
+    names = {c["name"] for c in cookies}
+    missing = [n for n in cfg["auth_cookies"] if n not in names]
+    if missing:
+        print(f"[AUTH] Saved session lacks {', '.join(missing)} (expired or never set; cookie check)")
+        return False
+
+    try:
+        last = json.loads(CHECK_FILE.read_text(encoding="utf-8"))
+        if last.get("state_mtime") == _state_stamp() and time.time() - last.get("ts", 0) < cfg["remember_s"]:
+            print(f"[AUTH] Session validated {(time.time() - last['ts']) / 60:.0f} min ago; "
+                  f"skipping check (remembered check)")
+            return True
+    except (OSError, ValueError):
+        pass
+
+    ok, why = _probe(cookies, cfg)
+    if ok is None:
+        print(f"[AUTH] Session probe inconclusive ({why}); auth cookies unexpired but "
+              f"not verified, the browser will check (unknown)")
+        return False
+    if ok:
+        remember_check()
+        print("[AUTH] Saved session valid (API check)")
+    else:
+        print("[AUTH] Saved session no longer logged in (API check)")
+    return ok
+
+def remember_check() -> None:
+    """Record a passing check of the current storage_state.json for validate_state()."""
+    CHECK_FILE.parent.mkdir(parents=True, exist_ok=True)
+    CHECK_FILE.write_text(json.dumps({"state_mtime": _state_stamp(), "ts": time.time()}), encoding="utf-8")
+
+def _probe(cookies: List[Dict], cfg: Dict) -> Tuple[Optional[bool], str]:
+    """One GET of probe_url: (True/False, "") when it answers, (None, why) when it can't tell."""
+    from http_pdp import USER_AGENT, _cookie_header
+    import httpx
+
+    try:
+        u = httpx.URL(cfg["probe_url"])
+        cookie = _cookie_header(cookies, u.host, u.path or "/", u.scheme == "https")
+        resp = httpx.get(u, headers={"Cookie": cookie, "User-Agent": USER_AGENT,
+                                     "Accept": "application/json"}, timeout=10.0)
+    except Exception as e:
+        return None, str(e) or type(e).__name__
+    if resp.status_code in (401, 403):
+        return False, ""
+    if resp.status_code != 200:
+        return None, f"HTTP {resp.status_code}"
+    try:
+        body = resp.json()
+    except ValueError:
+        return None, "response is not JSON"
+    if not isinstance(body, dict) or cfg["probe_key"] not in body:
+        return None, f"no {cfg['probe_key']!r} in the response"
+    return bool(body[cfg["probe_key"]]), ""
+
+async def _connect_warm(p, net_policy: bool):
+    """
+    The warm server's logged-in context over CDP, or None (not running / not
+    logged in). The server may have been started long ago, so its own session
+    is always checked on HOME, whatever validate_state() said about the file;
+    a logged-out server is re-seeded from storage_state.json (or ADI_USER /
+    ADI_PASS) before giving up on it.
+    """
+    from browser_server import _seed_context, endpoint
+    url = endpoint()
+    if url is None:
+        return None
+    try:
+        browser = await p.chromium.connect_over_cdp(url)
+        ctx = browser.contexts[0]
+    except Exception as e:
+        print(f"[AUTH] Warm browser unreachable ({e}); launching one")
+        return None
+    if net_policy:
+        await netpolicy.install(ctx)
+    page = await ctx.new_page()
+    netpolicy.tag(page, "auth")
+    try:
+        await page.goto(HOME, wait_until="domcontentloaded")
+        await _kill_banners(page)
+        ok = await _is_logged_in(page)
+    finally:
+        await page.close()
+    if not ok:
+        print("[AUTH] Warm browser is not logged in; re-seeding it from storage_state.json")
+        try:
+            ok = await _seed_context(ctx)
+        except Exception as e:
+            print(f"[AUTH] Re-seeding the warm browser failed ({e})")
+            ok = False
+    if not ok:
+        print("[AUTH] Warm browser is still not logged in; launching one")
+        await browser.close()  # over CDP: disconnect, the server keeps running
+        return None
+    _WARM.add(ctx)
+    print(f"[AUTH] Connected to warm browser at {url}")
+    return ctx
+
+async def release(p, ctx) -> None:
+    """End a run's hold on the browser: disconnect from a warm one, close our own."""
+    try:
+        if ctx in _WARM:
+            await ctx.browser.close()  # over CDP: disconnect, the server keeps running
+        else:
+            await ctx.close()
+    finally:
+        await p.stop()
+
+async def ensure_login(headless=False, net_policy=True, verified=False, warm=True):
     """
     First run: opens a visible window, you log in once, we reuse THAT SAME context
     for the run and persist storage_state.json. Later runs reuse storage_state.json.
+    Async so the PDP engine can drive several pages of this one context at once.
+    net_policy installs the config.NET_POLICY request filter on the returned context.
+    verified=True (validate_state passed) skips loading HOME to check the header
+    of a freshly launched browser; a warm one is always checked.
+    warm=True connects to a running browser_server.py instead of launching.
     """
-    p = sync_playwright().start()
+    p = await async_playwright().start()
+
+    if warm:
+        ctx = await _connect_warm(p, net_policy)
+        if ctx is not None:
+            return p, ctx
 
     # Fast path: try to reuse saved state (headless or headed per flag)
     if Path(STATE_FILE).exists():
-        browser = p.chromium.launch(headless=headless, args=["--disable-blink-features=AutomationControlled"])
-        ctx = browser.new_context(storage_state=STATE_FILE, viewport={"width":1400,"height":900})
-        page = ctx.new_page()
-        page.goto(HOME, wait_until="domcontentloaded")
-        _kill_banners(page)
-        if _is_logged_in(page):
-            page.close()
+        browser = await p.chromium.launch(headless=headless, args=["--disable-blink-features=AutomationControlled"])
+        ctx = await browser.new_context(storage_state=STATE_FILE, viewport={"width":1400,"height":900})
+        if net_policy:
+            await netpolicy.install(ctx)
+        if verified:
             print("[AUTH] Reusing storage_state.json")
             return p, ctx
+        page = await ctx.new_page()
+        netpolicy.tag(page, "auth")
+        await page.goto(HOME, wait_until="domcontentloaded")
+        await _kill_banners(page)
+        if await _is_logged_in(page):
+            await page.close()
+            remember_check()  # the next run within remember_s skips the browser check
+            print("[AUTH] Reusing storage_state.json (HOME check)")
+            return p, ctx
         # stale → drop state and fall through to manual
         try: Path(STATE_FILE).unlink()
         except Exception: pass
-        try: page.close()
+        try: await page.close()
         except Exception: pass
-        browser.close()
+        await browser.close()
 
     # No valid state → force a VISIBLE manual login once
     print("[AUTH] First-time login required. A browser window will open. Log in within 2 minutes.")
-    vis_browser = p.chromium.launch(headless=False, args=["--disable-blink-features=AutomationControlled"])
-    vis_ctx = vis_browser.new_context(viewport={"width":1400,"height":900})
-    vis_page = vis_ctx.new_page()
+    vis_browser = await p.chromium.launch(headless=False, args=["--disable-blink-features=AutomationControlled"])
+    vis_ctx = await vis_browser.new_context(viewport={"width":1400,"height":900})
+    vis_page = await vis_ctx.new_page()
     vis_page.set_default_timeout(60000)
 
-    vis_page.goto(SIGNIN, wait_until="domcontentloaded")
-    _kill_banners(vis_page)
-    vis_page.evaluate("window.scrollBy(0, 240)")
+    await vis_page.goto(SIGNIN, wait_until="domcontentloaded")
+    await _kill_banners(vis_page)
+    await vis_page.evaluate("window.scrollBy(0, 240)")
     print("[AUTH] Please complete login in the visible window...")
 
-    ok = _poll_until_logged_in(vis_page, seconds=120)
+    ok = await _poll_until_logged_in(vis_page, seconds=120)
     if not ok:
-        vis_page.goto(HOME, wait_until="domcontentloaded")
-        _kill_banners(vis_page)
-        ok = _poll_until_logged_in(vis_page, seconds=20)
+        await vis_page.goto(HOME, wait_until="domcontentloaded")
+        await _kill_banners(vis_page)
+        ok = await _poll_until_logged_in(vis_page, seconds=20)
 
     if not ok:
         print("[AUTH][ERROR] Login not detected. Leave window open to inspect. Aborting.")
         raise RuntimeError("Manual login not detected")
 
     # Persist for future and reuse THIS context for the run
-    vis_ctx.storage_state(path=STATE_FILE)
+    async with _state_lock():
+        await _write_state(vis_ctx)
     print("[AUTH] storage_state.json written.")
+    if net_policy:
+        await netpolicy.install(vis_ctx)
     return p, vis_ctx
+
+async def open_replay(path: str, headless: bool = True, net_policy: bool = True):
+    """A fresh context answered from a --record-har file: no login, no network."""
+    p = await async_playwright().start()
+    browser = await p.chromium.launch(headless=headless, args=["--disable-blink-features=AutomationControlled"])
+    state = STATE_FILE if Path(STATE_FILE).exists() else None
+    ctx = await browser.new_context(storage_state=state, viewport={"width":1400,"height":900})
+    await har.replay(ctx, path, net_policy=net_policy)
+    return p, ctx
+
+# ---------- Lazy browser ----------
+class LazySession:
+    """
+    Stands in for the logged-in BrowserContext until a phase really needs one:
+    context() validates the saved session cheaply, then launches the browser
+    (once, shared by concurrent callers). Runs served from files/cache never
+    start Chromium. har=("record"|"replay", path) records the context's traffic
+    or replays a recording instead of going to the site.
+    """
+
+    def __init__(self, headless: bool = False, net_policy: bool = True, warm: bool = True,
+                 har: Optional[Tuple[str, str]] = None):
+        self.headless = headless
+        self.net_policy = net_policy
+        self.warm = warm
+        self.har = har
+        self.p = None
+        self.ctx = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def started(self) -> bool:
+        return self.ctx is not None
+
+    async def context(self):
+        async with self._lock:
+            if self.ctx is None and self.har and self.har[0] == "replay":
+                with metrics.phase("browser_start"):
+                    self.p, self.ctx = await open_replay(self.har[1], headless=self.headless,
+                                                         net_policy=self.net_policy)
+            elif self.ctx is None:
+                with metrics.phase("session_check"):
+                    verified = await asyncio.to_thread(validate_state)
+                with metrics.phase("browser_start"):
+                    self.p, self.ctx = await ensure_login(headless=self.headless, net_policy=self.net_policy,
+                                                          verified=verified, warm=self.warm)
+                if self.har:
+                    await har.record(self.ctx, self.har[1])
+            return self.ctx
+
+    async def ensure_state(self) -> None:
+        """Make sure storage_state.json is logged in (for browserless / other-process users)."""
+        if self.ctx is not None:
+            return
+        with metrics.phase("session_check"):
+            ok = await asyncio.to_thread(validate_state)
+        if not ok:
+            await self.context()
+
+    async def close(self) -> None:
+        if self.ctx is None:
+            return
+        try:
+            await release(self.p, self.ctx)
+        finally:
+            self.ctx = self.p = None
+
+async def resolve(ctx):
+    """A BrowserContext as-is; a LazySession's context, launching it if needed."""
+    return await ctx.context() if isinstance(ctx, LazySession) else ctx
+
+async def ensure_state(ctx) -> None:
+    if isinstance(ctx, LazySession):
+        await ctx.ensure_state()
+
+# ---------- Credential login (env) ----------
+async def _login_with_env(page) -> bool:
+    """ADI_USER / ADI_PASS sign-in on `page` (the debug_login.py flow)."""
+    user = os.getenv("ADI_USER", "")
+    pwd = os.getenv("ADI_PASS", "")
+    if not user or not pwd:
+        print("[AUTH][ERROR] Missing ADI_USER / ADI_PASS; cannot re-login unattended")
+        return False
+
+    await page.goto(SIGNIN, wait_until="domcontentloaded")
+    await _kill_banners(page)
+    await page.evaluate("window.scrollBy(0, 240)")
+
+    # Scope to the LEFT sign-in form explicitly (email, else username variant)
+    form = page.locator("form:has(input[type='email']), form:has(input[name='emailAddress'])").first
+    if not await form.count():
+        form = page.locator(
+            "form:has([data-test-selector='signIn_userName']), form:has(#userName), form:has(input[name='userName'])"
+        ).first
+    if not await form.count():
+        print("[AUTH][ERROR] Sign-in form not found")
+        return False
+
+    email_in = form.locator("input[type='email'], input[name='email'], #email, input[name='emailAddress']").first
+    user_in = form.locator("[data-test-selector='signIn_userName'], #userName, input[name='userName'], input[name='username']").first
+    pass_in = form.locator("[data-test-selector='signIn_password'], #password, input[name='password'], input[type='password']").first
+    name_in = email_in if await email_in.count() else user_in
+    if not (await name_in.count() and await pass_in.count()):
+        print("[AUTH][ERROR] Sign-in inputs not found")
+        return False
+    await name_in.click(force=True); await name_in.fill(user, force=True)
+    await pass_in.click(force=True); await pass_in.fill(pwd, force=True)
+
+    submit = form.locator("[data-test-selector='signIn_submit'], button[type='submit'], button:has-text('Sign In'), button:has-text('Sign in')").first
+    if await submit.count():
+        await submit.click()
+    else:
+        await page.keyboard.press("Enter")
+    try:
+        await page.wait_for_url(lambda u: "signin" not in u.lower(), timeout=15000)
+    except Exception:
+        pass
+
+    await page.goto(HOME, wait_until="domcontentloaded")
+    await _kill_banners(page)
+    return await _poll_until_logged_in(page, seconds=20)
+
+async def session_alive(ctx) -> bool:
+    """Load HOME in a scratch page of ctx and check the logged-in header."""
+    page = await (await resolve(ctx)).new_page()
+    netpolicy.tag(page, "auth")
+    try:
+        await page.goto(HOME, wait_until="domcontentloaded")
+        await _kill_banners(page)
+        return await _poll_until_logged_in(page, seconds=5)
+    except Exception:
+        return False
+    finally:
+        await page.close()
+
+async def refresh_session(ctx) -> bool:
+    """
+    Log ctx back in with the env credentials and rewrite storage_state.json.
+    One process at a time (file lock): a --workers shard that waited while
+    another one refreshed takes over that session instead of logging in again.
+    """
+    ctx = await resolve(ctx)
+    seen = _state_stamp()
+    async with _state_lock():
+        if _state_stamp() != seen:
+            state = json.loads(Path(STATE_FILE).read_text(encoding="utf-8"))
+            await ctx.add_cookies(state.get("cookies", []))
+            metrics.count("relogins", result="adopted")
+            print("[AUTH] Session refreshed by another worker; reusing storage_state.json")
+            return True
+        page = await ctx.new_page()
+        netpolicy.tag(page, "auth")
+        page.set_default_timeout(60000)
+        try:
+            with metrics.phase("relogin"):
+                ok = await _login_with_env(page)
+        except Exception as e:
+            print(f"[AUTH][ERROR] Re-login failed: {e}")
+            ok = False
+        finally:
+            await page.close()
+        metrics.count("relogins", result="ok" if ok else "failed")
+        if ok:
+            await _write_state(ctx)
+            print("[AUTH] Session refreshed; storage_state.json rewritten.")
+    return ok
+
+# ---------- Mid-run session guard ----------
+class SessionGuard:
+    """
+    Watches PDP rows for the signature of an expired session: a run of pages
+    with no MSRP (and no error). Those rows are held back, not finalized. A
+    priced row or a live-session check releases them as genuine misses; an
+    expired session pauses every worker (`gate`), logs back in via the env
+    credentials and hands the held rows back for another visit.
+
+    Rows visited before a refresh that come back unpriced afterwards are
+    re-queued too (tracked by `gen`).
+    """
+
+    def __init__(self, ctx, cfg: Dict = SESSION):
+        self.ctx = ctx
+        self.miss_run = cfg["miss_run"]
+        self.max_refreshes = cfg["max_refreshes"]
+        self.gen = 0
+        self.refreshes = 0
+        self.suspects: List[Tuple] = []
+        self._open = asyncio.Event()
+        self._open.set()
+        self._lock = asyncio.Lock()
+
+    async def gate(self) -> None:
+        """Block while a re-login is in progress."""
+        await self._open.wait()
+
+    def _release(self) -> List[Tuple]:
+        done, self.suspects = self.suspects, []
+        return done
+
+    async def observe(self, page, item, rec: Dict, gen: int) -> Tuple[List[Tuple], List]:
+        """
+        Feed one finished visit (item as queued, rec as scraped, gen at visit
+        start) → (rows to finalize as (item, rec), items to re-queue).
+        """
+        raw = str(rec.get("msrp_raw") or "")
+        if rec.get("msrp") or raw == "TIMEOUT" or raw.startswith("ERROR"):
+            return self._release() + [(item, rec)], []
+        if gen < self.gen:
+            return [], [item]  # fetched while the old session was dying
+        self.suspects.append((item, rec))
+        if len(self.suspects) < self.miss_run:
+            return [], []
+
+        async with self._lock:
+            if len(self.suspects) < self.miss_run:
+                return [], []  # another worker resolved them meanwhile
+            if await _is_logged_in(page) or await session_alive(self.ctx):
+                print(f"[AUTH] {len(self.suspects)} PDPs in a row without MSRP, session still valid")
+                return self._release(), []
+
+            print(f"[AUTH] Session expired mid-run ({len(self.suspects)} PDPs without MSRP); "
+                  "pausing workers to log back in")
+            if self.refreshes >= self.max_refreshes:
+                raise RuntimeError(f"Session expired again after {self.refreshes} re-login(s)")
+            self._open.clear()
+            try:
+                if not await refresh_session(self.ctx):
+                    raise RuntimeError("Session expired and re-login failed; continue later with --resume")
+                self.refreshes += 1
+                self.gen += 1
+            finally:
+                self._open.set()
+            return [], [it for it, _ in self._release()]
+
+    def flush(self) -> List[Tuple]:
+        """Held rows at the end of the queue are genuine misses."""
+        return self._release()
+# ---------- EOF ----------
@@ -0,0 +1,219 @@
+﻿# src/browser_server.py — long-lived local Chromium (CDP) holding the logged-in ADI session
+#
+#   python src/browser_server.py start [--headed] [--port 9333]
+#   python src/browser_server.py status
+#   python src/browser_server.py stop
+#
+# While it runs, auth.ensure_login connects to it over CDP instead of launching
+# a browser, so back-to-back main.py runs skip the cold start and login check.
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+import httpx
+
+from config import BROWSER_SERVER
+
+def _log(msg: str):
+    print("[SERVER]", msg)
+
+def _info() -> Optional[Dict]:
+    try:
+        return json.loads(Path(BROWSER_SERVER["info_file"]).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+def _version(port: int, timeout_s: float = 1.0) -> Optional[Dict]:
+    """GET /json/version — the health check; None when nothing answers."""
+    try:
+        resp = httpx.get(f"http://127.0.0.1:{port}/json/version", timeout=timeout_s)
+        return resp.json() if resp.status_code == 200 else None
+    except Exception:
+        return None
+
+def endpoint() -> Optional[str]:
+    """CDP endpoint of a healthy running server, else None (cheap: one local GET)."""
+    info = _info()
+    if info and _version(info["port"], timeout_s=0.5):
+        return f"http://127.0.0.1:{info['port']}"
+    return None
+
+# ---------- start ----------
+def _spawn(exe: str, port: int, headless: bool) -> subprocess.Popen:
+    profile = Path(BROWSER_SERVER["profile_dir"]).resolve()
+    profile.mkdir(parents=True, exist_ok=True)
+    args = [
+        exe,
+        f"--remote-debugging-port={port}",
+        "--remote-debugging-address=127.0.0.1",
+        f"--user-data-dir={profile}",
+        "--no-first-run",
+        "--no-default-browser-check",
+        "--disable-blink-features=AutomationControlled",
+        "--window-size=1400,900",
+    ]
+    if headless:
+        args.append("--headless=new")
+    args.append("about:blank")
+    kw = {"stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL, "stdin": subprocess.DEVNULL}
+    if os.name == "nt":
+        kw["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kw["start_new_session"] = True  # outlive this command and its terminal
+    return subprocess.Popen(args, **kw)
+
+async def _seed_context(ctx) -> bool:
+    """Load storage_state.json cookies into ctx (the server's context) and confirm the login."""
+    from auth import HOME, STATE_FILE, _kill_banners, _login_with_env, _poll_until_logged_in, \
+        _state_lock, _write_state
+    import netpolicy
+
+    if Path(STATE_FILE).exists():
+        state = json.loads(Path(STATE_FILE).read_text(encoding="utf-8"))
+        await ctx.add_cookies(state.get("cookies", []))
+    page = await ctx.new_page()
+    netpolicy.tag(page, "auth")
+    try:
+        await page.goto(HOME, wait_until="domcontentloaded")
+        await _kill_banners(page)
+        ok = await _poll_until_logged_in(page, seconds=5)
+        if not ok:
+            _log("Saved session not logged in; trying ADI_USER / ADI_PASS")
+            ok = await _login_with_env(page)
+        if ok:
+            async with _state_lock():
+                await _write_state(ctx)
+    finally:
+        await page.close()
+    return ok
+
+async def _seed_session(port: int) -> bool:
+    """_seed_context on the server listening on `port`."""
+    from playwright.async_api import async_playwright
+
+    p = await async_playwright().start()
+    try:
+        browser = await p.chromium.connect_over_cdp(f"http://127.0.0.1:{port}")
+        ok = await _seed_context(browser.contexts[0])
+        await browser.close()  # over CDP this only disconnects
+        return ok
+    finally:
+        await p.stop()
+
+async def _executable() -> str:
+    from playwright.async_api import async_playwright
+    p = await async_playwright().start()
+    try:
+        return p.chromium.executable_path
+    finally:
+        await p.stop()
+
+def start(port: int, headless: bool) -> int:
+    if endpoint():
+        _log(f"Already running on port {_info()['port']}")
+        return 0
+    exe = asyncio.run(_executable())
+    if not Path(exe).exists():
+        _log(f"Chromium not found at {exe}; run: playwright install chromium")
+        return 1
+    proc = _spawn(exe, port, headless)
+    end = time.time() + BROWSER_SERVER["start_timeout_s"]
+    ver = None
+    while time.time() < end and proc.poll() is None:
+        ver = _version(port)
+        if ver:
+            break
+        time.sleep(0.2)
+    if not ver:
+        _log(f"Chromium did not come up on port {port}")
+        try:
+            proc.kill()
+        except Exception:
+            pass
+        return 1
+    info = {"pid": proc.pid, "port": port, "headless": headless, "started": time.time(),
+            "browser": ver.get("Browser")}
+    Path(BROWSER_SERVER["info_file"]).parent.mkdir(parents=True, exist_ok=True)
+    Path(BROWSER_SERVER["info_file"]).write_text(json.dumps(info, indent=2), encoding="utf-8")
+    _log(f"{ver.get('Browser')} up on port {port} (pid {proc.pid})")
+    if asyncio.run(_seed_session(port)):
+        _log("Session logged in and ready")
+    else:
+        _log("Not logged in: the next main.py run will fall back to its own browser and login")
+    return 0
+
+# ---------- status / stop ----------
+def status() -> int:
+    info = _info()
+    if not info:
+        _log("Not running (no server info)")
+        return 1
+    ver = _version(info["port"])
+    if not ver:
+        _log(f"Not answering on port {info['port']} (pid {info['pid']}); run start again")
+        return 1
+    try:
+        pages = httpx.get(f"http://127.0.0.1:{info['port']}/json/list", timeout=1.0).json()
+        n_pages = sum(1 for t in pages if t.get("type") == "page")
+    except Exception:
+        n_pages = "?"
+    up = (time.time() - info["started"]) / 60
+    _log(f"Healthy: {ver.get('Browser')} on port {info['port']} (pid {info['pid']}), "
+         f"up {up:.0f} min, {n_pages} open page(s), {'headless' if info.get('headless') else 'headed'}")
+    return 0
+
+async def _cdp_close(port: int) -> None:
+    from playwright.async_api import async_playwright
+    p = await async_playwright().start()
+    try:
+        browser = await p.chromium.connect_over_cdp(f"http://127.0.0.1:{port}")
+        cdp = await browser.new_browser_cdp_session()
+        await cdp.send("Browser.close")
+    finally:
+        await p.stop()
+
+def stop() -> int:
+    info = _info()
+    if not info:
+        _log("Not running")
+        return 0
+    if _version(info["port"]):
+        try:
+            asyncio.run(_cdp_close(info["port"]))
+        except Exception:
+            pass
+    end = time.time() + 5
+    while time.time() < end and _version(info["port"], timeout_s=0.3):
+        time.sleep(0.2)
+    if _version(info["port"], timeout_s=0.3):
+        try:
+            os.kill(info["pid"], signal.SIGTERM)
+        except OSError:
+            pass
+    Path(BROWSER_SERVER["info_file"]).unlink(missing_ok=True)
+    _log("Stopped")
+    return 0
+
+def main():
+    ap = argparse.ArgumentParser(description="Warm Chromium for main.py runs")
+    ap.add_argument("command", choices=["start", "stop", "status"])
+    ap.add_argument("--port", type=int, default=BROWSER_SERVER["port"])
+    ap.add_argument("--headed", action="store_true", help="Show the browser window")
+    args = ap.parse_args()
+    from dotenv import load_dotenv
+    load_dotenv()
+    if args.command == "start":
+        sys.exit(start(args.port, headless=not args.headed))
+    sys.exit(stop() if args.command == "stop" else status())
+
+if __name__ == "__main__":
+    main()
+# ---------- EOF ----------
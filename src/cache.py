@@ -0,0 +1,121 @@
+﻿# src/cache.py — on-disk PDP result cache (SQLite) with TTL, revalidation and eviction
+
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+CACHE_PATH = Path("data/cache/pdp.sqlite")
+
+# Fields a PDP visit contributes on top of the catalog row
+PDP_FIELDS = [
+    "title", "model", "alt_model", "series", "megapixels", "form_factor",
+    "ik_rating", "ir", "lens_type", "lens_info", "msrp_raw", "msrp",
+]
+
+def _log(msg: str):
+    print("[CACHE]", msg)
+
+def fingerprint(rec: Dict) -> str:
+    """Stable hash of the parsed PDP content; unchanged pages keep the same value."""
+    body = json.dumps({k: rec.get(k) for k in PDP_FIELDS}, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()[:16]
+
+class PdpCache:
+    """
+    url → parsed PDP fields. `fetched_at` is when the current content was first
+    seen, `checked_at` when it was last confirmed live; freshness uses checked_at.
+
+    ttl_s=0 never serves entries (write-only), refresh=True ignores them,
+    only=True serves every entry regardless of age and never fetches.
+    """
+
+    def __init__(self, path: Path = CACHE_PATH, ttl_s: float = 0, refresh: bool = False,
+                 only: bool = False, max_age_s: float = 30 * 86400, max_rows: int = 50000):
+        self.path = Path(path)
+        self.ttl_s = ttl_s
+        self.refresh = refresh
+        self.only = only
+        self.max_age_s = max_age_s
+        self.max_rows = max_rows
+        self.stats = {"hit": 0, "miss": 0, "new": 0, "changed": 0, "unchanged": 0}
+        self._pending = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pdp ("
+            " url TEXT PRIMARY KEY,"
+            " record TEXT NOT NULL,"
+            " fingerprint TEXT NOT NULL,"
+            " fetched_at REAL NOT NULL,"
+            " checked_at REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS pdp_checked ON pdp(checked_at)")
+        self.evict()
+
+    def get(self, url: str) -> Optional[Dict]:
+        """Cached PDP fields for url if the current policy allows serving them."""
+        if not url or (self.refresh and not self.only) or (self.ttl_s <= 0 and not self.only):
+            return None
+        row = self.db.execute("SELECT record, checked_at FROM pdp WHERE url = ?", (url,)).fetchone()
+        if row is None or (not self.only and time.time() - row[1] > self.ttl_s):
+            self.stats["miss"] += 1
+            return None
+        self.stats["hit"] += 1
+        return json.loads(row[0])
+
+    def put(self, rec: Dict) -> Optional[str]:
+        """Store a freshly scraped row; rows without MSRP are never cached."""
+        url = rec.get("url")
+        if not url or not str(rec.get("msrp") or "").strip():
+            return None
+        now = time.time()
+        fp = fingerprint(rec)
+        row = self.db.execute("SELECT fingerprint FROM pdp WHERE url = ?", (url,)).fetchone()
+        if row is not None and row[0] == fp:
+            # revalidated: same content, only the check time moves
+            self.db.execute("UPDATE pdp SET checked_at = ? WHERE url = ?", (now, url))
+            status = "unchanged"
+        else:
+            body = json.dumps({k: rec.get(k) for k in PDP_FIELDS}, default=str)
+            self.db.execute(
+                "INSERT OR REPLACE INTO pdp (url, record, fingerprint, fetched_at, checked_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (url, body, fp, now, now),
+            )
+            status = "changed" if row is not None else "new"
+        self.stats[status] += 1
+        self._pending += 1
+        if self._pending >= 50:
+            self.db.commit()
+            self._pending = 0
+        return status
+
+    def evict(self) -> int:
+        """Drop entries not confirmed within max_age_s, then the oldest beyond max_rows."""
+        cur = self.db.execute("DELETE FROM pdp WHERE checked_at < ?", (time.time() - self.max_age_s,))
+        n = cur.rowcount
+        cur = self.db.execute(
+            "DELETE FROM pdp WHERE url IN ("
+            " SELECT url FROM pdp ORDER BY checked_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_rows,),
+        )
+        n += cur.rowcount
+        self.db.commit()
+        if n:
+            _log(f"Evicted {n} stale entries")
+        return n
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+        s = self.stats
+        if any(s.values()):
+            _log(f"hits={s['hit']} misses={s['miss']} new={s['new']} "
+                 f"changed={s['changed']} revalidated={s['unchanged']}")
+# ---------- EOF ----------
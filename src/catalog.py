@@ -1,10 +1,15 @@
 ﻿# catalog.py — Hanwha IP Cameras: load all tiles → extract product fields → dedupe
-from typing import List, Dict, Optional
-from playwright.sync_api import BrowserContext
+from typing import Awaitable, Callable, List, Dict, Optional
+from playwright.async_api import BrowserContext, TimeoutError
 from pathlib import Path
-import re, time
-from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
-from config import BRANDS
+import asyncio, math, re, time
+from urllib.parse import urljoin, urlparse, parse_qs, urlencode, urlunparse
+from config import BRANDS, CATALOG_API
+import forensics
+import metrics
+import netpolicy
+import ready
+from pacing import backoff_s
 
 LOG_DIR = Path("data/logs"); LOG_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -24,22 +29,23 @@ def _ensure_param(url: str, key: str, value: str) -> str:
     new_q = urlencode({k: v[0] for k, v in q.items()})
     return urlunparse(pr._replace(query=new_q))
 
-def _safe_click(page, selector: str, timeout: int = 9000) -> bool:
+async def _safe_click(page, selector: str, timeout: int = 9000) -> bool:
     try:
         loc = page.locator(selector)
-        if loc.count():
+        if await loc.count():
             el = loc.first
-            el.wait_for(state="visible", timeout=timeout)
-            if el.is_enabled():
-                el.click()
-                page.wait_for_load_state("networkidle")
-                time.sleep(0.25)
+            await el.wait_for(state="visible", timeout=timeout)
+            if await el.is_enabled():
+                before = await ready.count(page, "catalog_more")
+                await el.click()
+                # done once new tiles render, not when analytics beacons go quiet
+                await ready.wait_ready(page, "catalog_more", baseline=before)
                 return True
     except Exception:
         pass
     return False
 
-def _wait_for_grid(page, timeout_ms: int = 15000) -> None:
+async def _wait_for_grid(page, timeout_ms: int = 15000) -> None:
     sels = [
         "[data-product-card]",
         ".product-card",
@@ -54,45 +60,45 @@ def _wait_for_grid(page, timeout_ms: int = 15000) -> None:
     while time.time() < end:
         for s in sels:
             try:
-                if page.locator(s).count() > 0:
+                if await page.locator(s).count() > 0:
                     return
             except Exception:
                 pass
-        time.sleep(0.2)
+        await asyncio.sleep(0.2)
 
-def _parse_total(page) -> int:
+async def _parse_total(page) -> int:
     try:
-        txt = page.locator("text=Showing").first.inner_text(timeout=2500)
+        txt = await page.locator("text=Showing").first.inner_text(timeout=2500)
         m = re.search(r"of\s+(\d+)", txt)
         return int(m.group(1)) if m else 0
     except Exception:
         return 0
 
-def _load_all(page):
+async def _load_all(page):
     """Click “Show/Load More” and scroll until counts stabilize."""
     _log("Loading all products…")
     prev = -1
     stable = 0
     for _ in range(500):  # generous cap
-        cards = page.locator(
+        cards = await page.locator(
             "[data-product-card], .product-card, .product-tile, "
             ".search-result-item, li.product, .product-list-item, "
             "a[href*='/Product/']:has(img), a[href*='/product/']:has(img)"
         ).count()
 
         clicked = (
-            _safe_click(page, "button:has-text('Show More Products')")
-            or _safe_click(page, "a:has-text('Show More Products')")
-            or _safe_click(page, "button:has-text('Load More')")
-            or _safe_click(page, "a:has-text('Load More')")
+            await _safe_click(page, "button:has-text('Show More Products')")
+            or await _safe_click(page, "a:has-text('Show More Products')")
+            or await _safe_click(page, "button:has-text('Load More')")
+            or await _safe_click(page, "a:has-text('Load More')")
         )
 
         # nudge lazy-load
         try:
-            page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+            await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
         except Exception:
             pass
-        time.sleep(0.4)
+        await asyncio.sleep(0.4)
 
         if cards == prev and not clicked:
             stable += 1
@@ -105,6 +111,107 @@ def _load_all(page):
 
     _log(f"Loaded total product cards (visible): {max(prev, 0)}")
 
+# a results page that fails or comes back empty is reloaded this many more times
+PAGE_RETRIES = 2
+
+async def _fetch_results_page(ctx: BrowserContext, url: str, page_param: str, n: int,
+                              label: str) -> Optional[List[Dict]]:
+    """Open results page n by URL in its own tab and return its tiles (None if it failed to load)."""
+    page = await ctx.new_page()
+    netpolicy.tag(page, "catalog")
+    page.set_default_timeout(90000)
+    t0 = time.perf_counter()
+    page_url = _ensure_param(url, page_param, str(n))
+    try:
+        await page.goto(page_url, wait_until="domcontentloaded")
+        await ready.wait_ready(page, "catalog")
+        tiles = await _extract_on_page_fast(page, label)
+        took = time.perf_counter() - t0
+        metrics.observe("catalog_page_seconds", took, mode="pages")
+        why = forensics.reason(took, {})
+        if why:
+            await forensics.capture(page, "catalog", why, took, {"url": page_url, "tiles": len(tiles)})
+        return tiles
+    except Exception as e:
+        _log(f"Results page {n} failed: {e}")
+        metrics.count("catalog_page_errors", mode="pages")
+        if forensics.enabled():
+            await forensics.capture(page, "catalog", "timeout" if isinstance(e, TimeoutError) else "error",
+                                    time.perf_counter() - t0, {"url": page_url, "error": str(e)})
+        return None
+    finally:
+        await page.close()
+
+async def _results_page(ctx: BrowserContext, url: str, page_param: str, n: int,
+                        label: str) -> Optional[List[Dict]]:
+    """
+    _fetch_results_page with retries: every page up to the reported count must
+    have tiles, so a failure or an empty page is reloaded after backoff_s(attempt),
+    up to PAGE_RETRIES times. None when every attempt failed.
+    """
+    for attempt in range(1, PAGE_RETRIES + 2):
+        tiles = await _fetch_results_page(ctx, url, page_param, n, label)
+        if tiles:
+            return tiles
+        if attempt > PAGE_RETRIES:
+            break
+        delay = backoff_s(attempt)
+        _log(f"Results page {n}: {'no tiles' if tiles == [] else 'failed'}; retry {attempt} in {delay:.1f}s")
+        await asyncio.sleep(delay)
+    _log(f"Results page {n}: gave up after {PAGE_RETRIES + 1} attempts")
+    return None
+
+async def _load_by_pages(ctx: BrowserContext, page, url: str, total: int, page_param: str,
+                         concurrency: int, label: str, emit=None) -> Optional[List[Dict]]:
+    """
+    Page 1 is already open in `page`. Page 2 is fetched alone first: None when
+    it repeats page 1 (the site ignores the page parameter), so the caller can
+    click instead after one extra load. Otherwise pages 3..N follow,
+    `concurrency` tabs at a time, and all tiles come back in page order.
+    A page still failing after its retries also returns None, so the catalog is
+    never silently short a page; fewer unique tiles than `total` is logged.
+    emit, if given, is awaited with each page's tiles as soon as they are extracted.
+    """
+    per_page = int(parse_qs(urlparse(url).query).get("perPage", ["140"])[0])
+    n_pages = max(1, math.ceil(total / per_page))
+    first = await _extract_on_page_fast(page, label)
+    _log(f"Paginating by URL: {n_pages} page(s) of {per_page}")
+    if emit:
+        await emit(first)
+    if n_pages < 2:
+        return first
+
+    second = await _results_page(ctx, url, page_param, 2, label)
+    if second is None:
+        _log("Results page 2 failed; falling back to Show More")
+        return None
+    first_urls = {it.get("url") for it in first}
+    if second[0].get("url") in first_urls:
+        _log(f"'{page_param}' param not honored (page 2 repeats page 1)")
+        return None
+    if emit:
+        await emit(second)
+
+    sem = asyncio.Semaphore(max(1, concurrency))
+    async def one(n: int) -> Optional[List[Dict]]:
+        async with sem:
+            tiles = await _results_page(ctx, url, page_param, n, label)
+        if emit and tiles:
+            await emit(tiles)
+        return tiles
+
+    rest = [second] + list(await asyncio.gather(*(one(n) for n in range(3, n_pages + 1))))
+    failed = [n for n, chunk in enumerate(rest, 2) if chunk is None]
+    if failed:
+        _log(f"Results page(s) {', '.join(map(str, failed))} failed; falling back to Show More")
+        metrics.count("catalog_page_fallbacks", mode="pages")
+        return None
+    items = first + [it for chunk in rest for it in chunk]
+    found = len({it.get("url") for it in items})
+    if found < total:
+        _log(f"[WARN] {found} unique tiles from {n_pages} page(s), but the site reports {total}")
+    return items
+
 # -------------------------
 # Attribute parsing
 # -------------------------
@@ -149,16 +256,16 @@ def _parse_attrs(title: str) -> Dict[str, Optional[str]]:
 # Extraction
 # -------------------------
 
-def _extract_on_page_fast(page) -> List[Dict]:
+async def _extract_on_page_fast(page, label: str = "Hanwha Vision") -> List[Dict]:
     """
     Extract tiles using ADI data-test-selector hooks.
     Only accept PDP links under /Product/* to avoid brand-link collisions.
     """
     js = r"""
-    () => {
+    (label) => {
       const toAbs = (h) => {
         if (!h) return "";
-        return h.startsWith("http") ? h : "https://www.adiglobaldistribution.us" + h;
+        return h.startsWith("http") ? h : location.origin + h;
       };
 
       const cards = Array.from(document.querySelectorAll(
@@ -178,7 +285,7 @@ def _extract_on_page_fast(page) -> List[Dict]:
         const url = toAbs(href);
 
         // Brand and Title
-        const brand = (card.querySelector("[data-test-selector='brandLink'] span")?.textContent || "Hanwha Vision").trim();
+        const brand = (card.querySelector("[data-test-selector='brandLink'] span")?.textContent || label).trim();
         const title = (aDesc?.textContent || "").trim();
 
         // Models (e.g., ANV-L7012R | SQ-ANVL7012R)
@@ -215,11 +322,11 @@ def _extract_on_page_fast(page) -> List[Dict]:
       return rows;
     }
     """
-    return page.evaluate(js)
+    return await page.evaluate(js, label)
 
 
 
-def _extract_on_page(page) -> List[Dict]:
+async def _extract_on_page(page) -> List[Dict]:
     """Extract fields from each tile: brand, title, model(s), url, parsed attrs."""
     products: List[Dict] = []
 
@@ -227,10 +334,10 @@ def _extract_on_page(page) -> List[Dict]:
         "[data-product-card], .product-card, .product-tile, "
         ".search-result-item, li.product, .product-list-item"
     )
-    count = cards.count()
+    count = await cards.count()
     if count == 0:
         cards = page.locator("a[href*='/Product/'], a[href*='/product/'], a[href*='/Catalog/product']")
-        count = cards.count()
+        count = await cards.count()
 
     for i in range(count):
         card = cards.nth(i)
@@ -239,27 +346,27 @@ def _extract_on_page(page) -> List[Dict]:
         href = None
         for sel in ["a.product-link", "a[href*='/Product/']", "a[href*='/product/']", "a[href*='/Catalog/product']", "a[href]"]:
             try:
-                if card.locator(sel).count():
-                    href = card.locator(sel).first.get_attribute("href")
+                if await card.locator(sel).count():
+                    href = await card.locator(sel).first.get_attribute("href")
                     if href: break
             except Exception:
                 pass
         if not href:
             try:
-                href = card.get_attribute("href")
+                href = await card.get_attribute("href")
             except Exception:
                 href = None
         if not href:
             continue
         if not href.startswith("http"):
-            href = f"https://www.adiglobaldistribution.us{href}"
+            href = urljoin(page.url, href)
 
         # Brand (e.g., "Hanwha Vision")
         brand = ""
         for sel in ["[class*='brand']", "span:has-text('Hanwha')", "div:has-text('Hanwha Vision')"]:
             try:
-                if card.locator(sel).count():
-                    txt = card.locator(sel).first.inner_text().strip()
+                if await card.locator(sel).count():
+                    txt = (await card.locator(sel).first.inner_text()).strip()
                     if "hanwha" in txt.lower():
                         brand = txt
                         break
@@ -268,16 +375,16 @@ def _extract_on_page(page) -> List[Dict]:
         if not brand:
             # fallback: first small element above title
             try:
-                brand = card.locator("text=/Hanwha/i").first.inner_text().strip()
+                brand = (await card.locator("text=/Hanwha/i").first.inner_text()).strip()
             except Exception:
                 brand = "Hanwha Vision"
 
         # Title (marketing name)
         title = ""
         for sel in [".product-title", "h2", "[itemprop='name']", "a"]:
-            if card.locator(sel).count():
+            if await card.locator(sel).count():
                 try:
-                    title = card.locator(sel).first.inner_text().strip()
+                    title = (await card.locator(sel).first.inner_text()).strip()
                     if title: break
                 except Exception:
                     pass
@@ -286,7 +393,7 @@ def _extract_on_page(page) -> List[Dict]:
         model = ""
         alt_model = ""
         try:
-            sku_line = card.locator("text=/\\b[A-Z0-9]{2,}[-_A-Z0-9]+\\b/").all_inner_texts()
+            sku_line = await card.locator("text=/\\b[A-Z0-9]{2,}[-_A-Z0-9]+\\b/").all_inner_texts()
             joined = " | ".join(sku_line)
             # pick first two distinct codes
             codes = re.findall(r"\b[A-Z0-9]{2,}[-_A-Z0-9]+\b", joined)
@@ -313,60 +420,235 @@ def _extract_on_page(page) -> List[Dict]:
 
     return products
 
+# -------------------------
+# Product-search API capture
+# -------------------------
+def _dig(obj, path: str):
+    """Follow a dotted path through dicts/lists; None when any step is missing."""
+    for k in path.split("."):
+        if isinstance(obj, dict):
+            obj = obj.get(k)
+        elif isinstance(obj, list) and k.isdigit() and int(k) < len(obj):
+            obj = obj[int(k)]
+        else:
+            return None
+    return obj
+
+def _api_attrs(item: Dict, wanted: Dict[str, str]) -> Dict[str, str]:
+    """attributeTypes [{label, attributeValues: [{valueDisplay}]}] → {column: "v1, v2"}."""
+    by_label = {}
+    for at in item.get("attributeTypes") or []:
+        vals = [v.get("valueDisplay") or v.get("value") or "" for v in at.get("attributeValues") or []]
+        by_label[(at.get("label") or at.get("name") or "").strip().lower()] = ", ".join(x for x in vals if x)
+    out = {}
+    for col, label in wanted.items():
+        v = by_label.get(label.lower())
+        if v:
+            out[col] = v
+    return out
+
+def _rows_from_api(data: Dict, base: str, brand: str, api: Dict = CATALOG_API) -> List[Dict]:
+    """Catalog rows (same keys as the tile extractor) from one product-search response."""
+    rows = []
+    for item in _dig(data, api["items"]) or []:
+        if not isinstance(item, dict):
+            continue
+        f = {k: _dig(item, path) for k, path in api["fields"].items()}
+        href = str(f.get("url") or "")
+        if not re.search(r"^(https?://[^/]+)?/Product/", href, re.I):
+            continue  # same rule as the tiles: PDP links only
+        title = str(f.get("title") or "").strip()
+        row = {
+            "brand": str(f.get("brand") or brand).strip(),
+            "title": title,
+            "model": str(f.get("model") or "").strip(),
+            "alt_model": str(f.get("alt_model") or "").strip(),
+            "url": urljoin(base, href),
+            **_parse_attrs(title),
+            **_api_attrs(item, api.get("attributes", {})),
+        }
+        msrp = f.get("msrp")
+        if msrp not in (None, "", 0):
+            row["msrp_raw"] = f"MSRP ${msrp}"
+            row["msrp"] = str(msrp).replace(",", "")
+        rows.append(row)
+    return rows
+
+async def _api_get(ctx: BrowserContext, url: str) -> Optional[Dict]:
+    """GET through the context's request client (session cookies, nothing rendered)."""
+    t0 = time.perf_counter()
+    try:
+        resp = await ctx.request.get(url, headers={"Accept": "application/json"})
+        if resp.ok:
+            data = await resp.json()
+            metrics.observe("catalog_page_seconds", time.perf_counter() - t0, mode="api")
+            return data
+        _log(f"API {resp.status} for {url}")
+    except Exception as e:
+        _log(f"API request failed: {e}")
+    metrics.count("catalog_page_errors", mode="api")
+    return None
+
+async def _load_from_api(ctx: BrowserContext, captured: List, base: str, brand: str,
+                         concurrency: int, api: Dict = CATALOG_API, emit=None) -> Optional[List[Dict]]:
+    """
+    Take the product-search call the grid made, then page through the same
+    endpoint directly. None when no usable response was seen (caller scrapes
+    the DOM instead). emit, if given, is awaited with each API page's rows.
+    """
+    first = None
+    for resp in captured:
+        try:
+            data = await resp.json()
+        except Exception:
+            continue
+        if _dig(data, api["items"]):
+            first = resp
+            break
+    if first is None:
+        _log("No product-search API response captured")
+        return None
+
+    api_url = _ensure_param(first.url, api["page_size_param"], str(api["page_size"]))
+    page1 = await _api_get(ctx, _ensure_param(api_url, api["page_param"], "1"))
+    if page1 is None:
+        return None
+    n_pages = _dig(page1, api["pages"])
+    if not n_pages:
+        total = _dig(page1, api["total"]) or 0
+        n_pages = math.ceil(total / api["page_size"]) if total else 1
+    _log(f"Product-search API: {n_pages} page(s) via {urlparse(api_url).path}")
+
+    if emit:
+        await emit(_rows_from_api(page1, base, brand, api))
+
+    sem = asyncio.Semaphore(max(1, concurrency))
+    async def one(n: int) -> Optional[Dict]:
+        async with sem:
+            data = await _api_get(ctx, _ensure_param(api_url, api["page_param"], str(n)))
+        if emit and data is not None:
+            await emit(_rows_from_api(data, base, brand, api))
+        return data
+
+    rest = await asyncio.gather(*(one(n) for n in range(2, int(n_pages) + 1)))
+    items = _rows_from_api(page1, base, brand, api)
+    for n, data in enumerate(rest, 2):
+        if data is None:
+            _log(f"API page {n} missing; falling back to the grid")
+            return None
+        items += _rows_from_api(data, base, brand, api)
+    return items or None
+
 # -------------------------
 # Entry point
 # -------------------------
-def fetch_product_list(ctx: BrowserContext, brand: str) -> List[Dict]:
+class _Unique:
+    """Keeps the first tile per URL (else model); tiles with neither are dropped."""
+
+    def __init__(self):
+        self.rows: List[Dict] = []
+        self._seen = set()
+
+    def add(self, items: List[Dict]) -> List[Dict]:
+        new = []
+        for it in items:
+            key = it.get("url") or it.get("model")
+            if not key or key in self._seen:
+                continue
+            self._seen.add(key)
+            new.append(it)
+        self.rows += new
+        return new
+
+async def fetch_product_list(ctx: BrowserContext, brand: str, mode: str = "click",
+                             concurrency: int = 3,
+                             on_rows: Optional[Callable[[List[Dict]], Awaitable[None]]] = None) -> List[Dict]:
+    """
+    mode="click" exhausts "Show More" on one page; mode="pages" reads the
+    reported total and fetches every results page by URL, `concurrency` at a
+    time (falling back to clicking when the total or page param is unusable);
+    mode="api" builds rows from the product-search JSON the grid loads and
+    pages through that endpoint directly (falling back to the tiles).
+    on_rows, if given, is awaited with each batch of not-yet-seen rows as it is
+    extracted (per results/API page; once at the end in click mode), so a
+    consumer can start on them while the rest loads. The returned list is then
+    in that arrival order.
+    """
+    seen = _Unique()
+
+    async def emit(items: List[Dict]):
+        new = seen.add(items)
+        if new and on_rows:
+            await on_rows(new)
+
+    early = emit if on_rows else None
     cfg = BRANDS[brand]
-    page = ctx.new_page()
+    label = cfg.get("label", brand)
+    page = await ctx.new_page()
+    netpolicy.tag(page, "catalog")
     page.set_default_timeout(90000)
 
+    captured = []
+    if mode == "api":
+        api_re = re.compile(CATALOG_API["url_re"], re.I)
+        page.on("response", lambda r: captured.append(r)
+                if r.ok and r.request.resource_type in ("xhr", "fetch") and api_re.search(r.url) else None)
+
     # 1) open pre-filtered IP Cameras URL
     url = cfg["list_url"]
     url = _ensure_param(url, "perPage", "140")           # reduce pagination
     url = _ensure_param(url, "sortCriteria", "relevance")
-    page.goto(url, wait_until="domcontentloaded")
-    page.wait_for_load_state("networkidle")
-    _log("IP Cameras page loaded")
-
-    # 2) wait for grid & exhaust “Show/Load More”
-    _wait_for_grid(page, timeout_ms=15000)
-    total = _parse_total(page)
-    _log(f"Total reported: {total} (ok if 0)")
-    _load_all(page)
+    pr = urlparse(url)
+    base = f"{pr.scheme}://{pr.netloc}"
+    t0 = time.perf_counter()
+    await page.goto(url, wait_until="domcontentloaded")
+    await ready.wait_ready(page, "catalog")
+    took = time.perf_counter() - t0
+    metrics.observe("catalog_page_seconds", took, mode="first")
+    if forensics.reason(took, {}):
+        await forensics.capture(page, "catalog", "slow", took, {"url": url, "brand": brand})
+    _log(f"{brand}: IP Cameras page loaded")
+
+    # 2) wait for grid; then either page by URL or exhaust “Show/Load More”
+    await _wait_for_grid(page, timeout_ms=15000)
+    total = await _parse_total(page)
+    _log(f"{brand}: total reported: {total} (ok if 0)")
 
     # 3) extract tiles (robust, no MSRP here)
     try:
-        ## items = _extract_on_page(page) ##
-        items = _extract_on_page_fast(page)
+        items = None
+        if mode == "api":
+            items = await _load_from_api(ctx, captured, base, label, concurrency, emit=early)
+        if mode == "pages" and total:
+            items = await _load_by_pages(ctx, page, url, total, cfg.get("page_param", "page"),
+                                         concurrency, label, emit=early)
+        if items is None:
+            await _load_all(page)
+            ## items = _extract_on_page(page) ##
+            items = await _extract_on_page_fast(page, label)
         
     except Exception as e:
         _log(f"Extraction error: {e}")
-        page.screenshot(path=str(LOG_DIR / "extract_error.png"), full_page=True)
-        with open(LOG_DIR / "extract_error.html", "w", encoding="utf-8") as f:
-            f.write(page.content())
+        await page.screenshot(path=str(LOG_DIR / f"extract_error_{brand.lower()}.png"), full_page=True)
+        with open(LOG_DIR / f"extract_error_{brand.lower()}.html", "w", encoding="utf-8") as f:
+            f.write(await page.content())
         items = []
 
     _log(f"Extracted tiles (pre-dedupe): {len(items)}")
 
     if not items:
-        page.screenshot(path=str(LOG_DIR / "catalog_zero_items.png"), full_page=True)
-        with open(LOG_DIR / "catalog_zero_items.html", "w", encoding="utf-8") as f:
-            f.write(page.content())
+        await page.screenshot(path=str(LOG_DIR / f"catalog_zero_items_{brand.lower()}.png"), full_page=True)
+        with open(LOG_DIR / f"catalog_zero_items_{brand.lower()}.html", "w", encoding="utf-8") as f:
+            f.write(await page.content())
 
-    page.close()
+    await page.close()
 
-    # 4) de-dupe by URL
-    seen = set(); uniq = []
-    for it in items:
-        key = it.get("url") or it.get("model")
-        if not key:
-            continue
-        if key not in seen:
-            seen.add(key)
-            uniq.append(it)
+    # 4) de-dupe by URL (rows already emitted page by page are not sent again)
+    await emit(items)
+    uniq = seen.rows
 
-    _log(f"Final unique products: {len(uniq)}")
+    _log(f"{brand}: final unique products: {len(uniq)}")
+    metrics.count("catalog_tiles", len(uniq), brand=brand)
     return uniq  # ← this line must be indented exactly like _log(...)
 # ← no code at all after this
 
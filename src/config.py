@@ -1,8 +1,186 @@
-﻿# config.py – brand config (extend later for Axis/Avigilon)
+﻿# config.py – brand config (--brand takes a key, a comma list of keys, or "all")
+import os
+
+# Site root every URL below is built on. ADI_BASE_URL points a run at another
+# host, e.g. the benchmark stand-in (bench/server.py).
+SITE = os.getenv("ADI_BASE_URL", "https://www.adiglobaldistribution.us").rstrip("/")
+
 BRANDS = {
     "Hanwha": {
-        "list_url": "https://www.adiglobaldistribution.us/Catalog/shop-brands/hanwha-vision?perPage=140&sortCriteria=relevance&f-ec_sub_category=IP+Cameras",
+        "label": "Hanwha Vision",   # brand name as ADI prints it on tiles/rows
+        "list_url": f"{SITE}/Catalog/shop-brands/hanwha-vision?perPage=140&sortCriteria=relevance&f-ec_sub_category=IP+Cameras",
         "msrp_labels": ["MSRP", "List Price", "List"],
+        "page_param": "page",   # results page number in the list URL (--catalog-mode pages)
+    },
+    # Adding a brand: copy the Hanwha entry and check each field on the live site
+    # first — the shop-brands slug in list_url, the label printed on tiles, and
+    # the price label on its PDPs. The two below follow Hanwha's pattern but have
+    # NOT been checked against ADI; uncomment one only after confirming it.
+    # "Axis": {
+    #     "label": "Axis Communications",
+    #     "list_url": f"{SITE}/Catalog/shop-brands/axis-communications?perPage=140&sortCriteria=relevance&f-ec_sub_category=IP+Cameras",
+    #     "msrp_labels": ["MSRP", "List Price", "List"],
+    #     "page_param": "page",
+    # },
+    # "Avigilon": {
+    #     "label": "Avigilon",
+    #     "list_url": f"{SITE}/Catalog/shop-brands/avigilon?perPage=140&sortCriteria=relevance&f-ec_sub_category=IP+Cameras",
+    #     "msrp_labels": ["MSRP", "List Price", "List"],
+    #     "page_param": "page",
+    # },
+}
+
+def brand_key(name: str):
+    """BRANDS key for a key or row label ("Hanwha Vision" → "Hanwha"); None if unknown."""
+    lo = (name or "").strip().lower()
+    for key, cfg in BRANDS.items():
+        if lo in (key.lower(), cfg.get("label", "").lower()):
+            return key
+    return None
+
+def brand_cfg(name: str) -> dict:
+    """BRANDS entry by key ("Hanwha") or row label ("Hanwha Vision"); {} if unknown."""
+    key = brand_key(name)
+    return BRANDS[key] if key else {}
+
+# Network policy per page type (see netpolicy.py). A request is blocked when its
+# resource type is listed, else allowed when its host matches allow_domains,
+# else blocked when its host matches block_domains. Untagged pages use "default".
+_TRACKERS = [
+    "cookielaw.org", "onetrust.com", "google-analytics.com", "googletagmanager.com",
+    "doubleclick.net", "googlesyndication.com", "adnxs.com", "adsrvr.org", "agkn.com",
+    "clickagy.com", "demdex.net", "omtrdc.net", "linkedin.com", "licdn.com", "openx.net",
+    "rlcdn.com", "rubiconproject.com", "sitescout.com", "zoominfo.com", "zoominfo.io",
+    "quantummetric.com", "hotjar.com", "facebook.net", "facebook.com", "bing.com",
+    "clarity.ms", "optimizely.com",
+]
+NET_POLICY = {
+    "default": {"block_types": [], "allow_domains": [], "block_domains": []},
+    "auth": {
+        "block_types": ["image", "media", "font"],
+        "allow_domains": ["adiglobaldistribution.us"],
+        "block_domains": _TRACKERS,
+    },
+    "catalog": {
+        "block_types": ["image", "media", "font"],
+        "allow_domains": ["adiglobaldistribution.us"],
+        "block_domains": _TRACKERS,
+    },
+    "pdp": {
+        "block_types": ["image", "media", "font"],
+        "allow_domains": ["adiglobaldistribution.us"],
+        "block_domains": _TRACKERS,
     },
 }
 
+# Product-search API behind the catalog grid (--catalog-mode api, see catalog.py).
+# Responses whose URL matches url_re are read as JSON; dotted paths pick fields
+# out of each item. `attributes` maps export columns to attributeTypes labels.
+# Price paths are optional: when absent the PDP pass supplies the MSRP.
+CATALOG_API = {
+    "url_re": r"/api/v\d+/products/?(\?|$)",
+    "items": "products",
+    "pages": "pagination.numberOfPages",
+    "total": "pagination.totalItemCount",
+    "page_param": "page",
+    "page_size_param": "pageSize",
+    "page_size": 100,
+    "fields": {
+        "title": "shortDescription",
+        "model": "manufacturerItem",
+        "alt_model": "erpNumber",
+        "url": "productDetailUrl",
+        "brand": "brand.name",
+        "msrp": "pricing.unitListPrice",
+    },
+    "attributes": {
+        "lens_type": "Lens Type",
+        "ik_rating": "IK Rating",
+    },
+}
+
+# PDP pacing (see pacing.py): the pool starts at --concurrency pages spaced
+# start_interval_s apart and adapts between 1 and --max-concurrency. Pages slower
+# than slow_s count as a slowdown. Failed visits are retried after
+# retry_base_s·2^(n-1) seconds (capped at retry_cap_s), up to --retries times.
+RATE = {
+    "start_interval_s": 0.12,
+    "min_interval_s": 0.0,
+    "max_interval_s": 5.0,
+    "slow_s": 8.0,
+    "cooldown_s": 2.0,
+    "retry_base_s": 2.0,
+    "retry_cap_s": 60.0,
+}
+
+# --pipeline (see main._run_brand_pipelined): catalog rows wait in a queue of at
+# most queue_rows for the PDP pass, which takes up to batch_rows of them at a time.
+PIPELINE = {
+    "queue_rows": 1000,
+    "batch_rows": 280,
+}
+
+# Forensic capture (--forensics, see forensics.py): a PDP or results page slower
+# than slow_s, or ending in TIMEOUT/ERROR, gets its HTML, a screenshot and a
+# Resource Timing breakdown saved under dir/<run>/; with --forensics trace also
+# the Playwright trace of the last trace_window_s. At most max_captures per run,
+# min_interval_s apart, one per URL, until max_total_mb is on disk.
+FORENSICS = {
+    "dir": "data/forensics",
+    "slow_s": 15.0,
+    "max_captures": 25,
+    "min_interval_s": 20.0,
+    "max_total_mb": 200,
+    "max_html_kb": 2048,
+    "trace_window_s": 45,
+}
+
+# Mid-run session checks (see auth.SessionGuard): after miss_run PDPs in a row
+# without an MSRP the session is verified; if it expired, workers pause, the
+# ADI_USER/ADI_PASS login runs in the same context and those URLs are re-queued.
+# Startup validation (auth.validate_state) skips the browser when the saved
+# auth cookies are unexpired and either a check within remember_s passed or
+# one GET of probe_url reports probe_key true. probe_url/probe_key are a best
+# guess at ADI's session endpoint: if the probe errors, returns non-JSON or
+# lacks probe_key, the session counts as unverified and the browser checks the
+# HOME page header instead (a pass there is remembered for remember_s too).
+SESSION = {
+    "miss_run": 6,
+    "max_refreshes": 3,
+    "auth_cookies": [".AspNet.ApplicationCookie"],
+    "probe_url": f"{SITE}/api/v1/sessions/current",
+    "probe_key": "isAuthenticated",
+    "remember_s": 3600,
+}
+
+# Warm browser (browser_server.py start|stop|status): a detached Chromium with
+# a CDP port that ensure_login connects to instead of launching its own.
+BROWSER_SERVER = {
+    "port": 9333,
+    "profile_dir": "data/browser_profile",
+    "info_file": "data/browser_server.json",
+    "start_timeout_s": 20,
+}
+
+# DOM readiness per page type (see ready.py): ready once any selector matches
+# (more than `baseline` nodes when a caller passes one) and, if text_re is set,
+# one match's innerText fits it. Timeouts are not errors; parsing goes ahead.
+READINESS = {
+    "catalog": {
+        "selectors": [
+            "[data-test-selector='productListProductImage']",
+            "[data-product-card]", ".product-card", ".product-tile",
+            ".search-result-item", "li.product", ".product-list-item",
+        ],
+        "timeout_ms": 15000,
+    },
+    "catalog_more": {  # after "Show More": tile count grows past the baseline
+        "selectors": ["[data-test-selector='productListProductImage']"],
+        "timeout_ms": 9000,
+    },
+    "pdp": {
+        "selectors": ["div[data-test-selector='productDetails_rightColumn']"],
+        "text_re": r"MSRP|List Price|\$\s*\d|sign in",
+        "timeout_ms": 6000,
+    },
+}
@@ -1,11 +1,20 @@
 ﻿# src/detail.py — PDP HTML parser (title + Key Features) + MSRP
 
+import asyncio
 import os
 import re
 import time
-from typing import List, Dict, Optional, Tuple
-from playwright.sync_api import BrowserContext, Page, TimeoutError
-from config import BRANDS
+from collections import Counter
+from typing import Callable, List, Dict, Optional, Tuple
+from playwright.async_api import BrowserContext, Page, TimeoutError
+from config import brand_cfg
+import forensics
+import metrics
+import netpolicy
+import ready
+from archive import JS_SNAPSHOT
+from pacing import RateController, backoff_s, outcome
+from auth import SessionGuard, ensure_state, resolve
 
 # ---------- Regexes ----------
 MODEL_RE    = re.compile(r"\b([A-Z]{2,4}-[A-Z0-9]+)\b")       # e.g., ANV-L7082R
@@ -16,7 +25,7 @@ MM_RANGE_RE = re.compile(r"\b(\d+(?:\.\d+)?)\s*[-~–]\s*(\d+(?:\.\d+)?)\s*mm\b"
 MM_SINGLE_RE= re.compile(r"\b(\d+(?:\.\d+)?)\s*mm\b", re.I)
 
 # ---------- Helpers ----------
-def _dismiss_banners(page: Page):
+async def _dismiss_banners(page: Page):
     for sel in [
         "#onetrust-accept-btn-handler",
         "#onetrust-banner-sdk #onetrust-accept-btn-handler",
@@ -27,13 +36,13 @@ def _dismiss_banners(page: Page):
     ]:
         try:
             loc = page.locator(sel).first
-            if loc.count() and loc.is_visible():
-                loc.click()
-                page.wait_for_timeout(120)
+            if await loc.count() and await loc.is_visible():
+                await loc.click()
+                await page.wait_for_timeout(120)
         except Exception:
             pass
 
-def _pdp_title(page: Page) -> str:
+async def _pdp_title(page: Page) -> str:
     """Main product title from the left product column only."""
     for sel in [
         "div[data-test-selector='productDetails_leftColumn'] h1",
@@ -42,15 +51,15 @@ def _pdp_title(page: Page) -> str:
     ]:
         try:
             loc = page.locator(sel).first
-            if loc.count():
-                txt = loc.inner_text().strip()
+            if await loc.count():
+                txt = (await loc.inner_text()).strip()
                 if txt:
                     return txt
         except Exception:
             pass
     return ""
 
-def _key_features(page: Page) -> List[str]:
+async def _key_features(page: Page) -> List[str]:
     """Key Features bullets from the left column area."""
     roots = [
         "div[data-test-selector='productDetails_leftColumn']",
@@ -58,9 +67,9 @@ def _key_features(page: Page) -> List[str]:
     ]
     for root in roots:
         loc = page.locator(f"{root} ul.mainfeatureslist li")
-        if loc.count():
+        if await loc.count():
             try:
-                items = [t.strip() for t in loc.all_inner_texts() if t and t.strip()]
+                items = [t.strip() for t in await loc.all_inner_texts() if t and t.strip()]
                 if items:
                     return items
             except Exception:
@@ -68,15 +77,15 @@ def _key_features(page: Page) -> List[str]:
     # Fallback near a "Key Features" heading
     try:
         hf = page.locator("div[data-test-selector='productDetails_leftColumn'] :text('Key Features')").first
-        if hf.count():
+        if await hf.count():
             parent = hf.locator("xpath=ancestor::*[1]")
             lis = parent.locator("li")
-            return [t.strip() for t in lis.all_inner_texts() if t.strip()]
+            return [t.strip() for t in await lis.all_inner_texts() if t.strip()]
     except Exception:
         pass
     return []
 
-def _pdp_codes(page: Page) -> Tuple[str, str]:
+async def _pdp_codes(page: Page) -> Tuple[str, str]:
     """
     Read model + ADI SKU from the header area under the H1.
     Example: 'ANV-L7082R | SQ-ANVL7082R'
@@ -87,20 +96,25 @@ def _pdp_codes(page: Page) -> Tuple[str, str]:
     ]
     for root in containers:
         c = page.locator(root).first
-        if not c.count():
+        if not await c.count():
             continue
         try:
-            txt = c.inner_text()
+            txt = await c.inner_text()
         except Exception:
             continue
-        m = MODEL_RE.search(txt)
-        s = ADISKU_RE.search(txt)
-        model   = m.group(1) if m else ""
-        alt_mod = s.group(0) if s else ""
+        model, alt_mod = _codes_from_text(txt)
         if model or alt_mod:
             return model, alt_mod
     return "", ""
 
+def _codes_from_text(txt: str) -> Tuple[str, str]:
+    """First model code + ADI SKU found in a block of header text."""
+    m = MODEL_RE.search(txt)
+    s = ADISKU_RE.search(txt)
+    model   = m.group(1) if m else ""
+    alt_mod = s.group(0) if s else ""
+    return model, alt_mod
+
 def _derive_from_title_and_model(title: str, model: str) -> Dict[str, Optional[str]]:
     """Series from model, MP + form_factor best-effort from title."""
     series = None
@@ -157,90 +171,443 @@ def _parse_features(features: List[str]) -> Dict[str, Optional[str]]:
         "lens_info": lens_info,
     }
 
-def _msrp_text_from_page(page: Page, brand: str = "Hanwha") -> Optional[str]:
+async def _msrp_text_from_page(page: Page, brand: str = "Hanwha") -> Optional[str]:
     """Find MSRP value in the right column or whole page."""
-    labels = BRANDS.get(brand, {}).get("msrp_labels", ["MSRP"])
+    labels = brand_cfg(brand).get("msrp_labels", ["MSRP"])
     scopes = [
         "div[data-test-selector='productDetails_rightColumn']",
         "body",
     ]
     for scope in scopes:
         try:
-            txt = page.locator(scope).first.inner_text()
+            txt = await page.locator(scope).first.inner_text()
         except Exception:
             continue
-        for label in labels:
-            # Use compiled regex to avoid f-string brace issues
-            pat = re.compile(re.escape(label) + r"\s*\$?\s*([0-9][0-9,]*(?:\.\d{2})?)", re.I)
-            m = pat.search(txt)
-            if m:
-                return m.group(1)
+        val = _msrp_from_text(txt, labels)
+        if val:
+            return val
+    return None
+
+def _msrp_from_text(txt: str, labels: List[str]) -> Optional[str]:
+    """First '<label> $1,234.00' amount in txt, trying labels in order."""
+    for label in labels:
+        # Use compiled regex to avoid f-string brace issues
+        pat = re.compile(re.escape(label) + r"\s*\$?\s*([0-9][0-9,]*(?:\.\d{2})?)", re.I)
+        m = pat.search(txt)
+        if m:
+            return m.group(1)
     return None
 
-def fetch_mspp_for_products(ctx: BrowserContext, products: List[Dict], only_missing: bool = False) -> List[Dict]:
+def _build_record(prod: Dict, title: str, features: List[str], model: str, alt_model: str,
+                  msrp_val: Optional[str]) -> Dict:
+    """Merge parsed PDP fields over the catalog row (PDP wins when non-empty)."""
+    basics = _derive_from_title_and_model(title, model)
+    more = _parse_features(features)
+
+    rec = {**prod}
+    rec.update({
+        "title": title or prod.get("title"),
+        "model": model or prod.get("model"),
+        "alt_model": alt_model or prod.get("alt_model"),
+        "series": basics["series"] or prod.get("series"),
+        "megapixels": basics["megapixels"] or prod.get("megapixels"),
+        "form_factor": basics["form_factor"] or prod.get("form_factor"),
+        "ik_rating": more["ik_rating"] or prod.get("ik_rating"),
+        "ir": True if more["ir"] else (prod.get("ir") or False),
+        "lens_type": more["lens_type"] or prod.get("lens_type"),
+        "lens_info": more["lens_info"] or prod.get("lens_info"),
+        "msrp_raw": None,
+        "msrp": None,
+    })
+
+    if msrp_val:
+        rec["msrp_raw"] = f"MSRP ${msrp_val}"
+        rec["msrp"] = msrp_val.replace(",", "")
+
+    return rec
+
+# One evaluate() for everything the parsers read. Mirrors the selector order of
+# _pdp_title/_key_features/_pdp_codes/_msrp_text_from_page; body text only comes
+# back as short label windows when the right column has no priced label.
+_JS_PDP = r"""
+(labels) => {
+  const LEFT = "div[data-test-selector='productDetails_leftColumn']";
+  const RIGHT = "div[data-test-selector='productDetails_rightColumn']";
+  const txt = (el) => (el && el.innerText || "").trim();
+
+  let title = "";
+  for (const s of [LEFT + " h1", "main " + LEFT + " h1", "main h1"]) {
+    title = txt(document.querySelector(s));
+    if (title) break;
+  }
+
+  let features = [];
+  for (const root of [LEFT, "main"]) {
+    features = Array.from(document.querySelectorAll(root + " ul.mainfeatureslist li"))
+      .map(txt).filter(Boolean);
+    if (features.length) break;
+  }
+  if (!features.length) {
+    const leftEl = document.querySelector(LEFT);
+    if (leftEl) {
+      const walk = document.createTreeWalker(leftEl, NodeFilter.SHOW_TEXT);
+      for (let n = walk.nextNode(); n; n = walk.nextNode()) {
+        if (/key features/i.test(n.textContent)) {
+          const parent = n.parentElement && n.parentElement.parentElement;
+          if (parent) features = Array.from(parent.querySelectorAll("li")).map(txt).filter(Boolean);
+          break;
+        }
+      }
+    }
+  }
+
+  const left = document.querySelector(LEFT);
+  const rightEl = document.querySelector(RIGHT);
+  const right = rightEl ? rightEl.innerText : null;
+
+  const esc = (s) => s.replace(/[.*+?^${}()|[\]\\]/g, "\\$&");
+  const priced = (t) => labels.some(l => new RegExp(esc(l) + "\\s*\\$?\\s*[0-9]", "i").test(t));
+  const body_hits = [];
+  if (right === null || !priced(right)) {
+    const body = document.body ? document.body.innerText : "";
+    const lo = body.toLowerCase();
+    for (const l of labels) {
+      for (let k = lo.indexOf(l.toLowerCase()); k >= 0 && body_hits.length < 40;
+           k = lo.indexOf(l.toLowerCase(), k + 1)) {
+        body_hits.push(body.slice(k, k + l.length + 60));
+      }
+    }
+  }
+
+  return {title, features, left: left ? left.innerText : null, right, body_hits};
+}
+"""
+
+# (field, strategy) → count; strategy is "js", "locator" or "none"
+FIELD_SOURCES: Counter = Counter()
+
+async def _extract_pdp(page: Page, brand: str) -> Tuple[str, List[str], str, str, Optional[str]]:
+    """
+    title, features, model, alt_model, msrp in one round trip; any field the
+    payload lacks falls back to its locator-based helper.
+    """
+    labels = brand_cfg(brand).get("msrp_labels", ["MSRP"])
+    try:
+        data = await page.evaluate(_JS_PDP, labels)
+    except Exception as e:
+        if isinstance(e, TimeoutError):
+            raise
+        data = None
+
+    def src(field: str, strategy: str, value):
+        FIELD_SOURCES[(field, strategy if value else "none")] += 1
+        return value
+
+    title = (data or {}).get("title") or ""
+    if title:
+        src("title", "js", title)
+    else:
+        title = src("title", "locator", await _pdp_title(page))
+
+    features = (data or {}).get("features") or []
+    if features:
+        src("features", "js", features)
+    else:
+        features = src("features", "locator", await _key_features(page))
+
+    model, alt_model = _codes_from_text((data or {}).get("left") or "")
+    if model or alt_model:
+        src("codes", "js", True)
+    else:
+        model, alt_model = await _pdp_codes(page)
+        src("codes", "locator", model or alt_model)
+
+    if data is not None:
+        msrp_val = None
+        for txt in (data.get("right"), "\n".join(data.get("body_hits") or [])):
+            if txt:
+                msrp_val = _msrp_from_text(txt, labels)
+                if msrp_val:
+                    break
+        src("msrp", "js", msrp_val)
+    else:
+        msrp_val = src("msrp", "locator", await _msrp_text_from_page(page, brand=brand))
+
+    return title, features, model, alt_model, msrp_val
+
+def report_sources() -> None:
+    """Which extraction strategy produced each PDP field this run."""
+    if not FIELD_SOURCES:
+        return
+    for field in ("title", "features", "codes", "msrp"):
+        parts = [f"{k}={FIELD_SOURCES[(field, k)]}" for k in ("js", "locator", "none")
+                 if FIELD_SOURCES[(field, k)]]
+        print(f"[PDP] {field} sources: {' '.join(parts)}")
+
+async def _archive_page(page: Page, prod: Dict, archive) -> None:
+    """Snapshot the product columns into the HTML archive; never fails the row."""
+    try:
+        labels = brand_cfg(prod.get("brand", "Hanwha")).get("msrp_labels", ["MSRP"])
+        html = await page.evaluate(JS_SNAPSHOT, labels)
+        sha = await asyncio.to_thread(archive.put_blob, html)
+        archive.index(prod.get("url") or "", sha, prod)
+    except Exception as e:
+        print(f"[PDP][WARN] archive failed: {e}")
+
+async def _scrape_pdp(page: Page, prod: Dict, archive=None) -> Dict:
+    """Visit one PDP and build its output row (TIMEOUT/ERROR rows on failure)."""
+    url = prod.get("url") or ""
+    brand = prod.get("brand", "Hanwha")
+    t = time.perf_counter()
+
+    def step(name: str):
+        nonlocal t
+        now = time.perf_counter()
+        metrics.observe("pdp_step_seconds", now - t, step=name, mode="browser")
+        t = now
+
+    try:
+        resp = await page.goto(url, wait_until="domcontentloaded")
+        step("navigation")
+        if resp is not None and (resp.status == 429 or resp.status >= 500):
+            print(f"[PDP][HTTP {resp.status}]")
+            return {**prod, "msrp_raw": f"ERROR: HTTP {resp.status}", "msrp": None}
+        await _dismiss_banners(page)
+        # Light settle: the right column's price block is the last bit we read
+        await ready.wait_ready(page, "pdp")
+        step("ready")
+
+        title, features, model, alt_model, msrp_val = await _extract_pdp(page, brand)
+        step("extract")
+        if archive is not None:
+            await _archive_page(page, prod, archive)
+            t = time.perf_counter()  # archiving is not part of the parse
+        rec = _build_record(prod, title, features, model, alt_model, msrp_val)
+        step("parse")
+        return rec
+
+    except TimeoutError:
+        print("[PDP][TIMEOUT]")
+        return {**prod, "msrp_raw": "TIMEOUT", "msrp": None}
+    except Exception as e:
+        print(f"[PDP][ERROR] {e}")
+        return {**prod, "msrp_raw": f"ERROR: {e}", "msrp": None}
+
+async def fetch_mspp_for_products(ctx: BrowserContext, products: List[Dict], only_missing: bool = False,
+                                  concurrency: int = 1, mode: str = "browser",
+                                  http_concurrency: int = 16, cache=None,
+                                  on_result: Optional[Callable[[int, Dict], None]] = None,
+                                  archive=None, workers: int = 1, headless: bool = True,
+                                  net_policy: bool = True, max_concurrency: int = 0,
+                                  retries: int = 2, http_max_concurrency: int = 0) -> List[Dict]:
     """
     Visit each PDP and extract MSRP + structured attributes directly
     from the HTML (title + Key Features + header codes).
+
+    mode="http" fetches the raw HTML with the saved session cookies first and
+    only sends pages whose markup yields no MSRP through the browser.
+    With a cache.PdpCache, fresh entries are served without a visit and every
+    scraped row is written back (ctx may be None when cache.only is set).
+    ctx may be an auth.LazySession: the browser then starts only on the first
+    real PDP visit.
+    on_result(i, row) fires as soon as row i is final, in completion order.
+    With an archive.HtmlArchive, every scraped page's HTML is archived for --reparse.
+    workers > 1 splits the live visits across that many processes (shards.py),
+    each launching its own browser (headless/net_policy) from storage_state.json.
+    Browser visits start at `concurrency` pages and adapt up to max_concurrency
+    (pacing.RateController); TIMEOUT/ERROR rows are retried up to `retries` times.
+    HTTP requests do the same from http_concurrency up to http_max_concurrency.
     """
-    out: List[Dict] = []
-    page = ctx.new_page()
-    page.set_default_timeout(60000)
-
-    for i, prod in enumerate(products, 1):
-        url = prod.get("url") or ""
-        brand = prod.get("brand", "Hanwha")
-        print(f"[PDP] {i}/{len(products)} → {url}")
-        try:
-            if only_missing and str(prod.get("msrp") or "").strip():
-                out.append(prod)
+    pace = {"max_concurrency": max_concurrency, "retries": retries,
+            "http_max_concurrency": http_max_concurrency}
+
+    async def live(items, skip, cb):
+        if workers > 1:
+            from shards import fetch_sharded
+            await ensure_state(ctx)  # shards launch from storage_state.json
+            return await fetch_sharded(items, workers, skip, concurrency, mode, http_concurrency, cb,
+                                       archive, headless=headless, net_policy=net_policy, **pace)
+        return await _fetch_live(ctx, items, skip, concurrency, mode, http_concurrency, cb, archive, **pace)
+
+    if cache is None:
+        return await live(products, only_missing, on_result)
+
+    out: List[Optional[Dict]] = [None] * len(products)
+    pending: List[int] = []
+    for i, prod in enumerate(products):
+        if only_missing and str(prod.get("msrp") or "").strip():
+            out[i] = prod
+        else:
+            cached = cache.get(prod.get("url") or "")
+            if cached is not None:
+                out[i] = {**prod, **{k: v for k, v in cached.items() if v is not None}}
+            elif cache.only:
+                out[i] = {**prod, "msrp_raw": "CACHE-MISS", "msrp": None}
+            else:
+                pending.append(i)
                 continue
+        if on_result:
+            on_result(i, out[i])
+    print(f"[PDP] {len(products) - len(pending)} row(s) resolved without a visit, {len(pending)} to fetch")
 
-            page.goto(url, wait_until="domcontentloaded")
-            _dismiss_banners(page)
-            # Light settle; DOM is server-rendered for these bits
-            try:
-                page.wait_for_load_state("networkidle", timeout=4000)
-            except TimeoutError:
-                pass
+    def scraped(j: int, rec: Dict):
+        cache.put(rec)
+        if on_result:
+            on_result(pending[j], rec)
+
+    if pending:
+        fetched = await live([products[i] for i in pending], False, scraped)
+        for i, rec in zip(pending, fetched):
+            out[i] = rec
+    return out
+
+async def _fetch_live(ctx: BrowserContext, products: List[Dict], only_missing: bool,
+                      concurrency: int, mode: str, http_concurrency: int,
+                      on_result: Optional[Callable[[int, Dict], None]] = None,
+                      archive=None, max_concurrency: int = 0, retries: int = 2,
+                      http_max_concurrency: int = 0) -> List[Dict]:
+    if mode != "http":
+        return await _fetch_in_browser(ctx, products, only_missing, concurrency, on_result, archive,
+                                       max_concurrency, retries)
+
+    from http_pdp import fetch_mspp_http
+    await ensure_state(ctx)
+    out, fallback = await fetch_mspp_http(products, only_missing=only_missing,
+                                          concurrency=http_concurrency, on_result=on_result,
+                                          archive=archive, max_concurrency=http_max_concurrency,
+                                          retries=retries)
+    if fallback:
+        print(f"[PDP] Browser fallback for {len(fallback)} page(s) without MSRP over HTTP")
+        redo = await _fetch_in_browser(
+            ctx, [products[i] for i in fallback], False, concurrency,
+            (lambda j, rec: on_result(fallback[j], rec)) if on_result else None,
+            archive, max_concurrency, retries,
+        )
+        for i, rec in zip(fallback, redo):
+            out[i] = rec
+    return out
+
+async def _fetch_in_browser(ctx: BrowserContext, products: List[Dict], only_missing: bool,
+                            concurrency: int,
+                            on_result: Optional[Callable[[int, Dict], None]] = None,
+                            archive=None, max_concurrency: int = 0, retries: int = 2) -> List[Dict]:
+    """
+    Pages of the one authenticated context pull from a shared work queue; a
+    RateController decides how many visit at once and how far apart visits start.
+    Failed visits go back on the queue after an exponential backoff until they
+    succeed or run out of attempts. A SessionGuard holds back runs of unpriced
+    rows and, if the session expired, re-logs in and re-queues just those.
+    Rows come back in input order.
+    """
+    total = len(products)
+    out: List[Optional[Dict]] = [None] * total
+    if not total:
+        return out
+    ceiling = max(concurrency, max_concurrency or 2 * concurrency)
+    rate = RateController(start=concurrency, ceiling=ceiling)
+    guard = SessionGuard(ctx)
+    queue: asyncio.Queue = asyncio.Queue()
+    for i, prod in enumerate(products):
+        queue.put_nowait((i, prod, 1))
+    n_workers = max(1, min(ceiling, total))
+    remaining = total
+    retried = 0
+
+    def final(i: int, rec: Dict):
+        nonlocal remaining
+        out[i] = rec
+        if on_result:
+            on_result(i, rec)
+        remaining -= 1
+        if remaining == 0:
+            for _ in range(n_workers):
+                queue.put_nowait(None)  # wake idle workers so they exit
+        settle()
+
+    def settle():
+        # only held rows left (nothing queued, in flight or awaiting retry) → genuine misses
+        if remaining and remaining == len(guard.suspects):
+            for (i, _, _), rec in guard.flush():
+                final(i, rec)
 
-            title = _pdp_title(page)
-            features = _key_features(page)
-            model, alt_model = _pdp_codes(page)
-            basics = _derive_from_title_and_model(title, model)
-            more = _parse_features(features)
-            msrp_val = _msrp_text_from_page(page, brand=brand)
-
-            rec = {**prod}
-            rec.update({
-                "title": title or prod.get("title"),
-                "model": model or prod.get("model"),
-                "alt_model": alt_model or prod.get("alt_model"),
-                "series": basics["series"] or prod.get("series"),
-                "megapixels": basics["megapixels"] or prod.get("megapixels"),
-                "form_factor": basics["form_factor"] or prod.get("form_factor"),
-                "ik_rating": more["ik_rating"] or prod.get("ik_rating"),
-                "ir": True if more["ir"] else (prod.get("ir") or False),
-                "lens_type": more["lens_type"] or prod.get("lens_type"),
-                "lens_info": more["lens_info"] or prod.get("lens_info"),
-                "msrp_raw": None,
-                "msrp": None,
-            })
-
-            if msrp_val:
-                rec["msrp_raw"] = f"MSRP ${msrp_val}"
-                rec["msrp"] = msrp_val.replace(",", "")
-
-            out.append(rec)
-
-        except TimeoutError:
-            print("[PDP][TIMEOUT]")
-            out.append({**prod, "msrp_raw": "TIMEOUT", "msrp": None})
-        except Exception as e:
-            print(f"[PDP][ERROR] {e}")
-            out.append({**prod, "msrp_raw": f"ERROR: {e}", "msrp": None})
-
-        page.wait_for_timeout(120)
-
-    page.close()
+    async def worker():
+        nonlocal retried
+        page = None  # opened on first real visit; --only-missing may skip everything
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                i, prod, attempt = item
+                if only_missing and str(prod.get("msrp") or "").strip():
+                    print(f"[PDP] {i + 1}/{total} → {prod.get('url') or ''}")
+                    final(i, prod)
+                    continue
+                rec = None
+                await guard.gate()
+                await rate.acquire()
+                gen = guard.gen
+                t0 = time.perf_counter()
+                try:
+                    print(f"[PDP] {i + 1}/{total} → {prod.get('url') or ''}"
+                          + (f" (attempt {attempt})" if attempt > 1 else ""))
+                    if page is None:
+                        page = await (await resolve(ctx)).new_page()
+                        netpolicy.tag(page, "pdp")
+                        page.set_default_timeout(60000)
+                        await forensics.attach(page.context)
+                    rec = await _scrape_pdp(page, prod, archive)
+                finally:
+                    took = time.perf_counter() - t0
+                    metrics.observe("pdp_visit_seconds", took, mode="browser", outcome=metrics.outcome(rec))
+                    await rate.release(took, outcome(rec) if rec else "failed")
+                why = forensics.reason(took, rec)
+                if why and page is not None:
+                    await forensics.capture(page, "pdp", why, took, {
+                        "url": prod.get("url") or "", "model": prod.get("model") or "",
+                        "attempt": attempt, "msrp_raw": (rec or {}).get("msrp_raw")})
+                elif page is not None:
+                    forensics.tick(page.context)
+                result = outcome(rec)
+                if result != "ok" and attempt <= retries:
+                    delay = backoff_s(attempt)
+                    retried += 1
+                    print(f"[PDP][RETRY] {i + 1}/{total} {rec.get('msrp_raw')} → attempt {attempt + 1} in {delay:.1f}s")
+                    asyncio.get_running_loop().call_later(delay, queue.put_nowait, (i, prod, attempt + 1))
+                    continue
+                done, requeue = await guard.observe(page, item, rec, gen)
+                for (j, _, _), r in done:
+                    final(j, r)
+                for it in requeue:
+                    queue.put_nowait(it)
+                settle()
+        finally:
+            if page is not None:
+                try:
+                    await forensics.detach(page.context)
+                finally:
+                    try:
+                        await page.close()
+                    except Exception:
+                        pass  # context already gone; don't mask why the worker stopped
+
+    # one failing worker (page/context errors, the SessionGuard giving up) stops
+    # the pass: its siblings are cancelled, not left draining the queue unattended
+    tasks = [asyncio.ensure_future(worker()) for _ in range(n_workers)]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for t in done:
+            if not t.cancelled() and t.exception() is not None:
+                raise t.exception()
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)  # let each close its page
+    rate.report()
+    if guard.refreshes:
+        print(f"[PDP] Session refreshed {guard.refreshes} time(s) during this pass")
+    if retried:
+        left = sum(1 for r in out if outcome(r) != "ok")
+        print(f"[PDP] {retried} retr{'y' if retried == 1 else 'ies'} scheduled; {left} row(s) still failed")
     return out
 # ---------- EOF ----------
\ No newline at end of file
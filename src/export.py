@@ -1,23 +1,403 @@
-﻿# export.py – Excel/CSV + optional suffix for catalog-only snapshots
-import pandas as pd
+﻿# export.py – CSV/XLSX/Parquet/JSONL + optional suffix for catalog-only snapshots
+import csv
+import json
+import math
+import os
+import queue
+import threading
+import time
 from pathlib import Path
 from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from openpyxl import Workbook
 
-def export_results(rows, brand: str, suffix: str = None):
+import metrics
+
+# Common columns (README); rows may carry more, rows missing some get blanks
+COLUMNS = [
+    "brand", "title", "model", "alt_model", "url",
+    "series", "megapixels", "form_factor", "vandal", "ir", "ik_rating",
+    "lens_type", "lens_info", "msrp_raw", "msrp",
+]
+
+def _cell(v):
+    if isinstance(v, float) and math.isnan(v):
+        return None
+    return v
+
+FORMATS = ["csv", "xlsx", "parquet", "jsonl"]
+DEFAULT_FORMATS = ["csv", "xlsx"]
+
+# ---------- Backends ----------
+# Each backend writes <path>.part and is moved to <path> on close; they run on
+# their own threads, fed batches of rows (already reduced to header order).
+# A key first seen mid-run widens the header: widen(columns) arrives in order
+# with the batches (later rows are that much longer) and close() brings the
+# rows written before it up to the final header.
+
+class _CsvBackend:
+    """bom=True starts the file with a UTF-8 BOM, so Excel opens it as UTF-8."""
+    ext = "csv"
+
+    def __init__(self, bom: bool = True):
+        self.encoding = "utf-8-sig" if bom else "utf-8"
+
+    def open(self, tmp: Path, columns: List[str]):
+        self._cols = self._header = list(columns)
+        self._fh = open(tmp, "w", newline="", encoding=self.encoding)
+        self._w = csv.writer(self._fh)
+        self._w.writerow(columns)
+
+    def widen(self, columns: List[str]):
+        self._cols = list(columns)
+
+    def write(self, batch: List[List]):
+        self._w.writerows([["" if v is None else v for v in vals] for vals in batch])
+        self._fh.flush()  # the .part file stays readable mid-run
+
+    def close(self, tmp: Path):
+        self._fh.close()
+        if self._cols == self._header:
+            return
+        # header grew mid-run: rewrite it, padding the earlier (shorter) rows
+        wide = tmp.with_name(tmp.name + ".wide")
+        n = len(self._cols)
+        with open(tmp, "r", newline="", encoding=self.encoding) as src, \
+                open(wide, "w", newline="", encoding=self.encoding) as dst:
+            rows = csv.reader(src)
+            next(rows, None)
+            w = csv.writer(dst)
+            w.writerow(self._cols)
+            w.writerows(r + [""] * (n - len(r)) for r in rows)
+        os.replace(wide, tmp)
+
+    def abandon(self, tmp: Path) -> bool:
+        self._fh.close()
+        return True  # keep the partial CSV
+
+class _XlsxBackend:
+    ext = "xlsx"
+
+    def open(self, tmp: Path, columns: List[str]):
+        self._cols = self._header = list(columns)
+        self._wb = Workbook(write_only=True)  # constant memory: rows stream to a temp file
+        self._ws = self._wb.create_sheet("Sheet1")
+        self._ws.append(columns)
+
+    def widen(self, columns: List[str]):
+        self._cols = list(columns)
+
+    def write(self, batch: List[List]):
+        for vals in batch:
+            self._ws.append(vals)
+
+    def close(self, tmp: Path):
+        self._wb.save(tmp)
+        if self._cols == self._header:
+            return
+        # write-only sheets can't be edited: copy the rows under the final header
+        from openpyxl import load_workbook
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Sheet1")
+        ws.append(self._cols)
+        with open(tmp, "rb") as fh:  # a file object: openpyxl rejects the .part name
+            src = load_workbook(fh, read_only=True)
+            for vals in src.active.iter_rows(min_row=2, values_only=True):
+                ws.append(list(vals))
+            src.close()
+        wide = tmp.with_name(tmp.name + ".wide")
+        wb.save(wide)
+        os.replace(wide, tmp)
+
+    def abandon(self, tmp: Path) -> bool:
+        return False
+
+class _JsonlBackend:
+    ext = "jsonl"
+
+    def open(self, tmp: Path, columns: List[str]):
+        self._cols = columns
+        self._fh = open(tmp, "w", encoding="utf-8")
+
+    def widen(self, columns: List[str]):
+        self._cols = list(columns)  # one object per line: nothing earlier to fix
+
+    def write(self, batch: List[List]):
+        self._fh.write("".join(json.dumps(dict(zip(self._cols, vals)), default=str, ensure_ascii=False) + "\n"
+                               for vals in batch))
+        self._fh.flush()
+
+    def close(self, tmp: Path):
+        self._fh.close()
+
+    def abandon(self, tmp: Path) -> bool:
+        self._fh.close()
+        return True
+
+class _ParquetBackend:
     """
-    Export scraped rows to CSV and XLSX in data/exports.
-    suffix='catalog' will produce e.g. adi_hanwha_catalog_20251007_1605.*
+    Text columns, like the CSV (typed prices live in the history dataset).
+    A widened header starts a new segment file; close() merges the segments,
+    null-filling the columns earlier ones lack.
+    """
+    ext = "parquet"
+
+    def open(self, tmp: Path, columns: List[str]):
+        import pyarrow as pa
+        self._pa = pa
+        self._tmp = tmp
+        self._segments: List[Path] = []
+        self._start(tmp, columns)
+
+    def _start(self, path: Path, columns: List[str]):
+        import pyarrow.parquet as pq
+        self._cols = list(columns)
+        self._schema = self._pa.schema([(c, self._pa.string()) for c in columns])
+        self._w = pq.ParquetWriter(path, self._schema, compression="zstd")
+        self._segments.append(path)
+
+    def widen(self, columns: List[str]):
+        self._w.close()
+        self._start(self._tmp.with_name(f"{self._tmp.name}.{len(self._segments)}"), columns)
+
+    def write(self, batch: List[List]):
+        cols = list(zip(*batch))
+        arrays = [self._pa.array([None if v is None else str(v) for v in col], type=self._pa.string())
+                  for col in cols]
+        self._w.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self, tmp: Path):
+        self._w.close()
+        if len(self._segments) == 1:
+            return
+        import pyarrow.parquet as pq
+        wide = tmp.with_name(tmp.name + ".wide")
+        with pq.ParquetWriter(wide, self._schema, compression="zstd") as w:
+            for seg in self._segments:
+                for t in pq.ParquetFile(seg).iter_batches():
+                    t = self._pa.Table.from_batches([t])
+                    for c in self._cols[t.num_columns:]:
+                        t = t.append_column(c, self._pa.nulls(t.num_rows, self._pa.string()))
+                    w.write_table(t)
+        for seg in self._segments[1:]:
+            seg.unlink(missing_ok=True)
+        os.replace(wide, tmp)
+
+    def abandon(self, tmp: Path) -> bool:
+        self._w.close()
+        for seg in self._segments[1:]:
+            seg.unlink(missing_ok=True)
+        return False
+
+_BACKENDS = {"csv": _CsvBackend, "xlsx": _XlsxBackend, "jsonl": _JsonlBackend, "parquet": _ParquetBackend}
+
+class _Lane:
+    """One backend on its own thread, fed batches through a bounded queue."""
+
+    def __init__(self, backend, path: Path, columns: List[str]):
+        self.backend = backend
+        self.path = path
+        self.tmp = path.with_name(path.name + ".part")
+        self.seconds = 0.0
+        self.error: Optional[BaseException] = None
+        self._q: queue.Queue = queue.Queue(maxsize=64)
+        t0 = time.perf_counter()
+        backend.open(self.tmp, columns)
+        self.seconds += time.perf_counter() - t0
+        self._t = threading.Thread(target=self._run, name=f"export-{backend.ext}", daemon=True)
+        self._t.start()
+
+    def _run(self):
+        while True:
+            batch = self._q.get()
+            if batch is None:
+                return
+            if self.error is not None:
+                continue  # drain so the producer never blocks
+            t0 = time.perf_counter()
+            try:
+                if isinstance(batch, tuple):  # ("columns", header) from ExportSink.write
+                    self.backend.widen(batch[1])
+                else:
+                    self.backend.write(batch)
+            except BaseException as e:
+                self.error = e
+            self.seconds += time.perf_counter() - t0
+
+    def put(self, batch):
+        self._q.put(batch)
+
+    def finish(self):
+        self._q.put(None)
+        self._t.join()
+        if self.error is not None:
+            raise self.error
+        t0 = time.perf_counter()
+        self.backend.close(self.tmp)
+        os.replace(self.tmp, self.path)
+        self.seconds += time.perf_counter() - t0
+
+    def abandon(self) -> bool:
+        if self._t.is_alive():
+            self._q.put(None)
+            self._t.join()
+        try:
+            keep = self.backend.abandon(self.tmp)
+        except Exception:
+            keep = False
+        if not keep:
+            Path(self.tmp).unlink(missing_ok=True)
+        return keep
+
+def parse_formats(spec: str) -> List[str]:
+    """"csv,xlsx,parquet" → validated list, in the order given."""
+    fmts = [f.strip().lower() for f in (spec or "").split(",") if f.strip()]
+    bad = [f for f in fmts if f not in _BACKENDS]
+    if bad or not fmts:
+        raise ValueError(f"--formats: unknown {bad or spec!r}; choose from {', '.join(FORMATS)}")
+    return list(dict.fromkeys(fmts))
+
+class ExportSink:
+    """
+    Streams rows into data/exports/adi_<brand><suffix>_<ts>.<ext> for each of
+    `formats` (csv, xlsx, parquet, jsonl; default csv + xlsx).
+
+    Every format is written by its own thread from batches of `flush_every`
+    rows, each as <name>.part (the CSV/JSONL .part can be opened mid-run); the
+    XLSX goes through openpyxl's write-only mode. close() moves each file to
+    its final name with os.replace, so a finished name is always a complete
+    file, and prints the time spent per format. Memory stays flat however
+    many rows pass through.
+
+    The header is the first row's keys, then any missing COLUMNS; a key first
+    seen in a later row is appended to it, and close() rewrites what was
+    already written to match (earlier rows get blanks), so no value is lost.
+
+    MSRP exports (no suffix) also append to the Parquet price history
+    (history.py); history=False/True overrides that. CSVs start with a UTF-8
+    BOM, except the catalog snapshot (suffix='catalog'), which has always been
+    plain UTF-8; csv_bom=False/True overrides that.
     """
-    Path('data/exports').mkdir(parents=True, exist_ok=True)
-    ts = datetime.now().strftime('%Y%m%d_%H%M')
-    suf = f"_{suffix}" if suffix else "_msrp"
 
-    csv_path = Path(f"data/exports/adi_{brand.lower()}{suf}_{ts}.csv")
-    xls_path = Path(f"data/exports/adi_{brand.lower()}{suf}_{ts}.xlsx")
+    def __init__(self, brand: str, suffix: str = None, flush_every: int = 25, history: bool = None,
+                 formats: Optional[List[str]] = None, csv_bom: bool = None):
+        Path('data/exports').mkdir(parents=True, exist_ok=True)
+        ts = datetime.now().strftime('%Y%m%d_%H%M')
+        suf = f"_{suffix}" if suffix else "_msrp"
+        self.formats = list(formats or DEFAULT_FORMATS)
+        self.paths = {f: Path(f"data/exports/adi_{brand.lower()}{suf}_{ts}.{_BACKENDS[f].ext}")
+                      for f in self.formats}
+        self.flush_every = flush_every
+        self.count = 0
+        self.columns: Optional[List[str]] = None
+        self._lanes: Dict[str, _Lane] = {}
+        self._batch: List[List] = []
+        self._csv_bom = csv_bom if csv_bom is not None else suffix != "catalog"
+        self._history = None
+        if history if history is not None else suffix is None:
+            try:
+                from history import HistoryWriter
+                self._history = HistoryWriter(brand)
+            except ImportError as e:
+                print(f"[EXPORT][WARN] Price history skipped ({e}); pip install pyarrow")
+
+    def _open(self, first: Dict):
+        self.columns = list(first) + [c for c in COLUMNS if c not in first]
+        for f in self.formats:
+            backend = _CsvBackend(bom=self._csv_bom) if f == "csv" else _BACKENDS[f]()
+            self._lanes[f] = _Lane(backend, self.paths[f], self.columns)
+
+    def _send(self):
+        if self._batch:
+            for lane in self._lanes.values():
+                lane.put(self._batch)
+            self._batch = []
+
+    def write(self, row: Dict) -> None:
+        if self.columns is None:
+            self._open(row)
+        extra = [k for k in row if k not in self.columns]
+        if extra:
+            self._send()
+            self.columns = self.columns + extra
+            for lane in self._lanes.values():
+                lane.put(("columns", self.columns))
+            print(f"[EXPORT] New column(s) {extra}; header widened to {len(self.columns)}")
+        self._batch.append([_cell(row.get(c)) for c in self.columns])
+        if self._history is not None:
+            self._history.write(row)
+        self.count += 1
+        if len(self._batch) >= self.flush_every:
+            self._send()
+
+    def write_all(self, rows: Iterable[Dict]) -> "ExportSink":
+        for row in rows:
+            self.write(row)
+        return self
 
-    df = pd.DataFrame(rows)
-    df.to_csv(csv_path, index=False, encoding="utf-8-sig")
-    df.to_excel(xls_path, index=False)
+    def close(self) -> None:
+        """Finalize every format under its timestamped name."""
+        if self.columns is None:
+            self._open({})
+        self._send()
+        failed = None
+        for f, lane in self._lanes.items():
+            try:
+                lane.finish()
+                print(f"Wrote: {lane.path}")
+            except Exception as e:  # finish the other formats, then surface the first failure
+                print(f"[EXPORT][ERROR] {f}: {e}")
+                lane.abandon()
+                failed = failed or e
+        print("[EXPORT] " + ", ".join(f"{f} {lane.seconds:.2f}s" for f, lane in self._lanes.items())
+              + f" ({self.count} rows)")
+        for f, lane in self._lanes.items():
+            metrics.observe("export_seconds", lane.seconds, format=f)
+        metrics.count("export_rows", self.count)
+        if self._history is not None:
+            self._history.close()
+        if failed is not None:
+            raise failed
 
-    print(f"Wrote: {csv_path}")
-    print(f"Wrote: {xls_path}")
+    def abandon(self) -> None:
+        """Stop without finalizing; partial CSV/JSONL stay as <name>.part, history gets nothing."""
+        self._send()
+        for lane in self._lanes.values():
+            if lane.abandon():
+                print(f"[EXPORT] Partial rows kept in {lane.tmp}")
+        self._lanes = {}
+        if self._history is not None:
+            # only a finished export appends to history: --resume replays these rows into a new sink
+            self._history.discard()
+
+class OrderedRows:
+    """Re-sequences (index, row) completions so rows leave in input order."""
+
+    def __init__(self):
+        self.next = 0
+        self._held: Dict[int, Dict] = {}
+
+    def push(self, i: int, row: Dict) -> List[Dict]:
+        if i >= self.next:
+            self._held[i] = row
+        ready = []
+        while self.next in self._held:
+            ready.append(self._held.pop(self.next))
+            self.next += 1
+        return ready
+
+def export_results(rows: Iterable[Dict], brand: str, suffix: str = None, history: bool = None,
+                   formats: Optional[List[str]] = None, csv_bom: bool = None):
+    """
+    Export scraped rows to data/exports in each of `formats` (default CSV + XLSX).
+    suffix='catalog' will produce e.g. adi_hanwha_catalog_20251007_1605.*
+    rows may be any iterable (e.g. a generator); it is consumed once, streaming.
+    history, csv_bom: see ExportSink.
+    """
+    sink = ExportSink(brand, suffix=suffix, history=history, formats=formats, csv_bom=csv_bom)
+    try:
+        sink.write_all(rows)
+    except BaseException:
+        sink.abandon()
+        raise
+    sink.close()
@@ -0,0 +1,213 @@
+﻿# src/forensics.py — opt-in capture of slow / failed pages: HTML, screenshot, network timing,
+# optionally a Playwright trace of the last few seconds; rate-limited, size-capped, written off-thread
+
+import asyncio
+import json
+import re
+import time
+import weakref
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+from config import FORENSICS
+import metrics
+
+# Resource Timing for the current document: navigation entry first, then every
+# subresource, each split into dns / connect / ttfb / download (ms).
+_JS_TIMING = r"""
+() => {
+  const r = (x) => Math.round(x * 10) / 10;
+  const row = (e) => ({
+    name: e.name, type: e.initiatorType || e.entryType, start: r(e.startTime), duration: r(e.duration),
+    dns: r(e.domainLookupEnd - e.domainLookupStart), connect: r(e.connectEnd - e.connectStart),
+    ttfb: e.responseStart ? r(e.responseStart - e.requestStart) : null,
+    download: e.responseEnd && e.responseStart ? r(e.responseEnd - e.responseStart) : null,
+    bytes: e.transferSize || 0, status: e.responseStatus || null,
+  });
+  const nav = performance.getEntriesByType("navigation").map(row);
+  const res = performance.getEntriesByType("resource").map(row);
+  return {url: location.href, ready_state: document.readyState, navigation: nav[0] || null,
+          resources: res.sort((a, b) => b.duration - a.duration)};
+}
+"""
+
+_STATE = {
+    "level": None,         # None (off) | "basic" | "trace"
+    "dir": None,
+    "count": 0,
+    "bytes": 0,
+    "last": 0.0,
+    "skipped": 0,
+    "urls": set(),
+}
+_PENDING = set()
+# context → {"users": n, "lock": Lock, "chunk_t0": float}
+_TRACED: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+def _log(msg: str):
+    print("[FORENSICS]", msg)
+
+def enable(level: Optional[str], out_dir: Optional[str] = None, cfg: Dict = FORENSICS) -> None:
+    """Turn capture on for this process ("basic" or "trace"); None leaves it off."""
+    if not level:
+        return
+    _STATE["level"] = level
+    _STATE["dir"] = Path(out_dir) if out_dir else Path(cfg["dir"]) / datetime.now().strftime("%Y%m%d_%H%M%S")
+    _log(f"Capturing pages slower than {cfg['slow_s']:.0f}s or failed "
+         f"({level}; up to {cfg['max_captures']}, {cfg['min_interval_s']:.0f}s apart) → {_STATE['dir']}")
+
+def enabled() -> bool:
+    return _STATE["level"] is not None
+
+def settings() -> Optional[Dict]:
+    """Level and capture dir, for --workers shards to enable() with (each in its own subdir)."""
+    if _STATE["level"] is None:
+        return None
+    return {"level": _STATE["level"], "dir": str(_STATE["dir"])}
+
+# ---------- Trace chunks ----------
+async def attach(ctx) -> None:
+    """With level "trace": record ctx in rolling chunks (kept only when a capture needs one)."""
+    if _STATE["level"] != "trace":
+        return
+    t = _TRACED.get(ctx)
+    if t is not None:
+        t["users"] += 1
+        return
+    try:
+        await ctx.tracing.start(snapshots=True, screenshots=True, sources=False)
+        await ctx.tracing.start_chunk()
+    except Exception as e:
+        _log(f"Tracing unavailable ({e}); capturing without traces")
+        return
+    _TRACED[ctx] = {"users": 1, "lock": asyncio.Lock(), "chunk_t0": time.monotonic()}
+
+async def drain() -> None:
+    """Wait for captures still being written."""
+    while _PENDING:
+        await asyncio.gather(*list(_PENDING), return_exceptions=True)
+
+async def detach(ctx) -> None:
+    """Wait for queued captures; stop tracing once the last user of ctx is done."""
+    await drain()
+    t = _TRACED.get(ctx)
+    if t is None:
+        return
+    t["users"] -= 1
+    if t["users"] > 0:
+        return
+    async with t["lock"]:
+        try:
+            await ctx.tracing.stop_chunk()
+            await ctx.tracing.stop()
+        except Exception:
+            pass
+    _TRACED.pop(ctx, None)
+
+def tick(ctx, cfg: Dict = FORENSICS) -> None:
+    """Called after each visit: drop the current chunk once it covers more than trace_window_s."""
+    t = _TRACED.get(ctx)
+    if t is None or t["lock"].locked() or time.monotonic() - t["chunk_t0"] < cfg["trace_window_s"]:
+        return
+    _spawn(_roll(ctx, t, None))
+
+async def _roll(ctx, t: Dict, path: Optional[Path]) -> None:
+    async with t["lock"]:
+        try:
+            await ctx.tracing.stop_chunk(path=str(path) if path else None)
+            await ctx.tracing.start_chunk()
+        except Exception as e:
+            _log(f"Trace chunk failed: {e}")
+        t["chunk_t0"] = time.monotonic()
+    if path is not None and path.exists():
+        _STATE["bytes"] += path.stat().st_size
+
+# ---------- Capture ----------
+def reason(latency_s: float, rec: Optional[Dict], cfg: Dict = FORENSICS) -> Optional[str]:
+    """"timeout" / "error" / "slow" when this visit qualifies for a capture, else None."""
+    if _STATE["level"] is None:
+        return None
+    raw = str((rec or {}).get("msrp_raw") or "")
+    if rec is None or raw.startswith("ERROR"):
+        return "error"
+    if raw == "TIMEOUT":
+        return "timeout"
+    if latency_s > cfg["slow_s"]:
+        return "slow"
+    return None
+
+def _admit(url: str, cfg: Dict) -> bool:
+    """Rate limit + caps; one capture per URL per run."""
+    now = time.monotonic()
+    if (_STATE["count"] >= cfg["max_captures"] or now - _STATE["last"] < cfg["min_interval_s"]
+            or _STATE["bytes"] >= cfg["max_total_mb"] * 1024 * 1024 or url in _STATE["urls"]):
+        _STATE["skipped"] += 1
+        return False
+    _STATE["count"] += 1
+    _STATE["last"] = now
+    _STATE["urls"].add(url)
+    return True
+
+def _spawn(coro) -> None:
+    task = asyncio.get_running_loop().create_task(coro)
+    _PENDING.add(task)
+    task.add_done_callback(_PENDING.discard)
+
+async def capture(page, kind: str, why: str, latency_s: float, meta: Dict, cfg: Dict = FORENSICS) -> None:
+    """
+    Grab what only the live page has (HTML, screenshot, timing; each bounded by
+    a short timeout) and hand the writing to a thread. The trace chunk, if
+    tracing, is saved by a background task.
+    """
+    url = meta.get("url") or page.url
+    if _STATE["level"] is None or not _admit(url, cfg):
+        return
+    n = _STATE["count"]
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", url.rsplit("/", 1)[-1])[:40].strip("-") or "page"
+    out = _STATE["dir"] / f"{n:03d}_{kind}_{why}_{slug}"
+
+    async def grab(coro, default=None):
+        try:
+            return await asyncio.wait_for(coro, timeout=3)
+        except Exception:
+            return default
+
+    html = await grab(page.content(), "")
+    timing = await grab(page.evaluate(_JS_TIMING), {})
+    shot = await grab(page.screenshot(type="jpeg", quality=60, full_page=False, timeout=3000))
+
+    ctx = page.context
+    t = _TRACED.get(ctx)
+    if t is not None:
+        out.mkdir(parents=True, exist_ok=True)
+        _spawn(_roll(ctx, t, out / "trace.zip"))
+
+    info = {"kind": kind, "reason": why, "latency_s": round(latency_s, 3),
+            "captured": datetime.now().isoformat(timespec="seconds"), **meta, "timing": timing}
+    _spawn(asyncio.to_thread(_write, out, html, shot, info, cfg))
+    metrics.count("forensic_captures", kind=kind, reason=why)
+    _log(f"{why} {kind} ({latency_s:.1f}s) → {out}")
+
+def _write(out: Path, html: str, shot: Optional[bytes], info: Dict, cfg: Dict) -> None:
+    out.mkdir(parents=True, exist_ok=True)
+    cap = cfg["max_html_kb"] * 1024
+    data = (html or "").encode("utf-8")
+    if len(data) > cap:
+        data = data[:cap]
+        info["html_truncated"] = True
+    (out / "page.html").write_bytes(data)
+    body = json.dumps(info, indent=2, default=str).encode("utf-8")
+    (out / "capture.json").write_bytes(body)
+    size = len(data) + len(body)
+    if shot:
+        (out / "screenshot.jpg").write_bytes(shot)
+        size += len(shot)
+    _STATE["bytes"] += size
+
+def report() -> None:
+    if _STATE["level"] is None or not (_STATE["count"] or _STATE["skipped"]):
+        return
+    _log(f"{_STATE['count']} capture(s), {_STATE['bytes'] / 1024 / 1024:.1f} MB under {_STATE['dir']}"
+         + (f"; {_STATE['skipped']} more throttled by the rate limit / caps" if _STATE["skipped"] else ""))
+# ---------- EOF ----------
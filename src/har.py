@@ -0,0 +1,67 @@
+﻿# src/har.py — --record-har / --replay-har: capture a run's traffic, serve it back with no network
+
+import json
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from playwright.async_api import BrowserContext, Request, Route
+
+import metrics
+import netpolicy
+
+LOG_DIR = Path("data/logs")
+
+# url → requests that found no entry in the recording (replay only)
+MISSING: Counter = Counter()
+_STATE = {"mode": None, "path": None}
+
+def _log(msg: str):
+    print("[HAR]", msg)
+
+async def record(ctx: BrowserContext, path: str) -> None:
+    """Record ctx's traffic into `path` (written when the context closes; .zip keeps bodies as entries)."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    await ctx.route_from_har(path, update=True, update_mode="minimal",
+                             update_content="attach" if path.lower().endswith(".zip") else "embed")
+    _STATE.update(mode="record", path=path)
+    _log(f"Recording network traffic → {path}")
+
+async def replay(ctx: BrowserContext, path: str, net_policy: bool = True) -> None:
+    """
+    Serve ctx's requests from `path`. Routes run newest-first, so the HAR router
+    answers first; a miss falls back to the request policy (blocked types stay
+    blocked) and then to the catch-all, which logs the URL and fails the request
+    as offline — nothing reaches the network.
+    """
+    async def missing(route: Route, request: Request):
+        MISSING[request.url] += 1
+        metrics.count("har_missing", resource=request.resource_type)
+        if len(MISSING) <= 10 and MISSING[request.url] == 1:
+            _log(f"Not in recording: {request.method} {request.url}")
+        await route.abort("internetdisconnected")
+
+    await ctx.route("**/*", missing)
+    if net_policy:
+        await netpolicy.install(ctx)
+    await ctx.route_from_har(path, not_found="fallback")
+    _STATE.update(mode="replay", path=path)
+    _log(f"Replaying {path} (no network)")
+
+def report(write_json: bool = True) -> None:
+    if _STATE["mode"] == "record":
+        _log(f"Recording is written to {_STATE['path']} when the browser closes")
+        return
+    if _STATE["mode"] != "replay":
+        return
+    if not MISSING:
+        _log("Every request was served from the recording")
+        return
+    _log(f"{sum(MISSING.values())} request(s) for {len(MISSING)} URL(s) not in {_STATE['path']}")
+    if write_json:
+        LOG_DIR.mkdir(parents=True, exist_ok=True)
+        path = LOG_DIR / f"har_missing_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        path.write_text(json.dumps({"har": _STATE["path"], "missing": dict(MISSING.most_common())}, indent=2),
+                        encoding="utf-8")
+        _log(f"Missing URLs: {path}")
+# ---------- EOF ----------
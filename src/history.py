@@ -0,0 +1,220 @@
+﻿# src/history.py — MSRP history as a Parquet dataset (brand=<key>/date=<YYYY-MM-DD>/) + price queries
+#
+#   python src/history.py prices  --brand Hanwha --model XNO-6080R [--since 2025-07-01]
+#   python src/history.py changes --brand Hanwha --since 2025-07-01 [--until ...] [--out changes.csv]
+
+import argparse
+import math
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from config import brand_key
+
+HISTORY_DIR = Path("data/history")
+
+_DICT = pa.dictionary(pa.int16(), pa.string())
+SCHEMA = pa.schema([
+    ("run_ts", pa.timestamp("s")),
+    ("brand_label", _DICT),
+    ("model", pa.string()),
+    ("alt_model", pa.string()),
+    ("url", pa.string()),
+    ("title", pa.string()),
+    ("series", _DICT),
+    ("form_factor", _DICT),
+    ("megapixels", pa.float32()),
+    ("ir", pa.bool_()),
+    ("vandal", pa.bool_()),
+    ("ik_rating", _DICT),
+    ("lens_type", _DICT),
+    ("msrp", pa.float64()),
+])
+PARTITIONING = ds.partitioning(pa.schema([("brand", pa.string()), ("date", pa.string())]), flavor="hive")
+
+def _log(msg: str):
+    print("[HISTORY]", msg)
+
+# ---------- Row typing ----------
+def _blank(v) -> bool:
+    return v is None or (isinstance(v, float) and math.isnan(v)) or (isinstance(v, str) and not v.strip())
+
+def _num(v) -> Optional[float]:
+    if _blank(v) or isinstance(v, bool):
+        return None
+    if isinstance(v, (int, float)):
+        return float(v)
+    m = re.search(r"-?\d+(?:\.\d+)?", str(v).replace(",", ""))
+    return float(m.group(0)) if m else None
+
+def _bool(v) -> Optional[bool]:
+    if _blank(v):
+        return None
+    if isinstance(v, str):
+        return v.strip().lower() in ("true", "1", "yes", "y")
+    return bool(v)
+
+def _str(v) -> Optional[str]:
+    return None if _blank(v) else str(v).strip()
+
+def _typed(row: Dict, run_ts: datetime) -> Dict:
+    return {
+        "run_ts": run_ts,
+        "brand_label": _str(row.get("brand")),
+        "model": _str(row.get("model")),
+        "alt_model": _str(row.get("alt_model")),
+        "url": _str(row.get("url")),
+        "title": _str(row.get("title")),
+        "series": _str(row.get("series")),
+        "form_factor": _str(row.get("form_factor")),
+        "megapixels": _num(row.get("megapixels")),
+        "ir": _bool(row.get("ir")),
+        "vandal": _bool(row.get("vandal")),
+        "ik_rating": _str(row.get("ik_rating")),
+        "lens_type": _str(row.get("lens_type")),
+        "msrp": _num(row.get("msrp")),
+    }
+
+# ---------- Writer ----------
+class HistoryWriter:
+    """
+    Appends one run's rows to <root>/brand=<key>/date=<run date>/part-<ts>-<pid>.parquet.
+    The partition brand is the row's BRANDS key (falling back to `brand`).
+    Rows are buffered and written in row groups of `batch`; files are written
+    as _part-… (ignored by readers) and renamed on close.
+    """
+
+    def __init__(self, brand: str, root: Path = HISTORY_DIR, batch: int = 2000):
+        self.brand = brand
+        self.root = Path(root)
+        self.batch = batch
+        self.run_ts = datetime.now().replace(microsecond=0)
+        self.count = 0
+        self._buf: Dict[str, List[Dict]] = {}
+        self._writers: Dict[str, Tuple[pq.ParquetWriter, Path, Path]] = {}
+
+    def write(self, row: Dict) -> None:
+        if _blank(row.get("url")) and _blank(row.get("model")):
+            return
+        part = brand_key(row.get("brand")) or self.brand
+        buf = self._buf.setdefault(part, [])
+        buf.append(_typed(row, self.run_ts))
+        if len(buf) >= self.batch:
+            self._flush(part)
+
+    def _flush(self, part: str) -> None:
+        rows = self._buf.get(part)
+        if not rows:
+            return
+        if part not in self._writers:
+            d = self.root / f"brand={part}" / f"date={self.run_ts:%Y-%m-%d}"
+            d.mkdir(parents=True, exist_ok=True)
+            name = f"part-{self.run_ts:%Y%m%d_%H%M%S}-{os.getpid()}.parquet"
+            tmp = d / f"_{name}"
+            self._writers[part] = (pq.ParquetWriter(tmp, SCHEMA, compression="zstd"), tmp, d / name)
+        self._writers[part][0].write_table(pa.Table.from_pylist(rows, schema=SCHEMA))
+        self.count += len(rows)
+        self._buf[part] = []
+
+    def close(self) -> None:
+        for part in list(self._buf):
+            self._flush(part)
+        for writer, tmp, final in self._writers.values():
+            writer.close()
+            os.replace(tmp, final)
+        if self._writers:
+            _log(f"Appended {self.count} row(s) under {self.root} "
+                 f"({', '.join(sorted(self._writers))}, {self.run_ts:%Y-%m-%d})")
+        self._writers = {}
+
+    def discard(self) -> None:
+        """Drop everything this writer buffered or wrote; nothing reaches the history."""
+        for writer, tmp, _ in self._writers.values():
+            try:
+                writer.close()
+            finally:
+                tmp.unlink(missing_ok=True)
+        self._writers = {}
+        self._buf = {}
+
+# ---------- Queries ----------
+def _dataset(root: Path = HISTORY_DIR) -> ds.Dataset:
+    if not Path(root).exists():
+        raise FileNotFoundError(f"No price history at {root} (written by MSRP exports)")
+    return ds.dataset(root, format="parquet", partitioning=PARTITIONING)
+
+def _scope(brand: Optional[str], since: Optional[str], until: Optional[str]):
+    """Partition filter: only the brand/date directories in range are opened."""
+    f = None
+    def _and(a, b):
+        return b if a is None else a & b
+    if brand:
+        f = _and(f, ds.field("brand") == (brand_key(brand) or brand))
+    if since:
+        f = _and(f, ds.field("date") >= since)
+    if until:
+        f = _and(f, ds.field("date") <= until)
+    return f
+
+def price_history(model: Optional[str] = None, brand: Optional[str] = None,
+                  since: Optional[str] = None, until: Optional[str] = None,
+                  root: Path = HISTORY_DIR):
+    """MSRP observations (date, run_ts, brand, model, alt_model, msrp) in time order; model matches model or alt_model."""
+    f = _scope(brand, since, until)
+    if model:
+        m = model.strip().upper()
+        f = ((ds.field("model") == m) | (ds.field("alt_model") == m)) if f is None else \
+            f & ((ds.field("model") == m) | (ds.field("alt_model") == m))
+    cols = ["date", "run_ts", "brand", "model", "alt_model", "msrp"]
+    df = _dataset(root).to_table(columns=cols, filter=f).to_pandas()
+    return df.sort_values(["model", "run_ts"]).reset_index(drop=True)
+
+def msrp_changes(brand: Optional[str] = None, since: Optional[str] = None,
+                 until: Optional[str] = None, root: Path = HISTORY_DIR):
+    """Models whose MSRP moved within the range: first/last price, delta and number of changes."""
+    f = _scope(brand, since, until)
+    f = ds.field("msrp").is_valid() if f is None else f & ds.field("msrp").is_valid()
+    df = _dataset(root).to_table(columns=["brand", "model", "run_ts", "msrp"], filter=f).to_pandas()
+    if df.empty:
+        return df
+    df = df[df["model"].notna()].sort_values(["brand", "model", "run_ts"])
+    df["changed"] = df.groupby(["brand", "model"])["msrp"].diff().fillna(0) != 0
+    out = df.groupby(["brand", "model"]).agg(
+        first_seen=("run_ts", "first"), first_msrp=("msrp", "first"),
+        last_seen=("run_ts", "last"), last_msrp=("msrp", "last"),
+        changes=("changed", "sum"),
+    ).reset_index()
+    out = out[out["changes"] > 0]
+    out["delta"] = out["last_msrp"] - out["first_msrp"]
+    return out.sort_values(["brand", "delta"]).reset_index(drop=True)
+
+# ---------- CLI ----------
+def main():
+    ap = argparse.ArgumentParser(description="Query the MSRP history dataset")
+    ap.add_argument("command", choices=["prices", "changes"])
+    ap.add_argument("--brand", help="Brand key or label (partition filter)")
+    ap.add_argument("--model", help="Model or SQ code (prices)")
+    ap.add_argument("--since", help="YYYY-MM-DD, inclusive")
+    ap.add_argument("--until", help="YYYY-MM-DD, inclusive")
+    ap.add_argument("--root", default=str(HISTORY_DIR))
+    ap.add_argument("--out", help="Also write the result to this .csv")
+    args = ap.parse_args()
+
+    if args.command == "prices":
+        df = price_history(args.model, args.brand, args.since, args.until, Path(args.root))
+    else:
+        df = msrp_changes(args.brand, args.since, args.until, Path(args.root))
+    print(df.to_string(index=False) if len(df) else "(no rows)")
+    if args.out:
+        df.to_csv(args.out, index=False)
+        print(f"Wrote: {args.out}")
+
+if __name__ == "__main__":
+    main()
+# ---------- EOF ----------
@@ -0,0 +1,372 @@
+﻿# src/http_pdp.py — browserless PDP fetch: storage_state.json cookies + pooled httpx client
+
+import asyncio
+import json
+import os
+import time
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Callable, List, Dict, Optional, Tuple
+
+import httpx
+
+from auth import STATE_FILE
+from config import brand_cfg
+import metrics
+from detail import _build_record, _codes_from_text, _msrp_from_text
+from pacing import RateController, backoff_s
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/140.0.0.0 Safari/537.36"
+)
+
+# Tags whose boundaries become line breaks, roughly what inner_text() does
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt",
+    "fieldset", "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4",
+    "h5", "h6", "header", "hr", "li", "main", "nav", "ol", "p", "pre", "section",
+    "table", "td", "th", "tr", "ul",
+}
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "head"}
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+    "source", "track", "wbr",
+}
+
+def _log(msg: str):
+    print("[HTTP]", msg)
+
+def _squash(txt: str) -> str:
+    return " ".join(txt.split())
+
+# ---------- Markup parser ----------
+class _PdpMarkup(HTMLParser):
+    """
+    One pass over raw PDP HTML collecting the same bits the Playwright
+    path reads: left/right column text, H1s, Key Features bullets, body text.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.body: List[str] = []
+        self.left: List[str] = []
+        self.right: List[str] = []
+        self.left_h1: List[List[str]] = []
+        self.main_h1: List[List[str]] = []
+        self.left_feats: List[str] = []
+        self.main_feats: List[str] = []
+        self.kf_feats: List[str] = []
+        self._kf_root = None
+        # each entry: tag, flags (set), collectors (tuple of lists)
+        self._stack: List[Dict] = [{"tag": "#root", "flags": frozenset(), "collectors": (self.body,)}]
+
+    def handle_starttag(self, tag, attrs):
+        top = self._stack[-1]
+        if tag in ("li", "p") and top["tag"] == tag:
+            self.handle_endtag(tag)
+            top = self._stack[-1]
+        if tag in BLOCK_TAGS:
+            self._emit("\n")
+        if tag in VOID_TAGS:
+            return
+
+        a = dict(attrs)
+        flags = set(top["flags"])
+        collectors = list(top["collectors"])
+        sel = a.get("data-test-selector") or ""
+        if tag in SKIP_TAGS:
+            flags.add("skip")
+        if sel == "productDetails_leftColumn" and "left" not in flags:
+            flags.add("left")
+            collectors.append(self.left)
+        if sel == "productDetails_rightColumn" and "right" not in flags:
+            flags.add("right")
+            collectors.append(self.right)
+        if tag == "main":
+            flags.add("main")
+        if tag == "h1":
+            buf: List[str] = []
+            collectors.append(buf)
+            if "left" in flags:
+                self.left_h1.append(buf)
+            if "main" in flags:
+                self.main_h1.append(buf)
+        if tag == "ul" and "mainfeatureslist" in (a.get("class") or "").split():
+            flags.add("features")
+        entry = {"tag": tag, "flags": frozenset(flags), "collectors": tuple(collectors)}
+        if tag == "li":
+            entry["li"] = []
+            entry["collectors"] += (entry["li"],)
+        self._stack.append(entry)
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._emit("\n")
+
+    def handle_endtag(self, tag):
+        for pos in range(len(self._stack) - 1, 0, -1):
+            if self._stack[pos]["tag"] == tag:
+                break
+        else:
+            return  # stray close tag
+        while len(self._stack) > pos:
+            self._close(self._stack.pop())
+        if tag in BLOCK_TAGS:
+            self._emit("\n")
+
+    def handle_data(self, data):
+        top = self._stack[-1]
+        if "skip" in top["flags"]:
+            return
+        self._emit(data)
+        if self._kf_root is None and "left" in top["flags"] and "key features" in data.lower():
+            # same idea as ":text('Key Features') >> ancestor::*[1]" on the live page
+            self._kf_root = self._stack[-2] if len(self._stack) > 2 else top
+
+    def _emit(self, txt: str):
+        top = self._stack[-1]
+        if "skip" in top["flags"]:
+            return
+        for c in top["collectors"]:
+            c.append(txt)
+
+    def _close(self, entry: Dict):
+        if "li" not in entry:
+            return
+        txt = _squash("".join(entry["li"]))
+        if not txt:
+            return
+        flags = entry["flags"]
+        if "features" in flags:
+            if "left" in flags:
+                self.left_feats.append(txt)
+            if "main" in flags:
+                self.main_feats.append(txt)
+        if self._kf_root is not None and any(e is self._kf_root for e in self._stack):
+            self.kf_feats.append(txt)
+
+def parse_pdp_html(html: str, brand: str = "Hanwha") -> Dict:
+    """Title, Key Features, model/SQ codes and MSRP text from raw PDP markup."""
+    mk = _PdpMarkup()
+    mk.feed(html)
+    mk.close()
+    while len(mk._stack) > 1:
+        mk._close(mk._stack.pop())
+
+    title = ""
+    for group in (mk.left_h1, mk.main_h1):
+        for buf in group:
+            title = _squash("".join(buf))
+            if title:
+                break
+        if title:
+            break
+
+    features = mk.left_feats or mk.main_feats or mk.kf_feats
+    model, alt_model = _codes_from_text("".join(mk.left))
+
+    labels = brand_cfg(brand).get("msrp_labels", ["MSRP"])
+    msrp_val = None
+    for chunks in (mk.right, mk.body):
+        if chunks:
+            msrp_val = _msrp_from_text("".join(chunks), labels)
+            if msrp_val:
+                break
+
+    return {
+        "title": title,
+        "features": features,
+        "model": model,
+        "alt_model": alt_model,
+        "msrp": msrp_val,
+    }
+
+# ---------- Session cookies ----------
+def _load_cookies(state_file: str = STATE_FILE) -> List[Dict]:
+    """Unexpired cookies from a Playwright storage_state file."""
+    p = Path(state_file)
+    if not p.exists():
+        raise FileNotFoundError(f"{state_file} not found; run once in browser mode to log in")
+    now = time.time()
+    cookies = json.loads(p.read_text(encoding="utf-8")).get("cookies", [])
+    return [c for c in cookies if c.get("expires", -1) in (-1, None) or c["expires"] > now]
+
+class _CookieJar:
+    """
+    The state file's cookies, re-read whenever its mtime changes — a mid-run
+    auth.refresh_session (SessionGuard, another shard) rewrites it, and the
+    pool must not keep sending the expired session.
+    """
+
+    def __init__(self, state_file: str = STATE_FILE):
+        self.state_file = state_file
+        self._stamp = self._mtime()
+        self.cookies = _load_cookies(state_file)
+
+    def _mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.state_file).st_mtime_ns
+        except OSError:
+            return None
+
+    def current(self) -> List[Dict]:
+        stamp = self._mtime()
+        if stamp is not None and stamp != self._stamp:
+            try:
+                self.cookies = _load_cookies(self.state_file)
+                self._stamp = stamp
+                _log(f"{self.state_file} changed; reloaded the session cookies")
+            except (OSError, ValueError):
+                pass  # unreadable right now: keep the current cookies, retry next request
+        return self.cookies
+
+def _cookie_header(cookies: List[Dict], host: str, path: str, secure: bool) -> str:
+    pairs = []
+    for c in cookies:
+        dom = (c.get("domain") or "").lstrip(".").lower()
+        if not (host == dom or host.endswith("." + dom)):
+            continue
+        if not path.startswith(c.get("path") or "/"):
+            continue
+        if c.get("secure") and not secure:
+            continue
+        pairs.append(f"{c['name']}={c['value']}")
+    return "; ".join(pairs)
+
+# ---------- Entry point ----------
+async def fetch_mspp_http(products: List[Dict], only_missing: bool = False, concurrency: int = 16,
+                          state_file: str = STATE_FILE, timeout_s: float = 30.0,
+                          on_result: Optional[Callable[[int, Dict], None]] = None,
+                          archive=None, max_concurrency: int = 0,
+                          retries: int = 2) -> Tuple[List[Optional[Dict]], List[int]]:
+    """
+    Fetch PDP HTML over one keep-alive connection pool with the saved session
+    cookies and parse it without a browser.
+
+    Returns (rows, fallback): rows is in input order with None for every index
+    listed in fallback — pages that failed to load or showed no MSRP and need
+    the Playwright path. A 429/5xx is not sent to the browser (the site is
+    pushing back): the row goes back on the queue after backoff_s(attempt),
+    up to `retries` times, then finishes here as "ERROR: HTTP n", like the
+    browser path reports it. on_result(i, row) fires for every row finished here.
+    A RateController starts at `concurrency` requests in flight and adapts
+    between 1 and max_concurrency (default 2x concurrency). Cookies are re-read
+    when state_file changes mid-run (a session refresh).
+    """
+    jar = _CookieJar(state_file)
+    total = len(products)
+    out: List[Optional[Dict]] = [None] * total
+    fallback: List[int] = []
+    if not total:
+        return out, fallback
+    queue: asyncio.Queue = asyncio.Queue()
+    for i, prod in enumerate(products):
+        queue.put_nowait((i, prod, 1))
+    ceiling = max(concurrency, max_concurrency or 2 * concurrency)
+    rate = RateController(start=concurrency, ceiling=ceiling, name="http")
+    n_workers = max(1, min(ceiling, total))
+    remaining = total
+    retried = 0
+
+    def done(i: Optional[int] = None, rec: Optional[Dict] = None):
+        """Row i is settled: finished here (rec) or handed to the browser (rec None)."""
+        nonlocal remaining
+        if rec is None:
+            fallback.append(i)
+        else:
+            out[i] = rec
+            if on_result:
+                on_result(i, rec)
+        remaining -= 1
+        if remaining == 0:
+            for _ in range(n_workers):
+                queue.put_nowait(None)  # wake idle workers so they exit
+
+    limits = httpx.Limits(max_connections=ceiling, max_keepalive_connections=ceiling)
+    headers = {
+        "User-Agent": USER_AGENT,
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "Accept-Language": "en-US,en;q=0.9",
+    }
+
+    async with httpx.AsyncClient(limits=limits, headers=headers, timeout=timeout_s,
+                                 follow_redirects=True) as client:
+        async def worker():
+            nonlocal retried
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                i, prod, attempt = item
+                url = prod.get("url") or ""
+                if only_missing and str(prod.get("msrp") or "").strip():
+                    done(i, prod)
+                    continue
+                print(f"[HTTP] {i + 1}/{total} → {url}" + (f" (attempt {attempt})" if attempt > 1 else ""))
+                await rate.acquire()
+                t0 = time.perf_counter()
+                result = "failed"
+                parsed = None
+                try:
+                    u = httpx.URL(url)
+                    cookie = _cookie_header(jar.current(), u.host, u.path or "/", u.scheme == "https")
+                    resp = await client.get(u, headers={"Cookie": cookie} if cookie else None)
+                    t1 = time.perf_counter()
+                    metrics.observe("pdp_step_seconds", t1 - t0, step="navigation", mode="http")
+                    if resp.status_code == 429 or resp.status_code >= 500:
+                        result = "throttled"
+                        continue
+                    resp.raise_for_status()
+                    parsed = parse_pdp_html(resp.text, brand=prod.get("brand", "Hanwha"))
+                    metrics.observe("pdp_step_seconds", time.perf_counter() - t1, step="parse", mode="http")
+                    result = "ok"
+                except Exception as e:
+                    print(f"[HTTP][ERROR] {e}")
+                    done(i)
+                    continue
+                finally:
+                    took = time.perf_counter() - t0
+                    metrics.observe("pdp_visit_seconds", took, mode="http",
+                                    outcome="error" if result != "ok" else "ok" if parsed["msrp"] else "missing_msrp")
+                    await rate.release(took, result)
+                    if result == "throttled":
+                        if attempt <= retries:
+                            delay = backoff_s(attempt)
+                            retried += 1
+                            print(f"[HTTP][RETRY] {i + 1}/{total} HTTP {resp.status_code} "
+                                  f"→ attempt {attempt + 1} in {delay:.1f}s")
+                            asyncio.get_running_loop().call_later(delay, queue.put_nowait, (i, prod, attempt + 1))
+                        else:
+                            print(f"[HTTP][HTTP {resp.status_code}] {url}")
+                            done(i, {**prod, "msrp_raw": f"ERROR: HTTP {resp.status_code}", "msrp": None})
+                if not parsed["msrp"]:
+                    done(i)
+                    continue
+                rec = _build_record(prod, parsed["title"], parsed["features"],
+                                    parsed["model"], parsed["alt_model"], parsed["msrp"])
+                if archive is not None:
+                    sha = await asyncio.to_thread(archive.put_blob, resp.text)
+                    archive.index(url, sha, prod)
+                done(i, rec)
+
+        # workers exit on the sentinels; one that raises must not leave the rest waiting on the queue
+        tasks = [asyncio.ensure_future(worker()) for _ in range(n_workers)]
+        try:
+            finished, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for t in finished:
+                if not t.cancelled() and t.exception() is not None:
+                    raise t.exception()
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    fallback.sort()
+    rate.report()
+    if retried:
+        left = sum(1 for r in out if r is not None and str(r.get("msrp_raw") or "").startswith("ERROR: HTTP"))
+        print(f"[HTTP] {retried} retr{'y' if retried == 1 else 'ies'} scheduled; {left} row(s) still throttled")
+    _log(f"Parsed {total - len(fallback)}/{total} PDPs; {len(fallback)} need the browser")
+    return out, fallback
+# ---------- EOF ----------
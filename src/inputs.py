@@ -0,0 +1,156 @@
+﻿# src/inputs.py — --from-file loading: needed columns only, cached as a Parquet sidecar
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+SIDECAR_DIR = Path("data/cache/from_file")
+
+# Columns a PDP pass or the export can use; anything else in the file is not read
+COLUMNS = [
+    "brand", "title", "model", "alt_model", "url", "series", "megapixels",
+    "form_factor", "vandal", "ir", "ik_rating", "lens_type", "lens_info",
+    "features", "msrp", "msrp_raw",
+]
+# Always present in the loaded rows (blank when the file lacks them)
+EXPECTED = [
+    "brand", "title", "model", "alt_model", "url", "series", "megapixels",
+    "form_factor", "vandal", "ir", "msrp", "msrp_raw",
+]
+
+def _log(msg: str):
+    print("[FROM-FILE]", msg)
+
+def _file_hash(p: Path) -> str:
+    h = hashlib.sha256()
+    with open(p, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _sidecar(p: Path) -> Path:
+    tag = hashlib.sha1(str(p.resolve()).encode("utf-8")).hexdigest()[:8]
+    return SIDECAR_DIR / f"{p.stem}_{tag}.parquet"
+
+def _read_source(p: Path):
+    import pandas as pd
+    wanted = lambda c: str(c).strip() in COLUMNS
+    if p.suffix.lower() in {".xlsx", ".xls"}:
+        df = pd.read_excel(p, usecols=wanted)
+    elif p.suffix.lower() == ".csv":
+        df = pd.read_csv(p, usecols=wanted)
+    else:
+        raise ValueError("Unsupported file type. Use .xlsx or .csv")
+    df.columns = [str(c).strip() for c in df.columns]
+    return df
+
+def _arrow_safe(df):
+    """
+    Mixed-type columns (e.g. "8MP" next to 8.0) as text, so the frame round-trips
+    through Parquet unchanged. Applied on every fresh read, sidecar or not, so the
+    first run and cached runs hand the PDP pass the same values.
+    """
+    import pyarrow as pa
+    mixed = []
+    for c in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[c], from_pandas=True)
+        except (pa.ArrowException, ValueError):
+            mixed.append(c)
+    if not mixed:
+        return df
+    df = df.copy()
+    for c in mixed:
+        df[c] = df[c].map(lambda v: v if v is None or isinstance(v, str) or v != v else str(v))
+    return df
+
+def _load_cached(p: Path, side: Path, st: os.stat_result):
+    """The sidecar frame if it was built from this exact file, else None."""
+    import pyarrow.parquet as pq
+    if not side.exists():
+        return None
+    try:
+        meta = pq.read_schema(side).metadata or {}
+        if meta.get(b"mtime_ns") == str(st.st_mtime_ns).encode() and meta.get(b"size") == str(st.st_size).encode():
+            return pq.read_table(side).to_pandas()
+        # touched but maybe not changed (copied, re-saved identically): fall back to the content hash
+        if meta.get(b"sha256") == _file_hash(p).encode():
+            return pq.read_table(side).to_pandas()
+    except Exception as e:
+        _log(f"Ignoring unreadable sidecar {side}: {e}")
+    return None
+
+def _save_cached(df, p: Path, side: Path, st: os.stat_result) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    t = pa.Table.from_pandas(df, preserve_index=False)  # df already went through _arrow_safe
+    t = t.replace_schema_metadata({**(t.schema.metadata or {}),
+                                   b"source": str(p.resolve()).encode(),
+                                   b"mtime_ns": str(st.st_mtime_ns).encode(),
+                                   b"size": str(st.st_size).encode(),
+                                   b"sha256": _file_hash(p).encode()})
+    side.parent.mkdir(parents=True, exist_ok=True)
+    tmp = side.with_name(side.name + ".part")
+    pq.write_table(t, tmp, compression="zstd")
+    os.replace(tmp, side)
+
+def load_products(path_str: str, limit: int = 0, only_missing: bool = False) -> Tuple[List[Dict], List[int]]:
+    """
+    Load a prior catalog/MSRP export (xlsx/csv) for the PDP pass.
+
+    Only COLUMNS are parsed, and the parsed frame is cached under
+    data/cache/from_file as a Parquet sidecar keyed by the file's mtime/size
+    and SHA-256, so re-runs on the same workbook skip Excel parsing entirely.
+    `limit` keeps the first N rows. Returns (rows, priced): with only_missing,
+    priced lists the indexes that already carry an MSRP — found with one
+    vectorized mask, so they never enter the PDP loop.
+    """
+    p = Path(path_str)
+    if not p.exists():
+        raise FileNotFoundError(f"--from-file not found: {p}")
+
+    st = p.stat()
+    side = _sidecar(p)
+    try:
+        df = _load_cached(p, side, st)
+    except ImportError:
+        df = None
+    if df is not None:
+        _log(f"Using cached columns from {side}")
+    else:
+        df = _read_source(p)
+        if "url" not in df.columns:
+            raise ValueError("Input file must contain a 'url' column.")
+        try:
+            df = _arrow_safe(df)
+            _save_cached(df, p, side, st)
+        except ImportError:
+            pass  # pyarrow missing: no sidecar, same rows
+        except Exception as e:
+            print(f"[FROM-FILE][WARN] Sidecar not written ({e})")
+
+    if "url" not in df.columns:
+        raise ValueError("Input file must contain a 'url' column.")
+    for col in EXPECTED:
+        if col not in df.columns:
+            df[col] = None
+
+    total = len(df)
+    if limit > 0:
+        df = df.head(limit)
+        _log(f"Limiting to first {limit} products from file.")
+    df = df.reset_index(drop=True)
+
+    priced: List[int] = []
+    if only_missing:
+        msrp = df["msrp"]
+        has = msrp.notna() & (msrp.astype(str).str.strip() != "")
+        priced = has[has].index.tolist()
+
+    rows = df.astype(object).where(df.notna(), None).to_dict(orient="records")
+    _log(f"Loaded {len(rows)} rows from {p}" + (f" (of {total})" if len(rows) != total else "")
+         + (f"; {len(priced)} already priced" if only_missing else ""))
+    return rows, priced
+# ---------- EOF ----------
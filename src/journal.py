@@ -0,0 +1,165 @@
+﻿# src/journal.py — append-only PDP run journal (JSONL) for crash-safe resume
+
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from pacing import outcome
+
+RUNS_DIR = Path("data/runs")
+
+def _log(msg: str):
+    print("[RUN]", msg)
+
+def _read_jsonl(path: Path) -> List[Dict]:
+    """All intact lines; a torn final line from a crash is skipped."""
+    rows = []
+    if not path.exists():
+        return rows
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                continue
+    return rows
+
+class RunJournal:
+    """
+    data/runs/<run_id>/input.jsonl   – the PDP work list, in order (written once; grown with --pipeline)
+    data/runs/<run_id>/journal.jsonl – one line per finished PDP: {"i", "url", "rec"}
+
+    An index may be journaled more than once (a failed row redone after
+    --resume); its last line wins. `done` holds the indexes whose last row
+    succeeded — TIMEOUT / ERROR rows stay pending, so --resume redoes them.
+    Lines are flushed as they are written and fsync'd every `batch` records or
+    `interval_s` seconds, so a crash loses at most one batch of OS-buffered work.
+    """
+
+    def __init__(self, run_id: Optional[str] = None, batch: int = 25, interval_s: float = 5.0):
+        self.run_id = run_id or datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.dir = RUNS_DIR / self.run_id
+        self.batch = batch
+        self.interval_s = interval_s
+        self.products: List[Dict] = []
+        self.meta: Dict = {}
+        self.done: Set[int] = set()
+        self._fh = None
+        self._unsynced = 0
+        self._last_sync = time.time()
+
+    @classmethod
+    def resume(cls, run_id: str, **kw) -> "RunJournal":
+        j = cls(run_id, **kw)
+        if not (j.dir / "input.jsonl").exists():
+            raise FileNotFoundError(f"--resume: no run journal at {j.dir}")
+        j.meta = json.loads((j.dir / "meta.json").read_text(encoding="utf-8"))
+        j.products = _read_jsonl(j.dir / "input.jsonl")
+        failed = 0
+        for i, rec in j.replay():
+            if outcome(rec) == "ok":
+                j.done.add(i)
+            else:
+                failed += 1
+        _log(f"Resuming {j.run_id}: {len(j.done)}/{len(j.products)} PDPs already done"
+             + (f"; {failed} that ended in TIMEOUT/ERROR will be retried" if failed else ""))
+        if j.meta.get("catalog_complete") is False:
+            _log("The catalog was still loading when this run stopped (--pipeline); "
+                 "only the rows listed by then are resumed")
+        j._open()
+        return j
+
+    def start(self, products: List[Dict], meta: Optional[Dict] = None) -> None:
+        """Record the work list of a fresh run."""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.products = list(products)
+        self.meta = {"created": datetime.now().isoformat(timespec="seconds"), **(meta or {})}
+        (self.dir / "meta.json").write_text(json.dumps(self.meta, indent=2), encoding="utf-8")
+        with open(self.dir / "input.jsonl", "w", encoding="utf-8") as f:
+            for prod in self.products:
+                f.write(json.dumps(prod, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        _log(f"Run id {self.run_id} (continue an interrupted run with --resume {self.run_id})")
+        self._open()
+
+    def extend(self, products: List[Dict]) -> None:
+        """Add rows to the work list of a running run (--pipeline: catalog rows as they arrive)."""
+        with open(self.dir / "input.jsonl", "a", encoding="utf-8") as f:
+            for prod in products:
+                f.write(json.dumps(prod, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.products += products
+
+    def update_meta(self, **kw) -> None:
+        self.meta.update(kw)
+        (self.dir / "meta.json").write_text(json.dumps(self.meta, indent=2), encoding="utf-8")
+
+    def _open(self):
+        path = self.dir / "journal.jsonl"
+        torn = False
+        if path.exists() and path.stat().st_size:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+        self._fh = open(path, "a", encoding="utf-8")
+        if torn:
+            self._fh.write("\n")  # keep the next record off the half-written line
+
+    def pending(self) -> Tuple[List[int], List[Dict]]:
+        """Indexes + products that still need a PDP pass."""
+        idx = [i for i in range(len(self.products)) if i not in self.done]
+        return idx, [self.products[i] for i in idx]
+
+    def _entries(self) -> Iterator[Tuple[int, int, Dict]]:
+        """(line number, index, row) for every journaled PDP that matches the work list."""
+        path = self.dir / "journal.jsonl"
+        if not path.exists():
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for n, line in enumerate(f):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn line from a crash
+                i = entry.get("i")
+                if isinstance(i, int) and 0 <= i < len(self.products) \
+                        and (self.products[i].get("url") or "") == (entry.get("url") or ""):
+                    yield n, i, entry["rec"]
+
+    def replay(self) -> Iterator[Tuple[int, Dict]]:
+        """(index, row) of the last journaled PDP per index, streamed from disk (two passes)."""
+        last = {i: n for n, i, _ in self._entries()}
+        for n, i, rec in self._entries():
+            if last[i] == n:
+                yield i, rec
+
+    def append(self, i: int, rec: Dict) -> None:
+        if outcome(rec) == "ok":
+            self.done.add(i)
+        else:
+            self.done.discard(i)
+        self._fh.write(json.dumps({"i": i, "url": rec.get("url"), "rec": rec}, default=str) + "\n")
+        self._fh.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.batch or time.time() - self._last_sync >= self.interval_s:
+            self.sync()
+
+    def sync(self) -> None:
+        if self._fh is None or not self._unsynced:
+            return
+        os.fsync(self._fh.fileno())
+        self._unsynced = 0
+        self._last_sync = time.time()
+
+    def close(self) -> None:
+        if self._fh is None:
+            return
+        self.sync()
+        self._fh.close()
+        self._fh = None
+# ---------- EOF ----------
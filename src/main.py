@@ -1,75 +1,36 @@
 ﻿# src/main.py
 import argparse
-from pathlib import Path
+import asyncio
 from datetime import datetime
+from pathlib import Path
+from typing import List
 from dotenv import load_dotenv
 
-from auth import ensure_login
+from auth import LazySession
 from catalog import fetch_product_list
-from detail import fetch_mspp_for_products
+from detail import fetch_mspp_for_products, report_sources
+from cache import PdpCache
+from journal import RunJournal
+from export import ExportSink, OrderedRows, export_results, parse_formats
+from archive import ARCHIVE_DIR, HtmlArchive, reparse
+from inputs import load_products
+from config import BRANDS, FORENSICS, PIPELINE
+import forensics
+import har
+import metrics
+import netpolicy
+import ready
 
 
-def _export_catalog_snapshot(rows, brand: str):
+def _export_catalog_snapshot(rows, brand: str, formats=None):
     """Always drop a catalog snapshot so you can validate counts/columns."""
-    try:
-        import pandas as pd
-    except ImportError:
-        raise RuntimeError("pandas is required. Run: pip install -r requirements.txt")
-
-    Path("data/exports").mkdir(parents=True, exist_ok=True)
-    ts = datetime.now().strftime("%Y%m%d_%H%M")
-    csv_path = Path(f"data/exports/adi_{brand.lower()}_catalog_{ts}.csv")
-    xls_path = Path(f"data/exports/adi_{brand.lower()}_catalog_{ts}.xlsx")
-    df = pd.DataFrame(rows)
-    df.to_csv(csv_path, index=False)
-    df.to_excel(xls_path, index=False)
-    print(f"Wrote: {csv_path}")
-    print(f"Wrote: {xls_path}")
-
-
-def _export_results(rows, brand: str):
-    """Prefer export.py; fall back to catalog-style writer if not available."""
-    try:
-        from export import export_results
-        export_results(rows, brand=brand)
-    except Exception as e:
-        print(f"[WARN] export.py not used ({e}). Writing generic export.")
-        _export_catalog_snapshot(rows, brand=brand)
-
-
-def _load_products_from_file(path_str: str):
-    """Load prior catalog (xlsx/csv) and return list[dict] for PDP pass."""
-    import pandas as pd
-    p = Path(path_str)
-    if not p.exists():
-        raise FileNotFoundError(f"--from-file not found: {p}")
-
-    if p.suffix.lower() in {".xlsx", ".xls"}:
-        df = pd.read_excel(p)
-    elif p.suffix.lower() == ".csv":
-        df = pd.read_csv(p)
-    else:
-        raise ValueError("Unsupported file type. Use .xlsx or .csv")
-
-    if "url" not in df.columns:
-        raise ValueError("Input file must contain a 'url' column.")
-
-    expected = [
-        "brand","title","model","alt_model","url","series","megapixels",
-        "form_factor","vandal","ir","msrp","msrp_raw"
-    ]
-    for col in expected:
-        if col not in df.columns:
-            df[col] = None
-
-    rows = df.to_dict(orient="records")
-    print(f"[FROM-FILE] Loaded {len(rows)} rows from {p}")
-    return rows
+    export_results(rows, brand=brand, suffix="catalog", formats=formats)
 
 
 def _parse_args():
     p = argparse.ArgumentParser()
-    p.add_argument("--brand", required=True, help="Hanwha | Axis | Avigilon | all")
+    p.add_argument("--brand", required=True,
+                   help="A BRANDS key from config.py (e.g. Hanwha) | all, or a comma list (brands run in parallel)")
     p.add_argument("--headless", action="store_true", help="Run browser headless")
     p.add_argument("--keep-open", action="store_true",
                    help="Keep browser open after run (useful for manual login)")
@@ -82,68 +43,375 @@ def _parse_args():
                    help="When using --from-file, skip writing a new catalog snapshot")
     p.add_argument("--limit", type=int, default=0,
                    help="Process only the first N items (useful for quick tests)")
-    return p.parse_args()
+    p.add_argument("--catalog-mode", choices=["click", "pages", "api"], default="click",
+                   help="pages: fetch each results page by URL in parallel instead of clicking Show More; "
+                        "api: build rows from the product-search JSON and page through it unrendered")
+    p.add_argument("--pipeline", action="store_true",
+                   help="Start PDP visits on the first results page's rows instead of after the whole "
+                        "catalog; the catalog snapshot is written alongside (best with --catalog-mode "
+                        "pages/api; not with --workers)")
+    p.add_argument("--catalog-concurrency", type=int, default=3,
+                   help="Results pages (or API pages) loaded at once in --catalog-mode pages/api (default 3)")
+    p.add_argument("--concurrency", type=int, default=4,
+                   help="PDP pages visited in parallel within the logged-in browser (default 4)")
+    p.add_argument("--max-concurrency", type=int, default=0,
+                   help="Ceiling the adaptive PDP pool may grow to while pages stay fast "
+                        "(default 2x --concurrency; it backs off on 429/5xx, timeouts, slow pages)")
+    p.add_argument("--retries", type=int, default=2,
+                   help="Re-visit TIMEOUT/ERROR PDPs up to N more times in the same run, "
+                        "with exponential backoff (default 2)")
+    p.add_argument("--workers", type=int, default=1,
+                   help="Split PDP visits across N processes, each with its own browser "
+                        "(--concurrency pages each; default 1 = in-process)")
+    p.add_argument("--pdp-mode", choices=["browser", "http"], default="browser",
+                   help="http: fetch PDP HTML with storage_state.json cookies, browser only for misses")
+    p.add_argument("--http-concurrency", type=int, default=16,
+                   help="Parallel HTTP requests to start with in --pdp-mode http (default 16)")
+    p.add_argument("--http-max-concurrency", type=int, default=0,
+                   help="Ceiling the adaptive HTTP pool may grow to while responses stay healthy "
+                        "(default 2x --http-concurrency)")
+    p.add_argument("--cold", action="store_true",
+                   help="Launch a fresh browser even if browser_server.py is running")
+    p.add_argument("--no-net-policy", action="store_true",
+                   help="Load every image/font/tracker instead of applying config.NET_POLICY")
+    p.add_argument("--cache-ttl", type=float, default=0,
+                   help="Serve PDP results cached less than N hours ago (default 0: always re-visit)")
+    p.add_argument("--cache-only", action="store_true",
+                   help="Never visit PDPs; use cached results of any age (misses → CACHE-MISS)")
+    p.add_argument("--refresh", action="store_true",
+                   help="Ignore cached PDP results and re-visit everything (cache is still updated)")
+    p.add_argument("--cache-max-age", type=float, default=30,
+                   help="Evict cache entries not confirmed for N days (default 30)")
+    p.add_argument("--archive-html", action="store_true",
+                   help=f"Save each scraped PDP's HTML (gzip, content-addressed) under {ARCHIVE_DIR}")
+    p.add_argument("--reparse", metavar="ARCHIVE",
+                   help="No browser: re-run the PDP parsers over an --archive-html directory and export")
+    p.add_argument("--formats", type=parse_formats, default="csv,xlsx",
+                   help="Export formats, comma-separated: csv, xlsx, parquet, jsonl (default csv,xlsx); "
+                        "written in parallel")
+    p.add_argument("--metrics-prom", metavar="PATH",
+                   help="Also write the run metrics as a Prometheus textfile (node_exporter textfile "
+                        "collector), e.g. /var/lib/node_exporter/textfile/adi_msrp.prom")
+    p.add_argument("--forensics", nargs="?", const="basic", choices=["basic", "trace"],
+                   help="Save HTML, a screenshot and network timings of PDP/results pages that are slow "
+                        "or end in TIMEOUT/ERROR (rate-limited, see FORENSICS in config.py); "
+                        "'--forensics trace' also keeps a Playwright trace of the seconds before")
+    p.add_argument("--forensics-slow-s", type=float, metavar="S",
+                   help="Latency that counts as slow for --forensics (default FORENSICS['slow_s'])")
+    p.add_argument("--resume", metavar="RUN_ID",
+                   help="Continue an interrupted PDP phase from data/runs/<RUN_ID>/ (skips the catalog); "
+                        "comma-separate one run id per brand")
+    rec = p.add_mutually_exclusive_group()
+    rec.add_argument("--record-har", metavar="FILE",
+                     help="Record the browser's network traffic for this run into FILE (.har, or .zip "
+                          "with bodies as separate entries); launches a fresh browser and skips the PDP cache")
+    rec.add_argument("--replay-har", metavar="FILE",
+                     help="Serve every browser request from a --record-har FILE, no network or login; "
+                          "requests missing from it fail and are listed at the end")
+    args = p.parse_args()
+    if args.record_har or args.replay_har:
+        # HAR routing covers pages of the one browser context; HTTP clients and shard browsers bypass it
+        if args.pdp_mode == "http" or args.catalog_mode == "api" or args.workers > 1:
+            p.error("--record-har/--replay-har need --pdp-mode browser, --catalog-mode click|pages "
+                    "and --workers 1")
+        if args.record_har and args.keep_open:
+            # route_from_har(update=True) writes the archive only when the context closes
+            p.error("--record-har can't be combined with --keep-open (the HAR is written when the browser closes)")
+        if args.replay_har and not Path(args.replay_har).exists():
+            p.error(f"--replay-har: {args.replay_har} not found")
+    return args
 
 
-def main():
-    load_dotenv()
-    args = _parse_args()
-    Path("data").mkdir(parents=True, exist_ok=True)
+def _brands(arg: str) -> List[str]:
+    """'all' | 'Hanwha' | 'Hanwha,<other key>' → BRANDS keys (case-insensitive)."""
+    if arg.strip().lower() == "all":
+        return list(BRANDS)
+    keys = {k.lower(): k for k in BRANDS}
+    out = []
+    for name in (b.strip() for b in arg.split(",") if b.strip()):
+        if name.lower() not in keys:
+            raise ValueError(f"Unknown brand '{name}'. Known: {', '.join(BRANDS)} or all")
+        out.append(keys[name.lower()])
+    return out
+
+
+def _journal_rows(journal: RunJournal):
+    """A finished journal's rows in input order, streamed."""
+    order = OrderedRows()
+    for i, rec in journal.replay():
+        yield from order.push(i, rec)
+
 
-    # launch browser & authenticated session
-    p, ctx = ensure_login(headless=args.headless)
+def _pdp_opts(args, cache, archive) -> dict:
+    """fetch_mspp_for_products keywords shared by the sequential and pipelined runs."""
+    return dict(
+        only_missing=args.only_missing,
+        concurrency=args.concurrency,
+        mode=args.pdp_mode,
+        http_concurrency=args.http_concurrency,
+        cache=cache,
+        archive=archive,
+        workers=args.workers,
+        headless=args.headless,
+        net_policy=not args.no_net_policy,
+        max_concurrency=args.max_concurrency,
+        retries=args.retries,
+        http_max_concurrency=args.http_max_concurrency,
+    )
 
+
+async def _run_brand_pipelined(args, session: LazySession, brand: str, cache, archive):
+    """
+    --pipeline: catalog and PDP phases overlap. Rows go from each extracted
+    results/API page into a bounded queue (PIPELINE) and into the catalog
+    snapshot; the PDP loop takes whatever has arrived (up to batch_rows) per
+    pass. The journal's work list grows with every batch, so --resume works.
+    """
+    ctx = await session.context()
+    journal = RunJournal(f"{datetime.now():%Y%m%d_%H%M%S}_{brand.lower()}")
+    journal.start([], meta={"brand": brand, "from_file": None, "pipeline": True, "catalog_complete": False})
+    snapshot = ExportSink(brand, suffix="catalog", formats=args.formats)
+    sink = ExportSink(brand, formats=args.formats)
+    order = OrderedRows()
+    rows: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE["queue_rows"])
+    listed = 0
+
+    async def arrived(batch):
+        nonlocal listed
+        if args.limit > 0:
+            batch = batch[: max(0, args.limit - listed)]
+        listed += len(batch)
+        snapshot.write_all({**row, "msrp": row.get("msrp", None)} for row in batch)
+        for row in batch:
+            await rows.put(row)  # blocks the catalog while the PDP pass is queue_rows behind
+
+    async def catalog():
+        try:
+            with metrics.phase("catalog", brand=brand):
+                await fetch_product_list(ctx, brand=brand, mode=args.catalog_mode,
+                                         concurrency=args.catalog_concurrency, on_rows=arrived)
+            journal.update_meta(catalog_complete=True)
+            if args.limit > 0 and listed >= args.limit:
+                print(f"[MAIN] {brand}: limited to first {args.limit} products.")
+        finally:
+            await rows.put(None)
+
+    def scraped(i, rec):
+        metrics.count("pdp_rows", brand=brand, outcome=metrics.outcome(rec))
+        journal.append(i, rec)
+        sink.write_all(order.push(i, rec))
+
+    async def pdp():
+        opts = _pdp_opts(args, cache, archive)
+        with metrics.phase("pdp", brand=brand):
+            done = False
+            while not done:
+                batch = [await rows.get()]
+                while len(batch) < PIPELINE["batch_rows"] and not rows.empty():
+                    batch.append(rows.get_nowait())
+                if batch[-1] is None:
+                    batch.pop()
+                    done = True
+                if not batch:
+                    continue
+                base = len(journal.products)
+                journal.extend(batch)
+                print(f"[MAIN] {brand}: PDP batch of {len(batch)} (rows {base + 1}-{base + len(batch)}, "
+                      f"{rows.qsize()} queued)")
+                await fetch_mspp_for_products(session, batch,
+                                              on_result=lambda j, rec, base=base: scraped(base + j, rec),
+                                              **opts)
+
+    tasks = [asyncio.create_task(catalog()), asyncio.create_task(pdp())]
     try:
-        # Route A: fresh catalog scrape
-        if not args.from_file:
-            products = fetch_product_list(ctx, brand=args.brand)
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        snapshot.abandon()
+        sink.abandon()
+        raise
+    finally:
+        journal.close()
+    with metrics.phase("export", brand=brand):
+        snapshot.close()
+        sink.close()
+    print(f"[MAIN] {brand}: done. Items: {sink.count}")
+    return journal.products, journal
+
+
+async def _run_brand(args, session: LazySession, brand: str, cache, archive, journal: RunJournal = None):
+    """
+    Catalog → PDP → export for one brand on the shared session (its own pages).
+    Returns (catalog rows, journal); journal is None for --catalog-only.
+    """
+    priced = []  # --from-file --only-missing: rows that already have an MSRP
+
+    # Route 0: continue an interrupted run from its journal
+    if journal is not None:
+        products = journal.products
+
+    # Route A: fresh catalog scrape (overlapped with the PDP pass under --pipeline)
+    elif not args.from_file:
+        if args.pipeline and not args.catalog_only:
+            return await _run_brand_pipelined(args, session, brand, cache, archive)
+        ctx = await session.context()
+        with metrics.phase("catalog", brand=brand):
+            products = await fetch_product_list(ctx, brand=brand, mode=args.catalog_mode,
+                                                concurrency=args.catalog_concurrency)
+
+        if args.limit > 0:
+            products = products[: args.limit]
+            print(f"[MAIN] {brand}: limiting to first {args.limit} products.")
+
+        _export_catalog_snapshot(
+            ({**row, "msrp": row.get("msrp", None)} for row in products),
+            brand=brand,
+            formats=args.formats,
+        )
 
-            if args.limit > 0:
-                products = products[: args.limit]
-                print(f"[MAIN] Limiting to first {args.limit} products.")
+        if args.catalog_only:
+            print(f"[MAIN] {brand}: catalog-only run complete. Skipping MSRP phase.")
+            return products, None
 
+    # Route B: reuse existing file
+    else:
+        with metrics.phase("load_file", brand=brand):
+            products, priced = load_products(args.from_file, limit=args.limit, only_missing=args.only_missing)
+
+        if not args.pdp_only:
             _export_catalog_snapshot(
-                [{**row, "msrp": row.get("msrp", None)} for row in products],
-                brand=args.brand,
+                ({**row, "msrp": row.get("msrp", None)} for row in products),
+                brand=brand,
+                formats=args.formats,
             )
 
-            if args.catalog_only:
-                print("[MAIN] Catalog-only run complete. Skipping MSRP phase.")
-                return
-
-        # Route B: reuse existing file
-        else:
-            products = _load_products_from_file(args.from_file)
-
-            if args.limit > 0:
-                products = products[: args.limit]
-                print(f"[MAIN] Limiting to first {args.limit} products from file.")
-
-            if not args.pdp_only:
-                _export_catalog_snapshot(
-                    [{**row, "msrp": row.get("msrp", None)} for row in products],
-                    brand=args.brand,
-                )
-
-        # MSRP phase
-        results = fetch_mspp_for_products(
-            ctx,
-            products,
-            only_missing=args.only_missing,
+    if journal is None:
+        journal = RunJournal(f"{datetime.now():%Y%m%d_%H%M%S}_{brand.lower()}")
+        journal.start(products, meta={"brand": brand, "from_file": args.from_file})
+
+    # MSRP phase — every finished row goes to the journal as it completes and,
+    # once all rows before it are done, straight into the export files
+    sink = ExportSink(brand, formats=args.formats)
+    order = OrderedRows()
+    for i, rec in journal.replay():
+        if i in journal.done:  # TIMEOUT/ERROR rows are redone below and written then
+            sink.write_all(order.push(i, rec))
+
+    def finished(i, rec):
+        journal.append(i, rec)
+        sink.write_all(order.push(i, rec))
+
+    for i in priced:
+        finished(i, products[i])  # kept as-is, never queued for a PDP visit
+
+    idx, todo = journal.pending()
+
+    def scraped(j, rec):
+        metrics.count("pdp_rows", brand=brand, outcome=metrics.outcome(rec))
+        finished(idx[j], rec)
+
+    try:
+        with metrics.phase("pdp", brand=brand):
+            await fetch_mspp_for_products(session, todo, on_result=scraped, **_pdp_opts(args, cache, archive))
+    except BaseException:
+        sink.abandon()
+        raise
+    finally:
+        journal.close()
+    with metrics.phase("export", brand=brand):
+        sink.close()
+    print(f"[MAIN] {brand}: done. Items: {sink.count}")
+    return products, journal
+
+
+async def _run(args):
+    if args.reparse:
+        rows = reparse(Path(args.reparse))
+        export_results(rows, brand=args.brand, suffix="reparse", formats=args.formats)
+        print(f"[MAIN] Done. Items: {len(rows)}")
+        return
+
+    # one job per brand; --resume takes one run id per brand, --from-file is one job
+    if args.resume:
+        journals = [RunJournal.resume(r.strip()) for r in args.resume.split(",") if r.strip()]
+        jobs = [(j.meta.get("brand") or args.brand, j) for j in journals]
+    elif args.from_file:
+        jobs = [(args.brand, None)]
+    else:
+        jobs = [(b, None) for b in _brands(args.brand)]
+
+    if args.pipeline and args.workers > 1:
+        print("[MAIN] --pipeline runs PDP batches in-process; ignoring --workers")
+        args.workers = 1
+
+    # a recording must see every PDP (no cache hits); a replay must not write replayed rows to the cache
+    cache = None if args.replay_har else PdpCache(
+        ttl_s=args.cache_ttl * 3600, refresh=args.refresh or bool(args.record_har), only=args.cache_only,
+        max_age_s=args.cache_max_age * 86400)
+
+    # authenticated browser, launched by the first phase that needs one
+    har_mode = ("record", args.record_har) if args.record_har else \
+        ("replay", args.replay_har) if args.replay_har else None
+    session = LazySession(headless=args.headless, net_policy=not args.no_net_policy,
+                          warm=not args.cold and not args.record_har, har=har_mode)
+
+    archive = HtmlArchive() if args.archive_html else None
+    if args.forensics_slow_s is not None:
+        FORENSICS["slow_s"] = args.forensics_slow_s
+    forensics.enable(args.forensics)
+    try:
+        if len(jobs) > 1:
+            print(f"[MAIN] Brands in parallel: {', '.join(b for b, _ in jobs)}")
+        results = await asyncio.gather(
+            *(_run_brand(args, session, b, cache, archive, journal=j) for b, j in jobs),
+            return_exceptions=True,
         )
-        _export_results(results, brand=args.brand)
-        print(f"[MAIN] Done. Items: {len(results)}")
+        ok, failed = [], []
+        for (brand, _), res in zip(jobs, results):
+            if isinstance(res, BaseException):
+                print(f"[MAIN][ERROR] {brand}: {res!r}")
+                failed.append(res)
+            else:
+                ok.append(res)
+
+        # combined files across brands (finished brands only)
+        if len(jobs) > 1 and ok:
+            if args.catalog_only:
+                export_results((row for products, _ in ok for row in products),
+                               brand="all", suffix="catalog", formats=args.formats)
+            else:
+                export_results((row for _, j in ok for row in _journal_rows(j)), brand="all",
+                               history=False, formats=args.formats)  # per-brand sinks already appended these
+        if failed:
+            raise failed[0]
 
-        if args.keep_open:
+        if args.keep_open and session.started:
             print("[MAIN] Browser left open as requested (--keep-open).")
             input("Press Enter to close browser...")
 
     finally:
+        if archive is not None:
+            archive.close()
+        if cache is not None:
+            cache.close()
+        netpolicy.report()
+        ready.report()
+        report_sources()
+        await forensics.drain()
+        forensics.report()
+        metrics.write(args.metrics_prom)
         if not args.keep_open:
-            try:
-                ctx.close()
-            finally:
-                p.stop()
+            await session.close()
+        har.report()
+
+
+def main():
+    load_dotenv()
+    args = _parse_args()
+    Path("data").mkdir(parents=True, exist_ok=True)
+    asyncio.run(_run(args))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,175 @@
+﻿# src/metrics.py — run metrics: phase durations, per-PDP step timings, outcome counts and
+# histograms → JSON run summary (data/logs) + optional Prometheus textfile
+
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+LOG_DIR = Path("data/logs")
+
+# Histogram upper bounds in seconds (Prometheus style, cumulative; +Inf is implied)
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+OUTCOMES = ("ok", "missing_msrp", "timeout", "error")
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+# (name, labels) → count / list of observed seconds
+COUNTS: Counter = Counter()
+SAMPLES: Dict[Key, List[float]] = defaultdict(list)
+PHASES: List[Dict] = []
+_STARTED = time.time()
+
+def _log(msg: str):
+    print("[METRICS]", msg)
+
+def _key(name: str, labels: Dict) -> Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def outcome(row: Optional[Dict]) -> str:
+    """ok / missing_msrp / timeout / error for a finished PDP row."""
+    if not row:
+        return "error"
+    raw = str(row.get("msrp_raw") or "")
+    if raw == "TIMEOUT":
+        return "timeout"
+    if raw.startswith("ERROR"):
+        return "error"
+    return "ok" if str(row.get("msrp") or "").strip() else "missing_msrp"
+
+# ---------- Recording ----------
+def count(name: str, n: int = 1, **labels) -> None:
+    COUNTS[_key(name, labels)] += n
+
+def observe(name: str, seconds: float, **labels) -> None:
+    SAMPLES[_key(name, labels)].append(seconds)
+
+@contextmanager
+def phase(name: str, **labels):
+    """Time a block (sync or inside a coroutine) as one run phase."""
+    t0 = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        secs = time.perf_counter() - t0
+        PHASES.append({"phase": name, **{k: str(v) for k, v in labels.items()},
+                       "seconds": round(secs, 3), "ok": ok})
+        observe("phase_seconds", secs, phase=name, **labels)
+
+def snapshot() -> Dict:
+    """Counts and samples as plain lists (sent from --workers shards to the parent)."""
+    return {"counts": [[n, list(map(list, l)), c] for (n, l), c in COUNTS.items()],
+            "samples": [[n, list(map(list, l)), v] for (n, l), v in SAMPLES.items()]}
+
+def merge(snap: Dict) -> None:
+    for n, l, c in snap.get("counts", []):
+        COUNTS[(n, tuple(map(tuple, l)))] += c
+    for n, l, v in snap.get("samples", []):
+        SAMPLES[(n, tuple(map(tuple, l)))].extend(v)
+
+# ---------- Summaries ----------
+def _pct(vals: List[float], q: float) -> float:
+    return vals[min(len(vals) - 1, int(q * len(vals)))]
+
+def _hist(vals: List[float]) -> Dict:
+    vals = sorted(vals)
+    return {
+        "count": len(vals), "sum": round(sum(vals), 3),
+        "p50": round(_pct(vals, 0.5), 3), "p95": round(_pct(vals, 0.95), 3), "max": round(vals[-1], 3),
+        "buckets": {str(b): sum(1 for v in vals if v <= b) for b in BUCKETS},
+    }
+
+def summary() -> Dict:
+    """Run summary: phases, per-brand PDP throughput and outcome mix, counters, histograms."""
+    brands: Dict[str, Dict] = {}
+    for (name, labels), c in COUNTS.items():
+        if name != "pdp_rows":
+            continue
+        lab = dict(labels)
+        b = brands.setdefault(lab.get("brand", ""), {o: 0 for o in OUTCOMES})
+        b[lab["outcome"]] = b.get(lab["outcome"], 0) + c
+    for brand, b in brands.items():
+        rows = sum(b[o] for o in OUTCOMES)
+        secs = sum(p["seconds"] for p in PHASES if p["phase"] == "pdp" and p.get("brand") == brand)
+        b.update(rows=rows, seconds=round(secs, 3),
+                 rows_per_s=round(rows / secs, 3) if secs else None,
+                 miss_ratio=round(b["missing_msrp"] / rows, 4) if rows else None,
+                 fail_ratio=round((b["timeout"] + b["error"]) / rows, 4) if rows else None)
+    return {
+        "started": datetime.fromtimestamp(_STARTED).isoformat(timespec="seconds"),
+        "seconds": round(time.time() - _STARTED, 3),
+        "phases": PHASES,
+        "pdp": brands,
+        "counters": [{"name": n, **dict(l), "value": c} for (n, l), c in sorted(COUNTS.items())],
+        "histograms": [{"name": n, **dict(l), **_hist(v)} for (n, l), v in sorted(SAMPLES.items()) if v],
+    }
+
+# ---------- Prometheus textfile ----------
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+def prometheus(summ: Dict, prefix: str = "adi") -> str:
+    """Text exposition format for node_exporter's textfile collector."""
+    out: List[str] = []
+    typed = set()
+
+    def metric(name: str, kind: str):
+        if name not in typed:
+            typed.add(name)
+            out.append(f"# TYPE {prefix}_{name} {kind}")
+
+    for (n, l), c in sorted(COUNTS.items()):
+        metric(f"{n}_total", "counter")
+        out.append(f"{prefix}_{n}_total{_labels(l)} {c}")
+    for (n, l), vals in sorted(SAMPLES.items()):
+        if not vals:
+            continue
+        metric(n, "histogram")
+        for b in BUCKETS:
+            out.append(f"{prefix}_{n}_bucket{_labels(l + (('le', str(b)),))} {sum(1 for v in vals if v <= b)}")
+        out.append(f"{prefix}_{n}_bucket{_labels(l + (('le', '+Inf'),))} {len(vals)}")
+        out.append(f"{prefix}_{n}_sum{_labels(l)} {round(sum(vals), 6)}")
+        out.append(f"{prefix}_{n}_count{_labels(l)} {len(vals)}")
+    for brand, b in sorted(summ["pdp"].items()):
+        for field in ("rows_per_s", "miss_ratio", "fail_ratio"):
+            if b.get(field) is not None:
+                metric(f"pdp_{field}", "gauge")
+                out.append(f"{prefix}_pdp_{field}{_labels((('brand', brand),))} {b[field]}")
+    metric("run_duration_seconds", "gauge")
+    out.append(f"{prefix}_run_duration_seconds {summ['seconds']}")
+    metric("run_last_finished_timestamp_seconds", "gauge")
+    out.append(f"{prefix}_run_last_finished_timestamp_seconds {round(time.time(), 3)}")
+    return "\n".join(out) + "\n"
+
+def write(prom_path: Optional[str] = None) -> Dict:
+    """Dump the run summary to data/logs/metrics_<ts>.json and, if asked, the Prometheus textfile."""
+    if not COUNTS and not SAMPLES:
+        return {}
+    summ = summary()
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    path = LOG_DIR / f"metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    path.write_text(json.dumps(summ, indent=2), encoding="utf-8")
+    for brand, b in summ["pdp"].items():
+        _log(f"{brand or 'pdp'}: {b['rows']} rows in {b['seconds']:.1f}s "
+             f"({b['rows_per_s'] or 0:.2f}/s), {b['ok']} ok, {b['missing_msrp']} missing MSRP, "
+             f"{b['timeout']} timeout, {b['error']} error")
+    _log(f"Wrote: {path}")
+    if prom_path:
+        prom = Path(prom_path)
+        prom.parent.mkdir(parents=True, exist_ok=True)
+        tmp = prom.with_name(prom.name + f".{os.getpid()}.tmp")
+        tmp.write_text(prometheus(summ), encoding="utf-8")
+        os.replace(tmp, prom)  # the collector must never read a half-written file
+        _log(f"Wrote: {prom}")
+    return summ
+# ---------- EOF ----------
@@ -0,0 +1,125 @@
+﻿# src/netpolicy.py — route interception by page type + per-page request/byte accounting
+
+import json
+import weakref
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+from playwright.async_api import BrowserContext, Page, Request, Route
+from config import NET_POLICY
+
+LOG_DIR = Path("data/logs")
+
+# page → page type ("auth" | "catalog" | "pdp" | ...); untagged pages use "default"
+_PAGE_TYPES: "weakref.WeakKeyDictionary[Page, str]" = weakref.WeakKeyDictionary()
+# page → stats record of the document currently loaded in it
+_CURRENT: "weakref.WeakKeyDictionary[Page, Dict]" = weakref.WeakKeyDictionary()
+_REQ_REC: "weakref.WeakKeyDictionary[Request, Dict]" = weakref.WeakKeyDictionary()
+_VISITS: List[Dict] = []
+
+def _log(msg: str):
+    print("[NET]", msg)
+
+def _host_matches(host: str, domains: List[str]) -> bool:
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+def tag(page: Page, page_type: str) -> None:
+    """Apply the `page_type` rules of the installed policy to requests from this page."""
+    _PAGE_TYPES[page] = page_type
+
+def _decide(rules: Dict, resource_type: str, host: str) -> Optional[str]:
+    """Reason string when the request should be blocked, else None."""
+    if resource_type in rules.get("block_types", []):
+        return f"type:{resource_type}"
+    if _host_matches(host, rules.get("allow_domains", [])):
+        return None
+    if _host_matches(host, rules.get("block_domains", [])):
+        return f"domain:{host}"
+    return None
+
+def _new_visit(page_type: str, url: str) -> Dict:
+    rec = {
+        "page_type": page_type, "url": url,
+        "allowed": 0, "blocked": 0, "bytes": 0,
+        "blocked_by": Counter(), "bytes_by_type": Counter(),
+    }
+    _VISITS.append(rec)
+    return rec
+
+async def install(ctx: BrowserContext, policy: Optional[Dict] = None) -> None:
+    """Route every request of `ctx` through the per-page-type policy and count it."""
+    policy = policy or NET_POLICY
+
+    async def handler(route: Route, request: Request):
+        try:
+            page = request.frame.page
+        except Exception:
+            page = None  # service worker / detached frame
+        page_type = _PAGE_TYPES.get(page, "default") if page is not None else "default"
+
+        rec = _CURRENT.get(page) if page is not None else None
+        if page is not None and request.is_navigation_request() and request.frame.parent_frame is None:
+            rec = _new_visit(page_type, request.url)
+            _CURRENT[page] = rec
+
+        host = (urlparse(request.url).hostname or "").lower()
+        reason = _decide(policy.get(page_type, policy.get("default", {})), request.resource_type, host)
+        if rec is not None:
+            if reason:
+                rec["blocked"] += 1
+                rec["blocked_by"][reason] += 1
+            else:
+                rec["allowed"] += 1
+                _REQ_REC[request] = rec
+        if reason:
+            await route.abort("blockedbyclient")
+        else:
+            await route.fallback()
+
+    async def on_finished(request: Request):
+        rec = _REQ_REC.get(request)
+        if rec is None:
+            return
+        try:
+            sizes = await request.sizes()
+        except Exception:
+            return
+        n = max(sizes.get("responseBodySize", 0), 0) + max(sizes.get("responseHeadersSize", 0), 0)
+        rec["bytes"] += n
+        rec["bytes_by_type"][request.resource_type] += n
+
+    await ctx.route("**/*", handler)
+    ctx.on("requestfinished", on_finished)
+
+def report(write_json: bool = True) -> Dict:
+    """Print per-page-type totals and dump every page visit to data/logs/netstats_<ts>.json."""
+    if not _VISITS:
+        return {}
+    summary: Dict[str, Dict] = {}
+    groups: Dict[str, List[Dict]] = defaultdict(list)
+    for v in _VISITS:
+        groups[v["page_type"]].append(v)
+    for page_type, visits in groups.items():
+        n = len(visits)
+        allowed = sum(v["allowed"] for v in visits)
+        blocked = sum(v["blocked"] for v in visits)
+        nbytes = sum(v["bytes"] for v in visits)
+        blocked_by = sum((v["blocked_by"] for v in visits), Counter())
+        summary[page_type] = {
+            "pages": n, "allowed": allowed, "blocked": blocked, "bytes": nbytes,
+            "per_page": {"allowed": allowed / n, "blocked": blocked / n, "bytes": nbytes / n},
+            "top_blocked": blocked_by.most_common(10),
+        }
+        _log(f"{page_type}: {n} page(s), {allowed / n:.1f} allowed + {blocked / n:.1f} blocked "
+             f"requests/page, {nbytes / n / 1024:.0f} KB/page")
+
+    if write_json:
+        LOG_DIR.mkdir(parents=True, exist_ok=True)
+        path = LOG_DIR / f"netstats_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "pages": _VISITS}, f, indent=2)
+        _log(f"Wrote: {path}")
+    return summary
+# ---------- EOF ----------
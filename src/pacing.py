@@ -0,0 +1,98 @@
+﻿# src/pacing.py — adaptive (AIMD) concurrency + request spacing, and retry backoff for PDP visits
+
+import asyncio
+import random
+import re
+import time
+from typing import Dict, Optional
+from config import RATE
+
+THROTTLE_RE = re.compile(r"^ERROR: HTTP (429|5\d\d)\b")
+
+def _log(msg: str):
+    print("[RATE]", msg)
+
+def outcome(row: Dict) -> str:
+    """"ok", "throttled" (429/5xx), or "failed" (TIMEOUT / other ERROR) for a PDP row."""
+    raw = str(row.get("msrp_raw") or "")
+    if THROTTLE_RE.match(raw):
+        return "throttled"
+    if raw == "TIMEOUT" or raw.startswith("ERROR"):
+        return "failed"
+    return "ok"
+
+def backoff_s(attempt: int, cfg: Dict = RATE) -> float:
+    """Delay before retry number `attempt` (1-based): base·2^(attempt-1), capped, ±25% jitter."""
+    d = min(cfg["retry_cap_s"], cfg["retry_base_s"] * 2 ** (attempt - 1))
+    return d * random.uniform(0.75, 1.25)
+
+class RateController:
+    """
+    Additive increase / multiplicative decrease over two knobs shared by a pool:
+      limit    – visits allowed in flight (1 … ceiling)
+      interval – minimum gap between visit starts
+
+    Every healthy completion adds 1/limit to the limit (≈ +1 per round of the
+    pool) and shortens the interval; a 429/5xx halves the limit and doubles the
+    interval; timeouts, errors and slow pages (latency over slow_s) cut the
+    limit by a quarter. Cuts happen at most once per cooldown_s so one burst of
+    failures doesn't collapse the pool.
+    """
+
+    def __init__(self, start: int, ceiling: int, name: str = "pdp", cfg: Dict = RATE):
+        self.name = name
+        self.cfg = cfg
+        self.ceiling = max(1, ceiling)
+        self.limit = float(min(max(1, start), self.ceiling))
+        self.interval = cfg["start_interval_s"]
+        self.active = 0
+        self.stats = {"ok": 0, "failed": 0, "throttled": 0, "slow": 0, "cuts": 0}
+        self.peak = self.limit
+        self.low = self.limit
+        self._next_start = 0.0
+        self._last_cut = 0.0
+        self._cond: Optional[asyncio.Condition] = None
+
+    async def acquire(self) -> None:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.active < int(self.limit))
+            self.active += 1
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def release(self, latency_s: float, result: str) -> None:
+        cfg = self.cfg
+        slow = result == "ok" and latency_s > cfg["slow_s"]
+        self.stats[result] += 1
+        if slow:
+            self.stats["slow"] += 1
+        now = time.monotonic()
+        if result == "ok" and not slow:
+            self.limit = min(self.ceiling, self.limit + 1.0 / self.limit)
+            self.interval = max(cfg["min_interval_s"], self.interval * 0.9)
+        elif now - self._last_cut >= cfg["cooldown_s"]:
+            self._last_cut = now
+            self.stats["cuts"] += 1
+            factor = 0.5 if result == "throttled" else 0.75
+            self.limit = max(1.0, self.limit * factor)
+            grow = 2.0 if result == "throttled" else 1.5
+            self.interval = min(cfg["max_interval_s"], max(self.interval * grow, 0.25))
+            _log(f"{self.name}: {result if not slow else f'slow ({latency_s:.1f}s)'} → "
+                 f"{int(self.limit)} in flight, {self.interval * 1000:.0f} ms spacing")
+        self.peak = max(self.peak, self.limit)
+        self.low = min(self.low, self.limit)
+        async with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def report(self) -> None:
+        s = self.stats
+        _log(f"{self.name}: {s['ok']} ok, {s['failed']} failed, {s['throttled']} throttled, "
+             f"{s['slow']} slow; in flight {int(self.low)}–{int(self.peak)} "
+             f"(ended {int(self.limit)}), {s['cuts']} back-off(s)")
+# ---------- EOF ----------
@@ -0,0 +1,68 @@
+﻿# src/ready.py — page-type DOM readiness checks (instead of networkidle) + timing stats
+
+import time
+from collections import defaultdict
+from typing import Dict, List
+from playwright.async_api import Page
+from config import READINESS
+
+_JS_READY = r"""
+({sels, re, base}) => {
+  const rx = re ? new RegExp(re, "i") : null;
+  for (const s of sels) {
+    const els = document.querySelectorAll(s);
+    if (els.length <= base) continue;
+    if (!rx) return true;
+    for (const el of els) if (rx.test(el.innerText || "")) return true;
+  }
+  return false;
+}
+"""
+
+_JS_COUNT = "(sels) => sels.reduce((n, s) => n + document.querySelectorAll(s).length, 0)"
+
+# page type → [(elapsed_ms, became_ready)]
+STATS: Dict[str, List] = defaultdict(list)
+
+def _log(msg: str):
+    print("[READY]", msg)
+
+async def count(page: Page, page_type: str) -> int:
+    """Nodes currently matching the page type's selectors (baseline for grow checks)."""
+    try:
+        return await page.evaluate(_JS_COUNT, READINESS[page_type]["selectors"])
+    except Exception:
+        return 0
+
+async def wait_ready(page: Page, page_type: str, baseline: int = 0, timeout_ms: int = None) -> bool:
+    """
+    Wait until the READINESS predicate for page_type holds, up to its timeout.
+    Returns False on timeout (callers parse whatever is there, as before).
+    """
+    cfg = READINESS[page_type]
+    t0 = time.perf_counter()
+    ok = True
+    try:
+        await page.wait_for_function(
+            _JS_READY,
+            arg={"sels": cfg["selectors"], "re": cfg.get("text_re"), "base": baseline},
+            timeout=timeout_ms or cfg.get("timeout_ms", 10000),
+            polling=100,
+        )
+    except Exception:
+        ok = False  # timed out, or the page navigated/closed mid-wait
+    STATS[page_type].append(((time.perf_counter() - t0) * 1000, ok))
+    return ok
+
+def _pct(vals: List[float], q: float) -> float:
+    vals = sorted(vals)
+    return vals[min(len(vals) - 1, int(q * len(vals)))]
+
+def report() -> None:
+    """One line per page type: checks, timeouts, p50/p95/max wait."""
+    for page_type, rows in STATS.items():
+        ms = [r[0] for r in rows]
+        timeouts = sum(1 for r in rows if not r[1])
+        _log(f"{page_type}: {len(rows)} checks, {timeouts} timed out, "
+             f"p50 {_pct(ms, 0.5):.0f} ms, p95 {_pct(ms, 0.95):.0f} ms, max {max(ms):.0f} ms")
+# ---------- EOF ----------
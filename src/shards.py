@@ -0,0 +1,192 @@
+﻿# src/shards.py — multi-process PDP shards: one browser per process, results merged in the parent
+
+import asyncio
+import multiprocessing as mp
+import queue
+import sys
+import traceback
+from typing import Callable, Dict, List, Optional
+
+from auth import STATE_FILE
+from archive import HtmlArchive
+import forensics
+import metrics
+
+def _log(msg: str):
+    print("[SHARD]", msg)
+
+class _Prefixed:
+    """stdout wrapper that tags every line a shard prints, e.g. "[S2] [PDP] 3/40 → …"."""
+
+    def __init__(self, stream, tag: str):
+        self._s = stream
+        self._tag = tag
+        self._buf = ""
+
+    def write(self, txt: str) -> int:
+        # whole lines in one write each, so shards sharing the terminal don't interleave mid-line
+        self._buf += txt
+        if "\n" in self._buf:
+            *lines, self._buf = self._buf.split("\n")
+            self._s.write("".join(f"{self._tag}{line}\n" for line in lines))
+            self._s.flush()
+        return len(txt)
+
+    def flush(self):
+        self._s.flush()
+
+class _ShardArchive(HtmlArchive):
+    """Blobs are written by the shard (content-addressed, safe across processes);
+    index lines go to the parent so index.jsonl keeps a single writer."""
+
+    def __init__(self, root, n: int, q):
+        self.root = root
+        self.count = 0
+        self._n = n
+        self._q = q
+
+    def index(self, url: str, sha: str, row: Dict) -> None:
+        self._q.put(("index", self._n, url, sha, row))
+        self.count += 1
+
+    def close(self) -> None:
+        pass
+
+# ---------- Child process ----------
+async def _shard(n: int, idx: List[int], products: List[Dict], opts: Dict, q) -> None:
+    from pathlib import Path
+    from playwright.async_api import async_playwright
+    from detail import _fetch_live
+    import netpolicy
+    import ready
+
+    fx = opts["forensics"]
+    if fx:
+        forensics.enable(fx["level"], out_dir=str(Path(fx["dir"]) / f"s{n}"))
+    p = await async_playwright().start()
+    browser = None
+    try:
+        browser = await p.chromium.launch(headless=opts["headless"],
+                                          args=["--disable-blink-features=AutomationControlled"])
+        ctx = await browser.new_context(storage_state=STATE_FILE, viewport={"width": 1400, "height": 900})
+        if opts["net_policy"]:
+            await netpolicy.install(ctx)
+        archive = _ShardArchive(Path(opts["archive_root"]), n, q) if opts["archive_root"] else None
+        await _fetch_live(ctx, products, opts["only_missing"], opts["concurrency"], opts["mode"],
+                          opts["http_concurrency"],
+                          on_result=lambda j, rec: q.put(("row", n, idx[j], rec)),
+                          archive=archive, max_concurrency=opts["max_concurrency"],
+                          retries=opts["retries"], http_max_concurrency=opts["http_max_concurrency"])
+    finally:
+        netpolicy.report()
+        ready.report()
+        forensics.report()
+        if browser is not None:
+            await browser.close()
+        await p.stop()
+
+def _shard_main(n: int, idx: List[int], products: List[Dict], opts: Dict, q) -> None:
+    """Process entry point (spawned): run one shard, then report done/fail to the parent."""
+    sys.stdout = _Prefixed(sys.stdout, f"[S{n}] ")
+    try:
+        asyncio.run(_shard(n, idx, products, opts, q))
+        q.put(("metrics", n, metrics.snapshot()))
+        q.put(("done", n))
+    except BaseException as e:
+        why = (str(e).strip().splitlines() or [""])[0]
+        q.put(("metrics", n, metrics.snapshot()))
+        q.put(("fail", n, f"{type(e).__name__}: {why}", traceback.format_exc()))
+
+# ---------- Parent ----------
+async def fetch_sharded(products: List[Dict], workers: int, only_missing: bool = False,
+                        concurrency: int = 4, mode: str = "browser", http_concurrency: int = 16,
+                        on_result: Optional[Callable[[int, Dict], None]] = None,
+                        archive=None, headless: bool = True, net_policy: bool = True,
+                        max_concurrency: int = 0, retries: int = 2,
+                        http_max_concurrency: int = 0) -> List[Dict]:
+    """
+    Deal products round-robin into `workers` shards, each a spawned process with
+    its own browser on storage_state.json running the usual PDP engine.
+    Rows stream back over a queue: on_result(i, row) fires in the parent with
+    the input index, and the returned list is in input order. Rows of a shard
+    that crashes come back as "ERROR: shard N …".
+    """
+    total = len(products)
+    workers = max(1, min(workers, total))
+    if not total:
+        return []
+    mpc = mp.get_context("spawn")  # fresh interpreters; forking a live event loop is unsafe
+    q = mpc.Queue()
+    opts = {
+        "only_missing": only_missing, "concurrency": concurrency, "mode": mode,
+        "http_concurrency": http_concurrency, "headless": headless, "net_policy": net_policy,
+        "archive_root": str(archive.root) if archive is not None else None,
+        "max_concurrency": max_concurrency, "retries": retries, "forensics": forensics.settings(),
+        "http_max_concurrency": http_max_concurrency,
+    }
+    shards = {n: list(range(n - 1, total, workers)) for n in range(1, workers + 1)}
+    procs = {}
+    for n, idx in shards.items():
+        pr = mpc.Process(target=_shard_main, args=(n, idx, [products[i] for i in idx], opts, q),
+                         name=f"pdp-shard-{n}")
+        pr.start()
+        procs[n] = pr
+    _log(f"{total} PDPs across {workers} process(es): "
+         + ", ".join(f"S{n}={len(idx)}" for n, idx in shards.items()))
+
+    out: List[Optional[Dict]] = [None] * total
+    done = {n: 0 for n in shards}
+    bad = {n: 0 for n in shards}
+    failed = {}
+    live = set(shards)
+
+    def finish(i: int, rec: Dict):
+        out[i] = rec
+        if on_result:
+            on_result(i, rec)
+
+    try:
+        while live:
+            try:
+                ev = await asyncio.to_thread(q.get, True, 0.5)
+            except queue.Empty:
+                for n in list(live):
+                    if not procs[n].is_alive():
+                        failed[n] = f"exited with code {procs[n].exitcode}"
+                        live.discard(n)
+                continue
+            kind, n = ev[0], ev[1]
+            if kind == "row":
+                i, rec = ev[2], ev[3]
+                finish(i, rec)
+                done[n] += 1
+                raw = str(rec.get("msrp_raw") or "")
+                if raw.startswith(("ERROR", "TIMEOUT")):
+                    bad[n] += 1
+                    _log(f"S{n}: {raw[:120]} ({rec.get('url') or ''})")
+                if done[n] % 25 == 0 or done[n] == len(shards[n]):
+                    _log(f"S{n}: {done[n]}/{len(shards[n])} done, {bad[n]} failed")
+            elif kind == "index":
+                archive.index(ev[2], ev[3], ev[4])
+            elif kind == "metrics":
+                metrics.merge(ev[2])  # the shard's step timings join the parent's run summary
+            elif kind == "done":
+                live.discard(n)
+            elif kind == "fail":
+                failed[n] = ev[2]
+                print(f"[SHARD][ERROR] S{n} crashed:\n{ev[3]}")
+                live.discard(n)
+    finally:
+        for pr in procs.values():
+            if pr.is_alive():
+                pr.terminate()
+            pr.join(timeout=10)
+
+    for n, why in failed.items():
+        lost = [i for i in shards[n] if out[i] is None]
+        _log(f"S{n} failed ({why}); {len(lost)} row(s) marked ERROR")
+        for i in lost:
+            finish(i, {**products[i], "msrp_raw": f"ERROR: shard {n} {why}", "msrp": None})
+    _log(f"Merged {total} rows from {workers} shard(s)")
+    return out
+# ---------- EOF ----------
@@ -0,0 +1,6 @@
+﻿# tests/conftest.py — the app is a flat src/ directory of sibling modules (run as python src/main.py)
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
@@ -0,0 +1,52 @@
+﻿# tests/test_archive.py — content-addressed HTML archive and the offline --reparse
+
+import json
+from pathlib import Path
+
+import pytest
+
+from archive import HtmlArchive, reparse
+
+FIXTURES = Path(__file__).parent / "fixtures"
+PRICED = (FIXTURES / "pdp_priced.html").read_text(encoding="utf-8")
+NO_MSRP = (FIXTURES / "pdp_no_msrp.html").read_text(encoding="utf-8")
+
+def _row(k: int) -> dict:
+    return {"brand": "Hanwha", "url": f"https://x/p/{k}", "title": f"tile {k}"}
+
+def test_blobs_are_stored_once_per_content(tmp_path):
+    a = HtmlArchive(tmp_path)
+    sha1 = a.put_blob(PRICED)
+    assert a.put_blob(PRICED) == sha1
+    assert a.put_blob(NO_MSRP) != sha1
+    assert len(list((tmp_path / "blobs").rglob("*.html.gz"))) == 2
+    assert not list((tmp_path / "blobs").rglob("*.tmp"))
+    a.close()
+
+def test_reparse_rebuilds_rows_from_the_latest_capture(tmp_path):
+    a = HtmlArchive(tmp_path)
+    a.index(_row(0)["url"], a.put_blob(NO_MSRP), _row(0))
+    a.index(_row(1)["url"], a.put_blob(NO_MSRP), _row(1))
+    a.index(_row(0)["url"], a.put_blob(PRICED), _row(0))   # re-captured later: this one wins
+    a.close()
+    with open(tmp_path / "index.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"url": "https://x/p/9", "sh')             # torn line
+
+    rows = reparse(tmp_path, workers=1)
+    assert [r["url"] for r in rows] == [_row(0)["url"], _row(1)["url"]]
+    assert rows[0]["msrp"] == "1234.50" and rows[0]["model"] == "ANV-L7082R"
+    assert rows[1]["msrp"] is None and rows[1]["model"] == "XNO-6080R"
+
+def test_missing_blob_becomes_an_error_row(tmp_path):
+    a = HtmlArchive(tmp_path)
+    sha = a.put_blob(PRICED)
+    a.index(_row(0)["url"], sha, _row(0))
+    a.close()
+    next((tmp_path / "blobs").rglob(f"{sha}.html.gz")).unlink()
+    (row,) = reparse(tmp_path, workers=1)
+    assert row["msrp_raw"].startswith("ERROR:") and row["msrp"] is None
+
+def test_reparse_without_an_archive(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        reparse(tmp_path / "none")
+# ---------- EOF ----------
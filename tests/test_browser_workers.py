@@ -0,0 +1,60 @@
+﻿# tests/test_browser_workers.py — detail._fetch_in_browser worker pool, driven by stand-in pages
+
+import asyncio
+
+import pytest
+
+import detail
+
+class _Page:
+    def __init__(self, ctx, n):
+        self.context = ctx
+        self.n = n
+
+    def set_default_timeout(self, ms):
+        pass
+
+    async def close(self):
+        self.context.closed.append(self.n)
+
+class _Ctx:
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.opened = 0
+        self.closed = []
+
+    async def new_page(self):
+        self.opened += 1
+        if self.opened == self.fail_on:
+            raise RuntimeError("Target page, context or browser has been closed")
+        return _Page(self, self.opened)
+
+@pytest.fixture(autouse=True)
+def stand_ins(monkeypatch):
+    async def scrape(page, prod, archive=None):
+        await asyncio.sleep(0.01)
+        return {**prod, "msrp": "10", "msrp_raw": "MSRP $10"}
+    monkeypatch.setattr(detail, "_scrape_pdp", scrape)
+    monkeypatch.setattr(detail.netpolicy, "tag", lambda page, kind: None)
+
+def _products(n):
+    return [{"url": f"http://127.0.0.1/Product/{i}"} for i in range(n)]
+
+def test_rows_come_back_in_order_and_pages_close():
+    ctx = _Ctx()
+    rows = asyncio.run(detail._fetch_in_browser(ctx, _products(30), False, 3))
+    assert [r["url"] for r in rows] == [p["url"] for p in _products(30)]
+    assert all(r["msrp"] == "10" for r in rows)
+    assert sorted(ctx.closed) == list(range(1, ctx.opened + 1))
+
+def test_failing_worker_cancels_siblings_and_closes_their_pages():
+    ctx = _Ctx(fail_on=3)
+
+    async def run():
+        with pytest.raises(RuntimeError, match="has been closed"):
+            await detail._fetch_in_browser(ctx, _products(40), False, 3)
+        return [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+    assert asyncio.run(run()) == []  # no worker left running on the queue
+    assert sorted(ctx.closed) == [1, 2]
+# ---------- EOF ----------
@@ -0,0 +1,74 @@
+﻿# tests/test_cache.py — PDP result cache: TTL, fingerprint revalidation, eviction
+
+import pytest
+
+import cache
+from cache import PdpCache, fingerprint
+
+ROW = {"url": "https://x/p/1", "title": "XNO-6080R", "model": "XNO-6080R", "msrp_raw": "MSRP $499.00",
+       "msrp": "499.00"}
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {"t": 1_000_000.0}
+    monkeypatch.setattr(cache.time, "time", lambda: now["t"])
+    return now
+
+def _open(tmp_path, **kw) -> PdpCache:
+    return PdpCache(path=tmp_path / "pdp.sqlite", **kw)
+
+def _times(c: PdpCache, url: str):
+    return c.db.execute("SELECT fetched_at, checked_at FROM pdp WHERE url = ?", (url,)).fetchone()
+
+def test_fresh_entry_served_until_ttl(tmp_path, clock):
+    c = _open(tmp_path, ttl_s=3600)
+    assert c.put(ROW) == "new"
+    assert c.get(ROW["url"])["msrp"] == "499.00"
+    clock["t"] += 3601
+    assert c.get(ROW["url"]) is None
+    assert c.stats["hit"] == 1 and c.stats["miss"] == 1
+    c.close()
+
+def test_policies(tmp_path, clock):
+    c = _open(tmp_path, ttl_s=3600)
+    c.put(ROW)
+    c.close()
+    assert _open(tmp_path, ttl_s=0).get(ROW["url"]) is None                 # write-only
+    assert _open(tmp_path, ttl_s=3600, refresh=True).get(ROW["url"]) is None
+    clock["t"] += 10 * 86400
+    assert _open(tmp_path, only=True).get(ROW["url"])["msrp"] == "499.00"  # any age
+
+def test_unchanged_content_only_moves_checked_at(tmp_path, clock):
+    c = _open(tmp_path, ttl_s=3600)
+    c.put(ROW)
+    clock["t"] += 100
+    assert c.put({**ROW, "brand": "Hanwha Vision"}) == "unchanged"  # catalog-only fields don't count
+    assert _times(c, ROW["url"]) == (1_000_000.0, 1_000_100.0)
+    clock["t"] += 100
+    assert c.put({**ROW, "msrp_raw": "MSRP $529.00", "msrp": "529.00"}) == "changed"
+    assert _times(c, ROW["url"]) == (1_000_200.0, 1_000_200.0)
+    assert c.get(ROW["url"])["msrp"] == "529.00"
+    c.close()
+
+def test_fingerprint_covers_pdp_fields_only():
+    assert fingerprint(ROW) == fingerprint({**ROW, "url": "elsewhere", "features": ["x"]})
+    assert fingerprint(ROW) != fingerprint({**ROW, "lens_info": "2.8mm"})
+
+def test_rows_without_msrp_are_not_cached(tmp_path, clock):
+    c = _open(tmp_path, ttl_s=3600)
+    assert c.put({**ROW, "msrp": None, "msrp_raw": "TIMEOUT"}) is None
+    assert c.get(ROW["url"]) is None
+    c.close()
+
+def test_eviction_by_age_and_size(tmp_path, clock):
+    c = _open(tmp_path, ttl_s=3600)
+    for k in range(5):
+        c.put({**ROW, "url": f"https://x/p/{k}"})
+        clock["t"] += 10
+    c.close()
+    clock["t"] += 100
+    c = _open(tmp_path, ttl_s=3600, max_age_s=135, max_rows=2)  # p/0, p/1 too old; then newest 2
+    urls = [u for (u,) in c.db.execute("SELECT url FROM pdp ORDER BY url")]
+    assert urls == ["https://x/p/3", "https://x/p/4"]
+    c.close()
+# ---------- EOF ----------
@@ -0,0 +1,92 @@
+﻿# tests/test_catalog_pages.py — catalog._load_by_pages: page-param probe before the fan-out
+
+import asyncio
+
+import pytest
+
+import catalog
+
+URL = "http://127.0.0.1/Catalog/shop-brands/hanwha-vision?perPage=10"
+
+def _tiles(page_no):
+    return [{"url": f"http://127.0.0.1/Product/{page_no}-{k}", "model": f"M{page_no}{k}"} for k in range(10)]
+
+@pytest.fixture
+def loads(monkeypatch):
+    """
+    Results pages fetched by URL, in call order; `honored` toggles whether ?page= works,
+    failures[n] is how many more loads of page n fail (None) before it works.
+    """
+    state = {"calls": [], "honored": True, "failures": {}}
+
+    async def first_page(page, label):
+        return _tiles(1)
+
+    async def results_page(ctx, url, page_param, n, label):
+        state["calls"].append(n)
+        await asyncio.sleep(0)
+        if state["failures"].get(n):
+            state["failures"][n] -= 1
+            return None
+        return _tiles(n if state["honored"] else 1)
+
+    monkeypatch.setattr(catalog, "_extract_on_page_fast", first_page)
+    monkeypatch.setattr(catalog, "_fetch_results_page", results_page)
+    monkeypatch.setattr(catalog, "backoff_s", lambda attempt: 0)
+    return state
+
+def test_pages_in_order_and_emitted(loads):
+    emitted = []
+
+    async def emit(rows):
+        emitted.append(rows[0]["url"].rsplit("/", 1)[-1].split("-")[0])
+
+    items = asyncio.run(catalog._load_by_pages(None, None, URL, 45, "page", 3, "Hanwha Vision", emit=emit))
+    assert [it["url"] for it in items] == [t["url"] for n in range(1, 6) for t in _tiles(n)]
+    assert loads["calls"][0] == 2 and sorted(loads["calls"]) == [2, 3, 4, 5]
+    assert emitted[:2] == ["1", "2"] and sorted(emitted) == ["1", "2", "3", "4", "5"]
+
+def test_ignored_page_param_costs_one_extra_load(loads):
+    loads["honored"] = False
+    items = asyncio.run(catalog._load_by_pages(None, None, URL, 45, "page", 3, "Hanwha Vision"))
+    assert items is None
+    assert loads["calls"] == [2]
+
+def test_single_page_fetches_nothing_more(loads):
+    items = asyncio.run(catalog._load_by_pages(None, None, URL, 8, "page", 3, "Hanwha Vision"))
+    assert len(items) == 10 and loads["calls"] == []
+def test_failed_page_is_retried(loads):
+    loads["failures"] = {3: 2}
+    items = asyncio.run(catalog._load_by_pages(None, None, URL, 45, "page", 3, "Hanwha Vision"))
+    assert [it["url"] for it in items] == [t["url"] for n in range(1, 6) for t in _tiles(n)]
+    assert loads["calls"].count(3) == 3
+
+def test_page_failing_every_attempt_falls_back(loads):
+    loads["failures"] = {4: catalog.PAGE_RETRIES + 1}
+    emitted = []
+
+    async def emit(rows):
+        emitted.append(rows)
+
+    items = asyncio.run(catalog._load_by_pages(None, None, URL, 45, "page", 3, "Hanwha Vision", emit=emit))
+    assert items is None  # the caller clicks Show More instead of exporting a short catalog
+    assert loads["calls"].count(4) == catalog.PAGE_RETRIES + 1
+    assert all(rows for rows in emitted)
+
+def test_page_2_failing_falls_back(loads):
+    loads["failures"] = {2: catalog.PAGE_RETRIES + 1}
+    assert asyncio.run(catalog._load_by_pages(None, None, URL, 45, "page", 3, "Hanwha Vision")) is None
+    assert set(loads["calls"]) == {2}
+
+def test_shortfall_against_total_is_reported(loads, monkeypatch, capsys):
+    full = catalog._fetch_results_page
+
+    async def short_last(ctx, url, page_param, n, label):
+        tiles = await full(ctx, url, page_param, n, label)
+        return tiles[:3] if n == 5 else tiles
+
+    monkeypatch.setattr(catalog, "_fetch_results_page", short_last)
+    items = asyncio.run(catalog._load_by_pages(None, None, URL, 48, "page", 3, "Hanwha Vision"))
+    assert len(items) == 43
+    assert "[WARN] 43 unique tiles from 5 page(s), but the site reports 48" in capsys.readouterr().out
+# ---------- EOF ----------
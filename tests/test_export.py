@@ -0,0 +1,105 @@
+﻿# tests/test_export.py — CSV BOM per export kind; late header keys; row order; .part until close
+
+import csv
+import gc
+import json
+
+import pytest
+from openpyxl import load_workbook
+
+from export import COLUMNS, ExportSink, OrderedRows, export_results
+
+ROWS = [{"brand": "Hanwha", "title": "Caméra XNO-6080R", "url": "https://x/p/1", "msrp": "499.00"}]
+
+@pytest.fixture(autouse=True)
+def in_tmp(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def _csv(tmp_path, kind: str) -> bytes:
+    (path,) = (tmp_path / "data" / "exports").glob(f"adi_hanwha_{kind}_*.csv")
+    return path.read_bytes()
+
+@pytest.mark.parametrize("suffix, kind, bom", [
+    ("catalog", "catalog", False),   # as the catalog snapshot always was
+    (None, "msrp", True),            # so Excel opens it as UTF-8
+    ("reparse", "reparse", True),
+])
+def test_csv_bom(in_tmp, suffix, kind, bom):
+    export_results(ROWS, brand="Hanwha", suffix=suffix, history=False, formats=["csv"])
+    data = _csv(in_tmp, kind)
+    assert data.startswith(b"\xef\xbb\xbf") is bom
+    assert "Caméra XNO-6080R".encode("utf-8") in data
+
+def test_csv_bom_override(in_tmp):
+    export_results(ROWS, brand="Hanwha", suffix="catalog", history=False, formats=["csv"], csv_bom=True)
+    assert _csv(in_tmp, "catalog").startswith(b"\xef\xbb\xbf")
+
+def test_key_first_seen_in_a_later_row_is_kept(in_tmp):
+    rows = [
+        {"url": "https://x/p/1", "msrp": "1.00"},
+        {"url": "https://x/p/2", "msrp": "2.00", "lens_mm": "2.8"},           # new key
+        {"url": "https://x/p/3", "msrp": "3.00", "sensor": "1/2.8in", "lens_mm": "4"},
+    ]
+    sink = ExportSink("Hanwha", history=False, formats=["csv", "xlsx", "parquet", "jsonl"], flush_every=1)
+    sink.write_all(rows).close()
+    header = ["url", "msrp"] + [c for c in COLUMNS if c not in ("url", "msrp")] + ["lens_mm", "sensor"]
+    assert sink.columns == header
+
+    def picked(table):
+        return [(r["url"], r["lens_mm"], r["sensor"]) for r in table]
+    want = [("https://x/p/1", None, None), ("https://x/p/2", "2.8", None), ("https://x/p/3", "4", "1/2.8in")]
+    blank = lambda v: None if v in ("", None) else v
+
+    with open(sink.paths["csv"], newline="", encoding="utf-8-sig") as f:
+        got = list(csv.DictReader(f))
+    assert list(got[0]) == header
+    assert [tuple(blank(v) for v in t) for t in picked(got)] == want
+
+    ws = load_workbook(sink.paths["xlsx"], read_only=True).active
+    vals = list(ws.iter_rows(values_only=True))
+    assert list(vals[0]) == header
+    assert picked(dict(zip(header, v + (None,) * len(header))) for v in vals[1:]) == want  # blank tail cells aren't stored
+
+    import pyarrow.parquet as pq
+    table = pq.read_table(sink.paths["parquet"])
+    assert table.column_names == header
+    assert picked(table.to_pylist()) == want
+
+    with open(sink.paths["jsonl"], encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert picked({"lens_mm": None, "sensor": None, **r} for r in lines) == want
+
+    assert not list((in_tmp / "data" / "exports").glob("*.part*")) and \
+        not list((in_tmp / "data" / "exports").glob("*.wide"))
+def test_ordered_rows_release_in_input_order():
+    o = OrderedRows()
+    assert o.push(2, {"i": 2}) == []
+    assert o.push(1, {"i": 1}) == []
+    assert [r["i"] for r in o.push(0, {"i": 0})] == [0, 1, 2]
+    assert o.push(1, {"i": 1}) == []  # already released
+    assert [r["i"] for r in o.push(3, {"i": 3})] == [3] and o.next == 4
+
+def test_only_part_files_until_close(in_tmp):
+    exports = in_tmp / "data" / "exports"
+    sink = ExportSink("Hanwha", history=False, formats=["csv", "xlsx", "jsonl"], flush_every=1)
+    sink.write_all({**ROWS[0], "url": f"https://x/p/{k}"} for k in range(3))
+    # the XLSX rows sit in openpyxl's own temp file until close; no final name exists yet
+    assert sorted(p.name for p in exports.iterdir()) == [sink.paths[f].name + ".part" for f in ("csv", "jsonl")]
+    sink.close()
+    assert sorted(p.name for p in exports.iterdir()) == sorted(p.name for p in sink.paths.values())
+    with open(sink.paths["jsonl"], encoding="utf-8") as f:
+        assert [json.loads(line)["url"] for line in f] == [f"https://x/p/{k}" for k in range(3)]
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnraisableExceptionWarning")  # openpyxl's dropped writer
+def test_abandon_keeps_the_readable_partials(in_tmp):
+    sink = ExportSink("Hanwha", history=False, formats=["csv", "xlsx"], flush_every=1)
+    sink.write_all(ROWS * 2)
+    sink.abandon()
+    (part,) = (in_tmp / "data" / "exports").iterdir()  # a half-written .xlsx is useless, so it goes
+    assert part.name == sink.paths["csv"].name + ".part"
+    with open(part, newline="", encoding="utf-8-sig") as f:
+        assert len(list(csv.DictReader(f))) == 2
+    del sink
+    gc.collect()  # let the dropped XLSX writer go here, under the filter above
+# ---------- EOF ----------
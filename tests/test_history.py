@@ -0,0 +1,60 @@
+﻿# tests/test_history.py — Parquet price history: atomic part files, discard, price queries
+
+from datetime import datetime
+
+import pytest
+
+from history import HistoryWriter, msrp_changes, price_history
+
+def _write(root, run_ts, rows, brand="Hanwha"):
+    w = HistoryWriter(brand, root=root, batch=2)
+    w.run_ts = run_ts
+    for r in rows:
+        w.write(r)
+    w.close()
+    return w
+
+def _row(model, msrp, **kw):
+    return {"brand": "Hanwha Vision", "model": model, "alt_model": f"SQ-{model}", "url": f"https://x/{model}",
+            "msrp": msrp, "megapixels": "8MP", "ir": "True", **kw}
+
+def test_close_publishes_partitioned_parts(tmp_path):
+    w = _write(tmp_path, datetime(2025, 7, 1, 9), [_row("A", "100.00"), _row("B", "1,250.00"), _row("C", None)])
+    assert w.count == 3
+    parts = list(tmp_path.rglob("*.parquet"))
+    assert len(parts) == 1 and parts[0].parent == tmp_path / "brand=Hanwha" / "date=2025-07-01"
+    assert not parts[0].name.startswith("_")  # the _part-… name is only used while writing
+
+    df = price_history(root=tmp_path)
+    assert sorted(df["model"]) == ["A", "B", "C"]
+    assert df.set_index("model")["msrp"].to_dict()["B"] == 1250.0
+
+def test_discard_leaves_nothing(tmp_path):
+    w = HistoryWriter("Hanwha", root=tmp_path, batch=1)
+    w.write(_row("A", "100.00"))  # flushed to a _part file already
+    w.discard()
+    assert not list(tmp_path.rglob("*.parquet"))
+
+def test_rows_without_url_or_model_are_skipped(tmp_path):
+    w = _write(tmp_path, datetime(2025, 7, 1), [{"brand": "Hanwha", "msrp": "1"}, _row("A", "1")])
+    assert w.count == 1
+
+def test_price_queries(tmp_path):
+    _write(tmp_path, datetime(2025, 7, 1), [_row("A", "100.00"), _row("B", "200.00")])
+    _write(tmp_path, datetime(2025, 7, 8), [_row("A", "110.00"), _row("B", "200.00")])
+    _write(tmp_path, datetime(2025, 7, 15), [_row("A", "90.00"), _row("B", "200.00")])
+
+    a = price_history("sq-a", root=tmp_path)  # alt_model matches too, case-insensitive
+    assert list(a["msrp"]) == [100.0, 110.0, 90.0]
+    assert list(price_history("A", since="2025-07-08", root=tmp_path)["msrp"]) == [110.0, 90.0]
+
+    ch = msrp_changes(brand="Hanwha Vision", root=tmp_path)
+    assert list(ch["model"]) == ["A"]
+    (a,) = ch.to_dict("records")
+    assert (a["first_msrp"], a["last_msrp"], a["changes"], a["delta"]) == (100.0, 90.0, 2, -10.0)
+    assert msrp_changes(since="2025-07-15", root=tmp_path).empty
+
+def test_queries_without_history(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        price_history(root=tmp_path / "none")
+# ---------- EOF ----------
@@ -0,0 +1,182 @@
+﻿# tests/test_http_pdp.py — raw-markup PDP parser + browserless fetch against a local HTTP server
+
+import asyncio
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+import http_pdp
+from http_pdp import fetch_mspp_http, parse_pdp_html
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+def _fixture(name: str) -> str:
+    return (FIXTURES / name).read_text(encoding="utf-8")
+
+# ---------- Parser ----------
+def test_parse_priced_pdp():
+    got = parse_pdp_html(_fixture("pdp_priced.html"), brand="Hanwha")
+    assert got["title"] == "Hanwha Vision ANV-L7082R 4MP AI IR Bullet Camera, 2.8-12mm Motorized Varifocal"
+    assert got["features"] == [
+        "4MP resolution at 30fps",
+        "2.8~12mm motorized varifocal lens",
+        "IR range up to 50m",
+        "IK10 vandal resistant, IP67",
+    ]
+    assert got["model"] == "ANV-L7082R"
+    assert got["alt_model"] == "SQ-ANVL7082R"
+    assert got["msrp"] == "1,234.50"  # from the right column, not the <script> in <head>
+
+def test_parse_pdp_without_msrp():
+    got = parse_pdp_html(_fixture("pdp_no_msrp.html"), brand="Hanwha")
+    assert got["title"] == "Hanwha Vision XNO-6080R 2MP IR Bullet Camera"
+    assert got["features"] == ["2MP resolution", "4.2~9.4mm varifocal lens"]
+    assert (got["model"], got["alt_model"]) == ("XNO-6080R", "SQ-XNO6080R")
+    assert got["msrp"] is None
+
+# ---------- Fetch against a local server ----------
+ROUTES = {
+    "/Product/priced": (200, "pdp_priced.html"),
+    "/Product/no-msrp": (200, "pdp_no_msrp.html"),
+    "/Product/busy": (503, None),
+    "/Product/throttled": (429, None),
+    "/Product/gone": (404, None),
+    "/Product/slow": (200, "pdp_priced.html"),
+}
+
+class _Handler(BaseHTTPRequestHandler):
+    cookies = []
+    hits = {}
+    flaky = {}       # path → responses still to fail with 503 before serving the route
+    in_flight = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with _Handler.lock:
+            _Handler.cookies.append(self.headers.get("Cookie"))
+            _Handler.hits[self.path] = _Handler.hits.get(self.path, 0) + 1
+            _Handler.in_flight += 1
+            _Handler.peak = max(_Handler.peak, _Handler.in_flight)
+            fail = _Handler.flaky.get(self.path, 0)
+            if fail:
+                _Handler.flaky[self.path] = fail - 1
+        try:
+            if self.path == "/Product/slow":
+                time.sleep(0.05)
+            status, fixture = (503, None) if fail else ROUTES.get(self.path, (404, None))
+            self._send(status, fixture)
+        finally:
+            with _Handler.lock:
+                _Handler.in_flight -= 1
+
+    def _send(self, status, fixture):
+        body = _fixture(fixture).encode("utf-8") if fixture else b"<html><body>nope</body></html>"
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    _Handler.cookies, _Handler.hits, _Handler.flaky, _Handler.peak = [], {}, {}, 0
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture
+def state_file(tmp_path):
+    path = tmp_path / "storage_state.json"
+    path.write_text(json.dumps({"cookies": [
+        {"name": ".AspNet.ApplicationCookie", "value": "abc", "domain": "127.0.0.1", "path": "/",
+         "expires": -1, "secure": False},
+    ]}), encoding="utf-8")
+    return str(path)
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(http_pdp, "backoff_s", lambda attempt: 0.01)
+
+def test_fetch_http_rows_fallback_and_errors(server, state_file):
+    names = ["priced", "no-msrp", "busy", "throttled", "gone"]
+    products = [{"brand": "Hanwha", "url": f"{server}/Product/{n}", "title": n} for n in names]
+    finished = {}
+
+    rows, fallback = asyncio.run(fetch_mspp_http(products, concurrency=2, state_file=state_file, retries=1,
+                                                 on_result=lambda i, rec: finished.setdefault(i, rec)))
+
+    priced = rows[0]
+    assert priced["msrp"] == "1234.50" and priced["msrp_raw"] == "MSRP $1,234.50"
+    assert priced["model"] == "ANV-L7082R" and priced["alt_model"] == "SQ-ANVL7082R"
+    assert priced["lens_info"] == "2.8-12mm" and priced["ik_rating"] == "IK10"
+
+    # no MSRP in the markup and non-throttle failures go to the browser path
+    assert fallback == [1, 4]
+    assert rows[1] is None and rows[4] is None
+
+    # 429/5xx are retried, then finish here as errors, like the browser path reports them
+    assert rows[2]["msrp_raw"] == "ERROR: HTTP 503" and rows[2]["msrp"] is None
+    assert rows[3]["msrp_raw"] == "ERROR: HTTP 429" and rows[3]["msrp"] is None
+    assert _Handler.hits["/Product/busy"] == _Handler.hits["/Product/throttled"] == 2
+    assert _Handler.hits["/Product/gone"] == 1
+
+    assert sorted(finished) == [0, 2, 3]
+    assert all(c == ".AspNet.ApplicationCookie=abc" for c in _Handler.cookies)
+
+def test_fetch_http_retries_503_then_succeeds(server, state_file):
+    _Handler.flaky["/Product/priced"] = 1
+    products = [{"brand": "Hanwha", "url": f"{server}/Product/priced"}]
+    finished = []
+
+    rows, fallback = asyncio.run(fetch_mspp_http(products, state_file=state_file, retries=2,
+                                                 on_result=lambda i, rec: finished.append((i, rec["msrp"]))))
+
+    assert rows[0]["msrp"] == "1234.50" and fallback == []
+    assert _Handler.hits["/Product/priced"] == 2
+    assert finished == [(0, "1234.50")]  # reported once, after the retry
+
+def test_fetch_http_pool_grows_past_start(server, state_file):
+    products = [{"brand": "Hanwha", "url": f"{server}/Product/slow"} for _ in range(30)]
+    rows, _ = asyncio.run(fetch_mspp_http(products, concurrency=1, max_concurrency=4, state_file=state_file))
+    assert all(r["msrp"] == "1234.50" for r in rows)
+    assert 1 < _Handler.peak <= 4
+
+def test_fetch_http_reloads_cookies_after_a_session_refresh(server, state_file):
+    products = [{"brand": "Hanwha", "url": f"{server}/Product/priced"} for _ in range(3)]
+
+    def refreshed(i, rec):
+        if i == 0:  # what auth.refresh_session does mid-run: a new storage_state.json
+            with open(state_file, encoding="utf-8") as f:
+                state = json.load(f)
+            state["cookies"][0]["value"] = "fresh"
+            with open(state_file, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            st = os.stat(state_file)
+            os.utime(state_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+    asyncio.run(fetch_mspp_http(products, concurrency=1, max_concurrency=1, state_file=state_file,
+                                on_result=refreshed))
+    assert _Handler.cookies == [".AspNet.ApplicationCookie=abc"] + [".AspNet.ApplicationCookie=fresh"] * 2
+
+def test_fetch_http_only_missing_skips_priced_rows(server, state_file):
+    products = [
+        {"brand": "Hanwha", "url": f"{server}/Product/busy", "msrp": "99.00"},
+        {"brand": "Hanwha", "url": f"{server}/Product/priced", "msrp": ""},
+    ]
+    rows, fallback = asyncio.run(fetch_mspp_http(products, only_missing=True, state_file=state_file))
+    assert rows[0] is products[0]
+    assert rows[1]["msrp"] == "1234.50"
+    assert fallback == []
+    assert len(_Handler.cookies) == 1
+# ---------- EOF ----------
@@ -0,0 +1,30 @@
+﻿# tests/test_inputs.py — --from-file: the first load and sidecar loads return the same rows
+
+import pandas as pd
+import pytest
+
+import inputs
+
+@pytest.fixture
+def workbook(tmp_path, monkeypatch):
+    monkeypatch.setattr(inputs, "SIDECAR_DIR", tmp_path / "sidecars")
+    path = tmp_path / "catalog.xlsx"
+    pd.DataFrame({
+        "url": ["https://x/p/1", "https://x/p/2", "https://x/p/3"],
+        "model": ["XNO-6080R", "QNV-8080R", None],
+        "megapixels": [2.0, "8MP", None],            # mixed: number next to text
+        "vandal": [True, False, None],
+        "msrp": [499.0, None, 1234.5],
+        "notes": ["not read", "not read", "not read"],
+    }).to_excel(path, index=False)
+    return path
+
+def test_first_and_cached_loads_match(workbook, capsys):
+    first, priced1 = inputs.load_products(str(workbook), only_missing=True)
+    assert "Using cached columns" not in capsys.readouterr().out
+    cached, priced2 = inputs.load_products(str(workbook), only_missing=True)
+    assert "Using cached columns" in capsys.readouterr().out
+    assert first == cached
+    assert priced1 == priced2 == [0, 2]
+    assert [r["megapixels"] for r in first] == ["2", "8MP", None]  # Excel keeps 2.0 as 2
+    assert "notes" not in first[0]
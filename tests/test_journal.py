@@ -0,0 +1,71 @@
+﻿# tests/test_journal.py — run journal: torn-line replay, last row wins, resume redoes failed rows
+
+import json
+
+import pytest
+
+import journal
+from journal import RunJournal
+
+PRODUCTS = [{"url": f"https://x/p/{k}"} for k in range(5)]
+
+def _row(k: int, raw: str) -> dict:
+    return {"url": f"https://x/p/{k}", "msrp_raw": raw, "msrp": None if raw.startswith(("ERROR", "TIMEOUT")) else "1.00"}
+
+@pytest.fixture(autouse=True)
+def runs_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(journal, "RUNS_DIR", tmp_path / "runs")
+    return tmp_path / "runs"
+
+def _crashed_run() -> RunJournal:
+    j = RunJournal("run1")
+    j.start(PRODUCTS, meta={"brand": "Hanwha"})
+    j.append(0, _row(0, "MSRP $1.00"))
+    j.append(1, _row(1, "TIMEOUT"))
+    j.append(2, _row(2, "ERROR: HTTP 503"))
+    j.append(3, _row(3, "ERROR: shard 2 crashed"))
+    j.close()
+    with open(j.dir / "journal.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"i": 4, "url": "https://x/p/4", "rec": {"msr')  # killed mid-write
+    return j
+
+def test_resume_requeues_failed_rows(capsys):
+    _crashed_run()
+    j = RunJournal.resume("run1")
+    assert j.done == {0}
+    idx, todo = j.pending()
+    assert idx == [1, 2, 3, 4] and [p["url"] for p in todo] == [PRODUCTS[i]["url"] for i in idx]
+    assert "3 that ended in TIMEOUT/ERROR will be retried" in capsys.readouterr().out
+    j.close()
+
+def test_torn_line_is_skipped_and_next_record_starts_clean():
+    _crashed_run()
+    j = RunJournal.resume("run1")
+    j.append(4, _row(4, "MSRP $4.00"))
+    j.close()
+    lines = (j.dir / "journal.jsonl").read_text(encoding="utf-8").splitlines()
+    assert json.loads(lines[-1])["i"] == 4
+    assert dict(RunJournal.resume("run1").replay())[4]["msrp_raw"] == "MSRP $4.00"
+
+def test_last_row_per_index_wins():
+    _crashed_run()
+    j = RunJournal.resume("run1")
+    j.append(1, _row(1, "MSRP $1.00"))   # redone and priced
+    j.append(2, _row(2, "ERROR: HTTP 429"))  # failed again
+    j.close()
+    again = RunJournal.resume("run1")
+    rows = dict(again.replay())
+    assert [i for i, _ in again.replay()] == [0, 3, 1, 2]  # journal order of each index's last line
+    assert rows[1]["msrp_raw"] == "MSRP $1.00" and rows[2]["msrp_raw"] == "ERROR: HTTP 429"
+    assert again.done == {0, 1}
+    again.close()
+
+def test_rows_for_another_work_list_are_ignored():
+    j = _crashed_run()
+    (j.dir / "input.jsonl").write_text(json.dumps({"url": "https://x/p/other"}) + "\n", encoding="utf-8")
+    assert list(RunJournal.resume("run1").replay()) == []
+
+def test_resume_unknown_run():
+    with pytest.raises(FileNotFoundError):
+        RunJournal.resume("nope")
+# ---------- EOF ----------
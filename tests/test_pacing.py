@@ -0,0 +1,78 @@
+﻿# tests/test_pacing.py — AIMD rate control: growth while healthy, cuts on pushback, retry backoff
+
+import asyncio
+
+import pytest
+
+from config import RATE
+from pacing import RateController, backoff_s, outcome
+
+CFG = {**RATE, "start_interval_s": 0.0, "cooldown_s": 0.0}
+
+@pytest.mark.parametrize("raw, expected", [
+    ("MSRP $1.00", "ok"),
+    (None, "ok"),                   # loaded, no MSRP on the page: a genuine miss, not a failure
+    ("ERROR: HTTP 429", "throttled"),
+    ("ERROR: HTTP 503", "throttled"),
+    ("ERROR: HTTP 404", "failed"),
+    ("TIMEOUT", "failed"),
+    ("ERROR: shard 2 crashed", "failed"),
+])
+def test_outcome(raw, expected):
+    assert outcome({"msrp_raw": raw}) == expected
+
+def test_backoff_doubles_and_caps():
+    cfg = {**RATE, "retry_base_s": 2.0, "retry_cap_s": 10.0}
+    for attempt, base in [(1, 2.0), (2, 4.0), (3, 8.0), (4, 10.0), (9, 10.0)]:
+        for _ in range(20):
+            assert 0.75 * base <= backoff_s(attempt, cfg) <= 1.25 * base
+
+def _run(rate: RateController, results, latency_s: float = 0.01):
+    async def go():
+        for r in results:
+            await rate.acquire()
+            await rate.release(latency_s, r)
+    asyncio.run(go())
+
+def test_healthy_completions_grow_to_the_ceiling():
+    rate = RateController(start=2, ceiling=5, cfg=CFG)
+    _run(rate, ["ok"] * 3)
+    assert 2 < rate.limit < 5
+    _run(rate, ["ok"] * 50)
+    assert rate.limit == 5 and rate.peak == 5
+
+def test_throttle_halves_and_failure_cuts_a_quarter():
+    cfg = {**CFG, "start_interval_s": 0.1}
+    rate = RateController(start=8, ceiling=8, cfg=cfg)
+    _run(rate, ["throttled"])
+    assert rate.limit == 4 and rate.interval == pytest.approx(0.25)  # doubled, at least 0.25 s
+    _run(rate, ["failed"])
+    assert rate.limit == 3 and rate.interval == pytest.approx(0.375)
+    assert rate.stats["cuts"] == 2 and rate.low == 3
+
+def test_slow_page_counts_as_a_slowdown():
+    rate = RateController(start=4, ceiling=4, cfg=CFG)
+    _run(rate, ["ok"], latency_s=CFG["slow_s"] + 1)
+    assert rate.limit == 3 and rate.stats["slow"] == 1
+
+def test_cooldown_limits_cuts_to_one_per_burst():
+    rate = RateController(start=8, ceiling=8, cfg={**CFG, "cooldown_s": 60.0})
+    _run(rate, ["throttled"] * 4)
+    assert rate.limit == 4 and rate.stats["cuts"] == 1 and rate.stats["throttled"] == 4
+
+def test_limit_bounds_pages_in_flight():
+    rate = RateController(start=2, ceiling=2, cfg=CFG)
+    peak = 0
+
+    async def visit():
+        nonlocal peak
+        await rate.acquire()
+        peak = max(peak, rate.active)
+        await asyncio.sleep(0.01)
+        await rate.release(0.01, "ok")
+
+    async def go():
+        await asyncio.gather(*(visit() for _ in range(8)))
+    asyncio.run(go())
+    assert peak == 2 and rate.active == 0
+# ---------- EOF ----------
@@ -0,0 +1,78 @@
+﻿# tests/test_validate_state.py — browserless session check: only a confirmed session skips the browser
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import auth
+from config import SESSION
+
+class _Handler(BaseHTTPRequestHandler):
+    status = 200
+    body = b""
+
+    def do_GET(self):
+        self.send_response(_Handler.status)
+        self.send_header("Content-Length", str(len(_Handler.body)))
+        self.end_headers()
+        self.wfile.write(_Handler.body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def cfg(tmp_path, monkeypatch):
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    state = tmp_path / "storage_state.json"
+    state.write_text(json.dumps({"cookies": [
+        {"name": ".AspNet.ApplicationCookie", "value": "abc", "domain": "127.0.0.1", "path": "/",
+         "expires": -1, "secure": False},
+    ]}), encoding="utf-8")
+    monkeypatch.setattr(auth, "STATE_FILE", str(state))
+    monkeypatch.setattr(auth, "CHECK_FILE", tmp_path / "session_check.json")
+    yield {**SESSION, "probe_url": f"http://127.0.0.1:{httpd.server_address[1]}/api/session"}
+    httpd.shutdown()
+    httpd.server_close()
+
+def _answer(status: int, body: bytes):
+    _Handler.status, _Handler.body = status, body
+
+@pytest.mark.parametrize("status, body, expected", [
+    (200, b'{"isAuthenticated": true}', True),
+    (200, b'{"isAuthenticated": false}', False),
+    (401, b"", False),
+    (403, b"", False),
+])
+def test_definite_answers(cfg, status, body, expected):
+    _answer(status, body)
+    assert auth.validate_state(cfg) is expected
+    assert auth.CHECK_FILE.exists() is expected  # only a passing API check is remembered
+
+@pytest.mark.parametrize("status, body", [
+    (200, b"<html>sign in</html>"),        # not JSON
+    (200, b'{"user": null}'),              # no probe_key
+    (200, b"[]"),
+    (404, b""),
+    (500, b'{"isAuthenticated": false}'),
+])
+def test_unknown_answers_are_not_verified(cfg, status, body, capsys):
+    _answer(status, body)
+    assert auth.validate_state(cfg) is False  # ensure_login then checks the HOME page
+    assert "not verified" in capsys.readouterr().out
+    assert not auth.CHECK_FILE.exists()
+
+def test_unreachable_probe_is_not_verified(cfg):
+    assert auth.validate_state({**cfg, "probe_url": "http://127.0.0.1:1/api/session"}) is False
+
+def test_remembered_check_skips_the_probe(cfg, capsys):
+    _answer(200, b"<html>sign in</html>")
+    auth.remember_check()  # e.g. the browser's HOME check passed on the last run
+    assert auth.validate_state(cfg) is True
+    assert "remembered check" in capsys.readouterr().out
+
+def test_missing_auth_cookie_is_invalid(cfg):
+    _answer(200, b'{"isAuthenticated": true}')
+    assert auth.validate_state({**cfg, "auth_cookies": ["NoSuchCookie"]}) is False
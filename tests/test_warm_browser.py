@@ -0,0 +1,85 @@
+﻿# tests/test_warm_browser.py — auth._connect_warm: a warm CDP context is checked (and re-seeded) before use
+
+import asyncio
+
+import pytest
+
+import auth
+import browser_server
+
+class _Page:
+    async def goto(self, url, **kw):
+        pass
+
+    async def close(self):
+        pass
+
+class _Ctx:
+    async def new_page(self):
+        return _Page()
+
+class _Browser:
+    def __init__(self):
+        self.contexts = [_Ctx()]
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+class _Chromium:
+    def __init__(self):
+        self.browser = _Browser()
+
+    async def connect_over_cdp(self, url):
+        return self.browser
+
+class _Playwright:
+    def __init__(self):
+        self.chromium = _Chromium()
+
+@pytest.fixture
+def warm(monkeypatch):
+    """logged_in / seeds: what the HOME check and the re-seed report; seeded counts re-seeds."""
+    state = {"logged_in": True, "seeds": True, "seeded": 0}
+
+    async def is_logged_in(page):
+        return state["logged_in"]
+
+    async def seed(ctx):
+        state["seeded"] += 1
+        if isinstance(state["seeds"], Exception):
+            raise state["seeds"]
+        return state["seeds"]
+
+    async def no_banners(page):
+        pass
+
+    monkeypatch.setattr(browser_server, "endpoint", lambda: "http://127.0.0.1:9333")
+    monkeypatch.setattr(browser_server, "_seed_context", seed)
+    monkeypatch.setattr(auth, "_is_logged_in", is_logged_in)
+    monkeypatch.setattr(auth, "_kill_banners", no_banners)
+    monkeypatch.setattr(auth.netpolicy, "tag", lambda page, kind: None)
+    return state
+
+def _connect():
+    p = _Playwright()
+    return p, asyncio.run(auth._connect_warm(p, net_policy=False))
+
+def test_logged_in_warm_context_is_used(warm):
+    p, ctx = _connect()
+    assert ctx is p.chromium.browser.contexts[0]
+    assert warm["seeded"] == 0
+
+def test_stale_warm_context_is_reseeded(warm):
+    warm["logged_in"] = False
+    p, ctx = _connect()
+    assert ctx is p.chromium.browser.contexts[0]
+    assert warm["seeded"] == 1
+
+@pytest.mark.parametrize("seeds", [False, RuntimeError("login form changed")])
+def test_unrecoverable_warm_context_is_dropped(warm, seeds):
+    warm["logged_in"], warm["seeds"] = False, seeds
+    p, ctx = _connect()
+    assert ctx is None  # ensure_login launches its own browser instead
+    assert p.chromium.browser.closed
+# ---------- EOF ----------